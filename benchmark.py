@@ -0,0 +1,915 @@
+"""benchmark.py - CLI đo hiệu năng inference của plms
+────────────────────────────────────────────────────
+Các benchmark chạy trên dữ liệu mẫu `data/examples` và in kết quả dạng JSON.
+
+Cách chạy:
+    python benchmark.py length_bucketing \
+        --model='shnl/vit5-vinewsqa-qg-ae' \
+        --n_contexts=50 \
+        --batch_size=16
+    python benchmark.py generation_cache --n_contexts=20
+    python benchmark.py pipelined_qag --n_contexts=64 --batch_size=8
+    python benchmark.py quantization
+    python benchmark.py onnx_backend
+    python benchmark.py cpu_pool_scaling --max_workers=4 --repeat=8
+    python benchmark.py device_sharding --repeat=8
+    python benchmark.py assisted_decoding --draft_model='<vit5-small fine-tune cùng tác vụ>'
+    python benchmark.py constrained_ae
+    python benchmark.py extractive_ae --model_ae='./cp_span/epoch_10'
+    python benchmark.py context_window --windows='[64,128,256,None]'
+    python benchmark.py cold_start
+    python benchmark.py compiled_mode --n_examples=16
+    python benchmark.py packed_dataset --batch_size=16
+    python benchmark.py tokenization_pool --n_splits=3 --n_workers=4
+    python benchmark.py adaptive_decoding --thresholds='[-0.2,-0.5,-1.0]'
+    python benchmark.py model_registry --model_ae='<model AE riêng>'
+    python benchmark.py profile_qag --n_contexts=16 --trace_file=profile_qag.trace.json
+"""
+
+import sys
+import json
+import time
+import subprocess
+import fire
+from itertools import chain
+from multiprocessing import Pool
+from plms.language_model import TransformersQG, Dataset, PackedDataset, PackedCollator, EncodePlus
+from plms.tokenization_pool import TokenizationPool
+from plms.adaptive_decoding import AdaptiveDecodingStats
+from plms.model_registry import ModelRegistry
+from plms.profiling import Profiler
+
+EXAMPLE_PATH = 'data/examples/test.jsonl'
+DEFAULT_BENCHMARK_MODEL = 'shnl/vit5-vinewsqa-qg-ae'
+
+
+def load_examples(path: str = EXAMPLE_PATH, n: int = None):
+    """Đọc file JSONL mẫu (mỗi dòng có `context`, `question`, `answer`).
+
+    Args:
+        path: Đường dẫn file JSONL
+        n: Số dòng tối đa cần lấy (None -> lấy hết)
+
+    Returns:
+        List các dict
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return rows if n is None else rows[:n]
+
+
+def load_contexts(path: str = EXAMPLE_PATH, n: int = None):
+    """Lấy danh sách context không trùng lặp (giữ nguyên thứ tự xuất hiện)."""
+    contexts = list(dict.fromkeys(i['context'] for i in load_examples(path)))
+    return contexts if n is None else contexts[:n]
+
+
+def timed(fn, *args, **kwargs):
+    """Gọi hàm và trả về (kết quả, số giây đã chạy)."""
+    start = time.perf_counter()
+    output = fn(*args, **kwargs)
+    return output, time.perf_counter() - start
+
+
+def rouge_l(prediction: str, reference: str):
+    """ROUGE-L F1 trên token tách theo khoảng trắng (giữ nguyên dấu tiếng Việt)."""
+    p, r = prediction.lower().split(), reference.lower().split()
+    if len(p) == 0 or len(r) == 0:
+        return 0.0
+    lcs = [[0] * (len(r) + 1) for _ in range(len(p) + 1)]
+    for i in range(len(p)):
+        for j in range(len(r)):
+            lcs[i + 1][j + 1] = lcs[i][j] + 1 if p[i] == r[j] else max(lcs[i][j + 1], lcs[i + 1][j])
+    precision, recall = lcs[-1][-1] / len(p), lcs[-1][-1] / len(r)
+    return 0.0 if lcs[-1][-1] == 0 else 2 * precision * recall / (precision + recall)
+
+
+def text_metrics(predictions: list, references: list):
+    """BLEU-4 (corpus) và ROUGE-L trung bình, tính trên token tách theo khoảng trắng."""
+    from nltk.translate.bleu_score import corpus_bleu, SmoothingFunction
+    bleu = corpus_bleu([[r.lower().split()] for r in references], [p.lower().split() for p in predictions],
+                       smoothing_function=SmoothingFunction().method1)
+    rouge = sum(rouge_l(p, r) for p, r in zip(predictions, references)) / max(len(predictions), 1)
+    return {'BLEU4': bleu * 100, 'ROUGE_L': rouge * 100}
+
+
+def report(result: dict, export_file: str = None):
+    """In kết quả benchmark và lưu ra file JSON nếu cần."""
+    print(json.dumps(result, indent=4, ensure_ascii=False))
+    if export_file is not None:
+        with open(export_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=4, ensure_ascii=False)
+
+
+class Benchmark:
+    """Tập hợp các benchmark hiệu năng, mỗi method là 1 lệnh CLI."""
+
+    def length_bucketing(self,
+                         model: str = DEFAULT_BENCHMARK_MODEL,
+                         n_contexts: int = 50,
+                         batch_size: int = 16,
+                         num_beams: int = 4,
+                         data_path: str = EXAMPLE_PATH,
+                         export_file: str = None):
+        """So sánh `generate_a` khi giữ thứ tự input và khi sắp xếp theo độ dài (cả 2 đều pad tới input dài nhất
+        của batch); số token khi pad cố định về max_length được tính kèm để tham chiếu.
+
+        Args:
+            model: Model multitask (QG + AE)
+            n_contexts: Số context dùng để benchmark
+            batch_size: Batch size khi generate
+            num_beams: Số beam search
+            data_path: File JSONL dữ liệu mẫu
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        contexts = load_contexts(data_path, n_contexts)
+        qg = TransformersQG(model, skip_overflow_error=True, drop_answer_error_text=True)
+
+        # Số token encoder phải xử lý (kể cả padding), tính giống hệt cách generate_a tạo input
+        list_sentences = qg.spacy_module.sentences(contexts)
+        flat_inputs = list(chain(*[[c] * len(s) for c, s in zip(contexts, list_sentences)]))
+        encodes = qg.text_to_encode(flat_inputs, highlights=list(chain(*list_sentences)),
+                                    prefix_type='ae' if qg.add_prefix else None, padding=False)
+        unsorted = [len(e['input_ids']) for e in encodes]
+        lengths = sorted(unsorted)
+        padded_tokens = {
+            'max_length': len(lengths) * qg.max_length,
+            'unsorted': sum(max(unsorted[i:i + batch_size]) * len(unsorted[i:i + batch_size])
+                            for i in range(0, len(unsorted), batch_size)),
+            'bucketed': sum(max(lengths[i:i + batch_size]) * len(lengths[i:i + batch_size])
+                            for i in range(0, len(lengths), batch_size))
+        }
+
+        predictions, elapsed = {}, {}
+        for mode, bucketing in [('unsorted', False), ('bucketed', True)]:
+            qg.length_bucketing = bucketing
+            predictions[mode], elapsed[mode] = timed(
+                qg.generate_a, contexts, batch_size=batch_size, num_beams=num_beams)
+
+        same = sum(a == b for a, b in zip(predictions['unsorted'], predictions['bucketed']))
+        report({
+            'n_contexts': len(contexts),
+            'n_inputs': len(lengths),
+            'mean_input_tokens': sum(lengths) / max(len(lengths), 1),
+            'encoder_tokens': padded_tokens,
+            'encoder_token_reduction': padded_tokens['unsorted'] / max(padded_tokens['bucketed'], 1),
+            'seconds': elapsed,
+            'speedup': elapsed['unsorted'] / max(elapsed['bucketed'], 1e-9),
+            'identical_outputs': f'{same}/{len(contexts)}'
+        }, export_file)
+
+    def generation_cache(self,
+                         model: str = DEFAULT_BENCHMARK_MODEL,
+                         n_contexts: int = 20,
+                         batch_size: int = 16,
+                         num_beams: int = 4,
+                         cache_file: str = 'benchmark_generation_cache.sqlite',
+                         data_path: str = EXAMPLE_PATH,
+                         export_file: str = None):
+        """Chạy `generate_qa` 2 lần trên cùng dữ liệu: lần đầu cache rỗng, lần sau đọc lại từ cache.
+
+        Args:
+            model: Model multitask (QG + AE)
+            n_contexts: Số context dùng để benchmark
+            batch_size: Batch size khi generate
+            num_beams: Số beam search
+            cache_file: File SQLite của cache (bị xóa trước khi chạy)
+            data_path: File JSONL dữ liệu mẫu
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        contexts = load_contexts(data_path, n_contexts)
+        qg = TransformersQG(model, skip_overflow_error=True, drop_answer_error_text=True,
+                            generation_cache=cache_file)
+        qg.generation_cache.clear()
+
+        # Thêm bản sao của vài context để đo phần gộp input trùng lặp trong 1 lần gọi
+        contexts = contexts + contexts[:max(len(contexts) // 4, 1)]
+        cold, cold_time = timed(qg.generate_qa, contexts, batch_size=batch_size, num_beams=num_beams)
+        cold_stats = qg.generation_cache.stats()
+        warm, warm_time = timed(qg.generate_qa, contexts, batch_size=batch_size, num_beams=num_beams)
+        report({
+            'n_contexts': len(contexts),
+            'seconds': {'cold': cold_time, 'warm': warm_time},
+            'speedup': cold_time / max(warm_time, 1e-9),
+            'cold_cache': cold_stats,
+            'warm_cache': qg.generation_cache.stats(),
+            'identical_outputs': cold == warm
+        }, export_file)
+
+    def pipelined_qag(self,
+                      model: str = DEFAULT_BENCHMARK_MODEL,
+                      n_contexts: int = 64,
+                      batch_size: int = 8,
+                      num_beams: int = 4,
+                      data_path: str = EXAMPLE_PATH,
+                      export_file: str = None):
+        """So sánh `generate_qa` chạy tuần tự (AE hết rồi mới QG) và chạy gối đầu AE -> QG.
+
+        Args:
+            model: Model multitask (QG + AE)
+            n_contexts: Số context dùng để benchmark
+            batch_size: Batch size khi generate (cũng là số context mỗi chunk của pipeline)
+            num_beams: Số beam search
+            data_path: File JSONL dữ liệu mẫu
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        contexts = load_contexts(data_path, n_contexts)
+        qg = TransformersQG(model, skip_overflow_error=True, drop_answer_error_text=True)
+        sequential, sequential_time = timed(qg.generate_qa, contexts, batch_size=batch_size, num_beams=num_beams)
+        pipelined, pipelined_time = timed(qg.generate_qa, contexts, batch_size=batch_size, num_beams=num_beams,
+                                          pipelined=True)
+        report({
+            'n_contexts': len(contexts),
+            'seconds': {'sequential': sequential_time, 'pipelined': pipelined_time},
+            'speedup': sequential_time / max(pipelined_time, 1e-9),
+            'pipeline': qg.pipeline_stats,
+            'identical_outputs': sequential == pipelined
+        }, export_file)
+
+    def quantization(self,
+                     model: str = DEFAULT_BENCHMARK_MODEL,
+                     batch_size: int = 4,
+                     num_beams: int = 4,
+                     data_path: str = EXAMPLE_PATH,
+                     export_file: str = None):
+        """So sánh inference fp32 và int8 (quantize động) trên CPU: thời gian nạp, latency, dung lượng
+        weight và độ lệch BLEU/ROUGE (so với câu hỏi tham chiếu và so với output fp32).
+
+        Args:
+            model: Model QG
+            batch_size: Batch size khi generate
+            num_beams: Số beam search
+            data_path: File JSONL dữ liệu mẫu (context, answer, question)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        import torch
+        from plms.quantization import model_size
+        examples = load_examples(data_path)
+        contexts = [i['context'] for i in examples]
+        answers = [i['answer'] for i in examples]
+        references = [i['question'] for i in examples]
+
+        result, predictions = {'n_examples': len(examples), 'torch_threads': torch.get_num_threads()}, {}
+        for mode, quantize in [('fp32', False), ('int8', True)]:
+            # Lần nạp đầu của int8 có quantize + ghi cache, lần nạp thứ 2 đọc thẳng từ cache
+            qg, load_time = timed(TransformersQG, model, skip_overflow_error=True, quantize=quantize)
+            if quantize:
+                qg, reload_time = timed(TransformersQG, model, skip_overflow_error=True, quantize=quantize)
+                result.setdefault('cached_load_seconds', {})[mode] = reload_time
+            qg.model.to('cpu')
+            qg.device = 'cpu'
+            predictions[mode], latency = timed(qg.generate_q, contexts, list_answer=answers,
+                                               batch_size=batch_size, num_beams=num_beams)
+            result.setdefault('load_seconds', {})[mode] = load_time
+            result.setdefault('seconds', {})[mode] = latency
+            result.setdefault('weight_mb', {})[mode] = model_size(qg.model) / 2 ** 20
+            result.setdefault('vs_reference', {})[mode] = text_metrics(predictions[mode], references)
+
+        result['speedup'] = result['seconds']['fp32'] / max(result['seconds']['int8'], 1e-9)
+        result['int8_vs_fp32'] = text_metrics(predictions['int8'], predictions['fp32'])
+        result['identical_outputs'] = f"{sum(a == b for a, b in zip(predictions['fp32'], predictions['int8']))}" \
+                                      f"/{len(examples)}"
+        report(result, export_file)
+
+    def onnx_backend(self,
+                     model: str = DEFAULT_BENCHMARK_MODEL,
+                     batch_size: int = 4,
+                     num_beams: int = 4,
+                     data_path: str = EXAMPLE_PATH,
+                     export_file: str = None):
+        """So sánh backend PyTorch và ONNX Runtime trên CPU: latency, thông lượng (input/giây) với greedy
+        và beam search, và kiểm tra output greedy trùng khớp từng token.
+
+        Args:
+            model: Model QG
+            batch_size: Batch size khi generate
+            num_beams: Số beam search cho lượt đo beam search
+            data_path: File JSONL dữ liệu mẫu (context, answer)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        examples = load_examples(data_path)
+        contexts = [i['context'] for i in examples]
+        answers = [i['answer'] for i in examples]
+
+        result, predictions = {'n_examples': len(examples)}, {}
+        for backend in ['torch', 'onnx']:
+            # Lần khởi tạo thứ 2 của onnx dùng lại graph đã export
+            qg, load_time = timed(TransformersQG, model, skip_overflow_error=True, backend=backend)
+            if backend == 'onnx':
+                qg, reload_time = timed(TransformersQG, model, skip_overflow_error=True, backend=backend)
+                result['cached_load_seconds'] = reload_time
+            qg.model.to('cpu')
+            qg.device = 'cpu'
+            result.setdefault('load_seconds', {})[backend] = load_time
+            for name, beams in [('greedy', 1), ('beam', num_beams)]:
+                predictions[(backend, name)], latency = timed(
+                    qg.generate_q, contexts, list_answer=answers, batch_size=batch_size, num_beams=beams)
+                result.setdefault(f'{name}_seconds', {})[backend] = latency
+                result.setdefault(f'{name}_inputs_per_second', {})[backend] = len(examples) / max(latency, 1e-9)
+
+        for name in ['greedy', 'beam']:
+            same = sum(a == b for a, b in zip(predictions[('torch', name)], predictions[('onnx', name)]))
+            result[f'{name}_identical_outputs'] = f'{same}/{len(examples)}'
+            result[f'{name}_speedup'] = result[f'{name}_seconds']['torch'] / max(result[f'{name}_seconds']['onnx'], 1e-9)
+        report(result, export_file)
+
+
+    def cpu_pool_scaling(self,
+                         model: str = DEFAULT_BENCHMARK_MODEL,
+                         max_workers: int = 4,
+                         threads_per_worker: int = None,
+                         batch_size: int = 4,
+                         num_beams: int = 4,
+                         repeat: int = 8,
+                         data_path: str = EXAMPLE_PATH,
+                         export_file: str = None):
+        """Đo khả năng mở rộng của pool process inference trên CPU với 1..max_workers worker
+        (so với chạy trong 1 process với số thread mặc định của torch).
+
+        Args:
+            model: Model QG
+            max_workers: Số worker tối đa
+            threads_per_worker: Số thread torch mỗi worker (None -> chia đều số core cho các worker)
+            batch_size: Batch size khi generate (mỗi batch chạy trên 1 worker)
+            num_beams: Số beam search
+            repeat: Số lần lặp lại dữ liệu mẫu để mỗi worker có đủ batch
+            data_path: File JSONL dữ liệu mẫu (context, answer)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        import os
+        import torch
+        from plms.parallel_inference import CPUInferencePool
+        examples = load_examples(data_path) * repeat
+        contexts = [i['context'] for i in examples]
+        answers = [i['answer'] for i in examples]
+
+        qg = TransformersQG(model, skip_overflow_error=True)
+        qg.model.to('cpu')
+        qg.device = 'cpu'
+        baseline, baseline_time = timed(qg.generate_q, contexts, list_answer=answers,
+                                        batch_size=batch_size, num_beams=num_beams)
+        result = {'n_inputs': len(examples), 'cpu_count': os.cpu_count(),
+                  'single_process': {'torch_threads': torch.get_num_threads(), 'seconds': baseline_time,
+                                     'inputs_per_second': len(examples) / max(baseline_time, 1e-9)},
+                  'workers': {}}
+        for n_workers in range(1, max_workers + 1):
+            qg.inference_pool = CPUInferencePool({'model': qg.model}, n_workers, threads_per_worker)
+            try:
+                # Lượt chạy đầu để các worker khởi động xong, không tính vào thời gian
+                qg.generate_q(contexts[:n_workers], list_answer=answers[:n_workers], batch_size=1, num_beams=num_beams)
+                predictions, latency = timed(qg.generate_q, contexts, list_answer=answers,
+                                             batch_size=batch_size, num_beams=num_beams)
+            finally:
+                qg.inference_pool.close()
+            result['workers'][n_workers] = {
+                'threads_per_worker': qg.inference_pool.threads_per_worker,
+                'seconds': latency,
+                'inputs_per_second': len(examples) / max(latency, 1e-9),
+                'identical_outputs': f'{sum(a == b for a, b in zip(baseline, predictions))}/{len(examples)}'
+            }
+        qg.inference_pool = None
+
+        one_worker = result['workers'][1]['seconds']
+        for n_workers, stats in result['workers'].items():
+            stats['speedup_vs_1_worker'] = one_worker / max(stats['seconds'], 1e-9)
+            stats['scaling_efficiency'] = stats['speedup_vs_1_worker'] / n_workers
+            stats['speedup_vs_single_process'] = baseline_time / max(stats['seconds'], 1e-9)
+        report(result, export_file)
+
+    def device_sharding(self,
+                        model: str = DEFAULT_BENCHMARK_MODEL,
+                        batch_size: int = 4,
+                        num_beams: int = 4,
+                        repeat: int = 8,
+                        cpu_workers: int = 2,
+                        data_path: str = EXAMPLE_PATH,
+                        export_file: str = None):
+        """So sánh generate trên 1 device và chia batch cho mọi GPU (mỗi GPU 1 bản model).
+        Máy không có GPU thì lượt chia batch chạy trên `cpu_workers` process CPU.
+
+        Args:
+            model: Model QG
+            batch_size: Batch size khi generate (mỗi batch chạy trên 1 device)
+            num_beams: Số beam search
+            repeat: Số lần lặp lại dữ liệu mẫu để mỗi device có đủ batch
+            cpu_workers: Số process worker khi không có GPU
+            data_path: File JSONL dữ liệu mẫu (context, answer)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        from plms.parallel_inference import DeviceShardedExecutor
+        examples = load_examples(data_path) * repeat
+        contexts = [i['context'] for i in examples]
+        answers = [i['answer'] for i in examples]
+
+        qg = TransformersQG(model, skip_overflow_error=True)
+        sharded_executor = qg.inference_pool or DeviceShardedExecutor(
+            {'model': qg.model}, devices=None if qg.device == 'cuda' else [], cpu_workers=cpu_workers)
+        qg.inference_pool = None
+        single, single_time = timed(qg.generate_q, contexts, list_answer=answers,
+                                    batch_size=batch_size, num_beams=num_beams)
+        qg.inference_pool = sharded_executor
+        try:
+            # Lượt chạy đầu để tạo bản copy trên các device / khởi động worker, không tính vào thời gian
+            qg.generate_q(contexts[:sharded_executor.n_workers], list_answer=answers[:sharded_executor.n_workers],
+                          batch_size=1, num_beams=num_beams)
+            sharded, sharded_time = timed(qg.generate_q, contexts, list_answer=answers,
+                                          batch_size=batch_size, num_beams=num_beams)
+        finally:
+            sharded_executor.close()
+        report({
+            'n_inputs': len(examples),
+            'devices': [str(d) for d in sharded_executor.devices] or f'cpu x {sharded_executor.n_workers} processes',
+            'seconds': {'single_device': single_time, 'sharded': sharded_time},
+            'inputs_per_second': {'single_device': len(examples) / max(single_time, 1e-9),
+                                  'sharded': len(examples) / max(sharded_time, 1e-9)},
+            'speedup': single_time / max(sharded_time, 1e-9),
+            'identical_outputs': f'{sum(a == b for a, b in zip(single, sharded))}/{len(examples)}'
+        }, export_file)
+
+    def assisted_decoding(self,
+                          draft_model: str,
+                          model: str = DEFAULT_BENCHMARK_MODEL,
+                          batch_size: int = 4,
+                          num_beams: int = 4,
+                          data_path: str = EXAMPLE_PATH,
+                          export_file: str = None):
+        """So sánh greedy có / không có model draft (assisted decoding): tốc độ, tỉ lệ chấp nhận token draft,
+        và kiểm tra output greedy giống hệt nhau. Beam search (num_beams) được đo kèm để tham chiếu.
+
+        Args:
+            draft_model: Model draft nhỏ cùng tokenizer với `model`
+            model: Model QG
+            batch_size: Batch size khi generate
+            num_beams: Số beam search cho lượt tham chiếu
+            data_path: File JSONL dữ liệu mẫu (context, answer, question)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        examples = load_examples(data_path)
+        contexts = [i['context'] for i in examples]
+        answers = [i['answer'] for i in examples]
+        references = [i['question'] for i in examples]
+
+        qg = TransformersQG(model, model_draft=draft_model, skip_overflow_error=True)
+        draft = qg.model_draft
+        predictions, seconds = {}, {}
+        qg.model_draft = None
+        predictions['beam'], seconds['beam'] = timed(
+            qg.generate_q, contexts, list_answer=answers, batch_size=batch_size, num_beams=num_beams)
+        predictions['greedy'], seconds['greedy'] = timed(
+            qg.generate_q, contexts, list_answer=answers, batch_size=batch_size, num_beams=1)
+        qg.model_draft = draft
+        predictions['assisted'], seconds['assisted'] = timed(
+            qg.generate_q, contexts, list_answer=answers, batch_size=batch_size, num_beams=1)
+
+        same = sum(a == b for a, b in zip(predictions['greedy'], predictions['assisted']))
+        report({
+            'n_examples': len(examples),
+            'seconds': seconds,
+            'speedup_vs_greedy': seconds['greedy'] / max(seconds['assisted'], 1e-9),
+            'speedup_vs_beam': seconds['beam'] / max(seconds['assisted'], 1e-9),
+            'assisted': qg.assisted_stats.as_dict(),
+            'vs_reference': {k: text_metrics(v, references) for k, v in predictions.items()},
+            'greedy_identical_outputs': f'{same}/{len(examples)}',
+            'greedy_identical': same == len(examples)
+        }, export_file)
+
+    def constrained_ae(self,
+                       model: str = DEFAULT_BENCHMARK_MODEL,
+                       batch_size: int = 8,
+                       num_beams: int = 4,
+                       data_path: str = EXAMPLE_PATH,
+                       export_file: str = None):
+        """So sánh Answer Extraction sinh tự do và ràng buộc theo span của context: số lượt generate (1 lượt / câu),
+        số answer dùng được (nằm trong context) và thời gian.
+
+        Args:
+            model: Model multitask (QG + AE)
+            batch_size: Batch size khi generate
+            num_beams: Số beam search
+            data_path: File JSONL dữ liệu mẫu
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        contexts = load_contexts(data_path)
+        qg = TransformersQG(model, skip_overflow_error=True, drop_answer_error_text=True)
+        n_generations = sum(len(s) for s in qg.spacy_module.sentences(contexts))
+        result = {'n_contexts': len(contexts), 'n_generations': n_generations}
+        for name, constrained in [('free', False), ('constrained', True)]:
+            qg.constrained_ae = constrained
+            answers, latency = timed(qg.generate_a, contexts, batch_size=batch_size, num_beams=num_beams)
+            n_usable = sum(len(a) for a in answers if a is not None)
+            result[name] = {
+                'seconds': latency,
+                'usable_answers': n_usable,
+                'usable_rate': n_usable / max(n_generations, 1),
+                'contexts_without_answer': sum(a is None for a in answers)
+            }
+        report(result, export_file)
+
+    def extractive_ae(self,
+                      model_ae: str,
+                      model: str = DEFAULT_BENCHMARK_MODEL,
+                      batch_size: int = 8,
+                      num_beams: int = 4,
+                      num_questions: int = 10,
+                      data_path: str = EXAMPLE_PATH,
+                      export_file: str = None):
+        """So sánh Answer Extraction generate theo từng câu (multitask) và model span extractive
+        (1 forward mỗi paragraph): thời gian, số answer và tỉ lệ answer tham chiếu được tìm thấy.
+
+        Args:
+            model_ae: Checkpoint SpanAnswerExtractor (train.py --model_type='extractive')
+            model: Model multitask (QG + AE)
+            batch_size: Batch size khi generate / số cửa sổ paragraph mỗi batch
+            num_beams: Số beam search của AE generate
+            num_questions: Số answer tối đa mỗi paragraph của model extractive
+            data_path: File JSONL dữ liệu mẫu (context, answer)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        examples = load_examples(data_path)
+        contexts = load_contexts(data_path)
+        references = {}
+        for i in examples:
+            references.setdefault(i['context'], []).append(i['answer'])
+
+        result = {'n_contexts': len(contexts)}
+        for name, ae in [('generative', None), ('extractive', model_ae)]:
+            qg = TransformersQG(model, model_ae=ae, skip_overflow_error=True, drop_answer_error_text=True)
+            answers, latency = timed(qg.generate_a, contexts, batch_size=batch_size, num_beams=num_beams,
+                                     num_questions=num_questions)
+            answers = [a or [] for a in answers]
+            found = sum(any(r in a or a in r for a in answer) for c, answer in zip(contexts, answers)
+                        for r in references[c])
+            result[name] = {
+                'answer_model_type': qg.answer_model_type,
+                'seconds': latency,
+                'answers': sum(len(a) for a in answers),
+                'reference_recall': found / max(sum(len(r) for r in references.values()), 1)
+            }
+        result['speedup'] = result['generative']['seconds'] / max(result['extractive']['seconds'], 1e-9)
+        report(result, export_file)
+
+    def context_window(self,
+                       windows: list = (64, 128, 256, None),
+                       model: str = DEFAULT_BENCHMARK_MODEL,
+                       batch_size: int = 8,
+                       num_beams: int = 4,
+                       data_path: str = EXAMPLE_PATH,
+                       export_file: str = None):
+        """Chất lượng và tốc độ QG/AE khi chỉ giữ K token context quanh câu/answer được highlight, với từng K.
+
+        QG được so với câu hỏi tham chiếu (BLEU-4, ROUGE-L), AE được đo bằng số answer và tỉ lệ
+        answer tham chiếu được tìm thấy. K = None là toàn bộ context (mốc so sánh).
+
+        Args:
+            windows: Các giá trị K cần đo (None -> không cắt context)
+            model: Model multitask (QG + AE)
+            batch_size: Batch size khi generate
+            num_beams: Số beam search
+            data_path: File JSONL dữ liệu mẫu (context, answer, question)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        examples = load_examples(data_path)
+        contexts = load_contexts(data_path)
+        references = {}
+        for i in examples:
+            references.setdefault(i['context'], []).append(i['answer'])
+        n_references = max(sum(len(r) for r in references.values()), 1)
+
+        qg = TransformersQG(model, skip_overflow_error=True, drop_answer_error_text=True)
+        result = {'n_examples': len(examples), 'n_contexts': len(contexts)}
+        for window in windows:
+            qg.context_window = window
+            questions, latency_qg = timed(qg.generate_q, [i['context'] for i in examples],
+                                          list_answer=[i['answer'] for i in examples],
+                                          batch_size=batch_size, num_beams=num_beams)
+            answers, latency_ae = timed(qg.generate_a, contexts, batch_size=batch_size, num_beams=num_beams)
+            answers = [a or [] for a in answers]
+            found = sum(any(r in a or a in r for a in answer) for c, answer in zip(contexts, answers)
+                        for r in references[c])
+            result[f'K={window}'] = {
+                'qg': dict(seconds=latency_qg, **text_metrics(questions, [i['question'] for i in examples])),
+                'ae': {'seconds': latency_ae, 'answers': sum(len(a) for a in answers),
+                       'reference_recall': found / n_references}
+            }
+        report(result, export_file)
+
+    def cold_start(self,
+                   model: str = DEFAULT_BENCHMARK_MODEL,
+                   n_examples: int = 8,
+                   data_path: str = EXAMPLE_PATH,
+                   export_file: str = None):
+        """Thời gian khởi động: import package (process mới), khởi tạo TransformersQG, generate_q với answer có sẵn
+        (không cần AE/spaCy) rồi generate_a, kèm thành phần đã/chưa được nạp sau từng bước.
+
+        Args:
+            model: Model QG (multitask thì AE dùng chung model, chỉ nạp thêm spaCy)
+            n_examples: Số mẫu dùng cho generate_q / generate_a
+            data_path: File JSONL dữ liệu mẫu (context, answer)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        def import_seconds(statement):
+            code = f'import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)'
+            return float(subprocess.check_output([sys.executable, '-c', code]).decode().strip().split('\n')[-1])
+
+        examples = load_examples(data_path, n_examples)
+        result = {'import_seconds': {
+            'plms': import_seconds('import plms'),
+            'plms.language_model': import_seconds('import plms.language_model')
+        }}
+        qg, result['init_seconds'] = timed(TransformersQG, model, skip_overflow_error=True)
+        result['after_init'] = qg.startup_report()
+        _, result['generate_q_seconds'] = timed(
+            qg.generate_q, [i['context'] for i in examples], list_answer=[i['answer'] for i in examples])
+        result['after_generate_q'] = qg.startup_report()
+        _, result['generate_a_seconds'] = timed(qg.generate_a, list(dict.fromkeys(i['context'] for i in examples)))
+        result['after_generate_a'] = qg.startup_report()
+        report(result, export_file)
+
+    def compiled_mode(self,
+                      model: str = DEFAULT_BENCHMARK_MODEL,
+                      n_examples: int = 16,
+                      num_beams: int = 1,
+                      repeat: int = 3,
+                      data_path: str = EXAMPLE_PATH,
+                      export_file: str = None):
+        """So sánh chế độ eager và compiled (TransformersQG(compiled=True)) khi sinh câu hỏi từng request một:
+        thời gian compile + warm-up, độ trễ mỗi request và mỗi token output ở trạng thái ổn định,
+        và số request cần để bù lại thời gian compile (break-even).
+
+        Args:
+            model: Model QG
+            n_examples: Số request (mỗi request 1 cặp context/answer, batch size 1)
+            num_beams: Số beam search
+            repeat: Số lượt chạy lại toàn bộ request để đo trạng thái ổn định (lấy lượt nhanh nhất)
+            data_path: File JSONL dữ liệu mẫu (context, answer)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        examples = load_examples(data_path, n_examples)
+        result = {'n_requests': len(examples)}
+        outputs = {}
+        for name, compiled in [('eager', False), ('compiled', True)]:
+            qg, init_seconds = timed(TransformersQG, model, compiled=compiled, skip_overflow_error=True,
+                                     compile_num_beams=num_beams, compile_batch_size=1)
+            # Lượt đầu (chưa tính) để loại bỏ thời gian khởi động còn lại
+            qg.generate_q(examples[0]['context'], list_answer=examples[0]['answer'], num_beams=num_beams)
+            latency = []
+            for _ in range(repeat):
+                predictions, seconds = timed(lambda: [
+                    qg.generate_q(i['context'], list_answer=i['answer'], num_beams=num_beams, batch_size=1)
+                    for i in examples])
+                latency.append(seconds)
+            outputs[name] = predictions
+            n_tokens = sum(len(qg.tokenizer.encode(p)) for p in predictions)
+            result[name] = {
+                'init_seconds': init_seconds,
+                'compile_seconds': qg.load_times.get('compile', 0.0),
+                'seconds_per_request': min(latency) / len(examples),
+                'seconds_per_output_token': min(latency) / max(n_tokens, 1)
+            }
+        saving = result['eager']['seconds_per_request'] - result['compiled']['seconds_per_request']
+        result['speedup_per_token'] = result['eager']['seconds_per_output_token'] / max(
+            result['compiled']['seconds_per_output_token'], 1e-9)
+        # Số request cần để phần thời gian tiết kiệm được bằng thời gian compile (None -> không bao giờ bù lại)
+        result['break_even_requests'] = result['compiled']['compile_seconds'] / saving if saving > 0 else None
+        result['identical_outputs'] = f"{sum(a == b for a, b in zip(outputs['eager'], outputs['compiled']))}/" \
+                                      f"{len(examples)}"
+        report(result, export_file)
+
+    def packed_dataset(self,
+                       model: str = DEFAULT_BENCHMARK_MODEL,
+                       batch_size: int = 16,
+                       repeat: int = 5,
+                       data_path: str = EXAMPLE_PATH,
+                       export_file: str = None):
+        """Chi phí phía host khi tạo batch QG (1 epoch qua DataLoader) và số token được pad:
+        feature pad sẵn về max_length (Dataset, to_tensor từng mẫu) và PackedDataset + PackedCollator.
+
+        Args:
+            model: Model QG (chỉ dùng tokenizer)
+            batch_size: Batch size
+            repeat: Số epoch đo (lấy epoch nhanh nhất)
+            data_path: File JSONL dữ liệu mẫu (context, answer, question)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        examples = load_examples(data_path)
+        qg = TransformersQG(model, skip_overflow_error=True)
+        args = ([i['context'] for i in examples], [i['question'] for i in examples])
+        kwargs = dict(highlights=[i['answer'] for i in examples], prefix_type='qg' if qg.add_prefix else None)
+        loaders = {
+            'padded': TransformersQG.get_data_loader(
+                Dataset(qg.text_to_encode(*args, padding=True, **kwargs)), batch_size=batch_size),
+            'packed': TransformersQG.get_data_loader(
+                PackedDataset.pack(qg.text_to_encode(*args, padding=False, **kwargs)), batch_size=batch_size,
+                collate_fn=PackedCollator(qg.tokenizer.pad_token_id))
+        }
+        result = {'n_examples': len(examples)}
+        for name, loader in loaders.items():
+            seconds = min(timed(lambda: [b for b in loader])[1] for _ in range(repeat))
+            batches = list(loader)
+            result[name] = {
+                'seconds_per_epoch': seconds,
+                'input_tokens': sum(b['input_ids'].numel() for b in batches),
+                'label_tokens': sum(b['labels'].numel() for b in batches)
+            }
+        result['host_speedup'] = result['padded']['seconds_per_epoch'] / max(result['packed']['seconds_per_epoch'], 1e-9)
+        result['input_token_reduction'] = result['padded']['input_tokens'] / max(result['packed']['input_tokens'], 1)
+        report(result, export_file)
+
+
+    def tokenization_pool(self,
+                          model: str = DEFAULT_BENCHMARK_MODEL,
+                          n_splits: int = 3,
+                          n_workers: int = 4,
+                          chunk_size: int = 64,
+                          data_path: str = EXAMPLE_PATH,
+                          export_file: str = None):
+        """Thời gian tokenize song song nhiều split liên tiếp (như train với nhiều data_cache_paths):
+        tạo `Pool()` mới cho mỗi split (pickle tokenizer theo từng task, gom toàn bộ kết quả bằng `map`)
+        và TokenizationPool dùng chung (tokenizer nạp 1 lần mỗi worker, kết quả trả về dần bằng `imap`).
+        Kiểm tra feature của cả 2 cách giống hệt bản đơn luồng.
+
+        Args:
+            model: Model QG (chỉ dùng tokenizer)
+            n_splits: Số lần encode liên tiếp
+            n_workers: Số process worker
+            chunk_size: Số mẫu mỗi chunk
+            data_path: File JSONL dữ liệu mẫu (context, answer, question)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        examples = load_examples(data_path)
+        qg = TransformersQG(model, skip_overflow_error=True)
+        data = [(i['context'], i['question'], i['answer']) for i in examples]
+        config = {'max_length': qg.max_length, 'max_length_output': qg.max_length_output,
+                  'prefix_type': 'qg' if qg.add_prefix else None, 'padding': False}
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        reference = list(chain(*map(EncodePlus(tokenizer=qg.tokenizer, **config).encode_batch, chunks)))
+
+        def fresh_pool():
+            outputs = []
+            for _ in range(n_splits):
+                pool = Pool(n_workers)
+                outputs.append(list(chain(*pool.map(EncodePlus(tokenizer=qg.tokenizer, **config).encode_batch, chunks))))
+                pool.close()
+            return outputs
+
+        def persistent_pool():
+            pool = TokenizationPool({'model': qg.tokenizer}, n_workers=n_workers)
+            outputs = [list(chain(*pool.encode('model', config, data, chunk_size))) for _ in range(n_splits)]
+            pool.close()
+            return outputs
+
+        result = {'n_examples': len(data), 'n_splits': n_splits, 'n_workers': n_workers}
+        for name, fn in (('fresh_pool', fresh_pool), ('persistent_pool', persistent_pool)):
+            outputs, seconds = timed(fn)
+            result[name] = {'seconds': seconds, 'identical_features': all(o == reference for o in outputs)}
+        result['speedup'] = result['fresh_pool']['seconds'] / max(result['persistent_pool']['seconds'], 1e-9)
+        report(result, export_file)
+
+    def adaptive_decoding(self,
+                          model: str = DEFAULT_BENCHMARK_MODEL,
+                          thresholds: list = (-0.2, -0.5, -1.0),
+                          num_beams: int = 4,
+                          batch_size: int = 8,
+                          data_path: str = EXAMPLE_PATH,
+                          export_file: str = None):
+        """Đánh đổi tốc độ/chất lượng của adaptive decoding (greedy trước, beam search cho output không đáng tin)
+        so với luôn dùng beam search, cho QG (answer tham chiếu) và AE trên dữ liệu mẫu.
+
+        QG: thời gian, BLEU-4/ROUGE-L so với câu hỏi tham chiếu, tỉ lệ output giống beam search.
+        AE: thời gian, số answer dùng được và tỉ lệ answer tham chiếu được tìm thấy.
+        Mỗi ngưỡng kèm tỉ lệ input phải decode lại bằng beam search.
+
+        Args:
+            model: Model multitask (QG + AE)
+            thresholds: Các ngưỡng log-prob trung bình mỗi token cần so sánh
+            num_beams: Số beam search
+            batch_size: Batch size khi generate
+            data_path: File JSONL dữ liệu mẫu (context, answer, question)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        examples = load_examples(data_path)
+        contexts = load_contexts(data_path)
+        references = {}
+        for i in examples:
+            references.setdefault(i['context'], []).append(i['answer'])
+        qg = TransformersQG(model, skip_overflow_error=True, drop_answer_error_text=True)
+        settings = [('beam', None)] + [(f'adaptive_{t}', t) for t in thresholds]
+        result = {'n_examples': len(examples), 'n_contexts': len(contexts), 'num_beams': num_beams}
+        beam_questions = None
+        for name, threshold in settings:
+            qg.adaptive_decoding = threshold is not None
+            qg.adaptive_threshold = threshold
+            result[name] = {}
+
+            qg.adaptive_stats = AdaptiveDecodingStats()
+            questions, latency = timed(qg.generate_q, [i['context'] for i in examples],
+                                       list_answer=[i['answer'] for i in examples],
+                                       batch_size=batch_size, num_beams=num_beams)
+            beam_questions = beam_questions or questions
+            result[name]['qg'] = dict(
+                seconds=latency,
+                same_as_beam=sum(a == b for a, b in zip(questions, beam_questions)) / max(len(questions), 1),
+                rebeamed_rate=1 - qg.adaptive_stats.greedy_rate if qg.adaptive_decoding else 1.0,
+                **text_metrics([q or '' for q in questions], [i['question'] for i in examples]))
+
+            qg.adaptive_stats = AdaptiveDecodingStats()
+            answers, latency = timed(qg.generate_a, contexts, batch_size=batch_size, num_beams=num_beams)
+            answers = [a or [] for a in answers]
+            found = sum(any(r in a or a in r for a in answer) for c, answer in zip(contexts, answers)
+                        for r in references[c])
+            result[name]['ae'] = {
+                'seconds': latency,
+                'usable_answers': sum(len(a) for a in answers),
+                'reference_recall': found / max(sum(len(r) for r in references.values()), 1),
+                'rebeamed_rate': 1 - qg.adaptive_stats.greedy_rate if qg.adaptive_decoding else 1.0,
+                'adaptive_stats': qg.adaptive_stats.as_dict()
+            }
+        for name, _ in settings[1:]:
+            for task in ('qg', 'ae'):
+                result[name][task]['speedup'] = result['beam'][task]['seconds'] / max(result[name][task]['seconds'], 1e-9)
+        report(result, export_file)
+
+    def model_registry(self,
+                       model: str = DEFAULT_BENCHMARK_MODEL,
+                       model_ae: str = None,
+                       export_file: str = None):
+        """Nạp model qua ModelRegistry: thời gian nạp lần đầu và khi instance thứ 2 dùng lại checkpoint,
+        bộ nhớ từng model, và việc loại model không còn dùng khi ngân sách RAM/VRAM chỉ đủ cho 1 model.
+
+        Args:
+            model: Model QG (hoặc multitask)
+            model_ae: Model AE riêng (pipeline, tuỳ chọn); có -> model AE được nạp và tính vào bộ nhớ
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        registry = ModelRegistry()
+        result = {}
+        instances = []
+        for name in ('first', 'second'):
+            qg, seconds = timed(TransformersQG, model, model_ae=model_ae, model_registry=registry)
+            if model_ae is not None:
+                _ = qg.model_ae
+            instances.append(qg)
+            result[name] = {'seconds': seconds, 'load_seconds': qg.startup_report()['load_seconds']}
+        result['same_weights'] = instances[0].model is instances[1].model
+        result['memory'] = registry.memory_report()
+
+        # Ngân sách chỉ đủ cho model lớn nhất: trả hết tham chiếu rồi nạp lại -> các model còn lại bị loại
+        for qg in instances:
+            qg.release()
+        largest = max(m['ram_gb'] + m['vram_gb'] for m in result['memory']['models'])
+        device = 'vram' if result['memory']['vram_gb'] > 0 else 'ram'
+        registry.budgets['cuda' if device == 'vram' else 'cpu'] = largest
+        qg, seconds = timed(TransformersQG, model, model_registry=registry)
+        result['budgeted'] = {
+            f'{device}_budget_gb': largest,
+            'reload_seconds': seconds,
+            'memory': registry.memory_report()
+        }
+        qg.release()
+        report(result, export_file)
+
+    def profile_qag(self,
+                    model: str = DEFAULT_BENCHMARK_MODEL,
+                    n_contexts: int = 16,
+                    batch_size: int = 8,
+                    num_beams: int = 4,
+                    repeat: int = 3,
+                    trace_file: str = 'profile_qag.trace.json',
+                    export_file: str = None):
+        """Profile generate_qa theo từng stage (tách câu, highlight, tokenize, copy lên device, generate,
+        decode, lọc kết quả) và đo overhead của profiler so với khi tắt.
+
+        Args:
+            model: Model QG/AE
+            n_contexts: Số context
+            batch_size: Batch size
+            num_beams: Số beam
+            repeat: Số lần lặp khi so sánh tắt/bật profiler (lấy thời gian nhỏ nhất)
+            trace_file: File Chrome trace (mở bằng chrome://tracing hoặc ui.perfetto.dev)
+            export_file: Lưu kết quả ra file JSON (tuỳ chọn)
+        """
+        contexts = load_contexts(n=n_contexts)
+        qg = TransformersQG(model)
+        qg.generate_qa(contexts[:1], batch_size=batch_size, num_beams=num_beams)  # Warm-up
+
+        disabled = min(timed(qg.generate_qa, contexts, batch_size=batch_size, num_beams=num_beams)[1]
+                       for _ in range(repeat))
+        enabled = []
+        for _ in range(repeat):
+            with Profiler() as profiler:
+                enabled.append(timed(qg.generate_qa, contexts, batch_size=batch_size, num_beams=num_beams)[1])
+        profiler.export_chrome_trace(trace_file)
+        summary = profiler.summary()
+        total = sum(v['total_seconds'] for k, v in summary.items() if k in ('answer_extraction', 'question_generation'))
+        report({
+            'seconds_disabled': disabled,
+            'seconds_enabled': min(enabled),
+            'overhead': min(enabled) / max(disabled, 1e-9) - 1,
+            'stages': {k: dict(v, share=v['total_seconds'] / max(total, 1e-9)) for k, v in summary.items()},
+            'trace_file': trace_file
+        }, export_file)
+
+
+if __name__ == '__main__':
+    benchmark = Benchmark()
+    fire.Fire(benchmark)
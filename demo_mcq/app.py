@@ -200,9 +200,8 @@ def save_to_history(mcq_list: List[Dict]):
 # ══════════════════════════════════════════════════════════════
 # Cached model loaders (Local only)
 # ══════════════════════════════════════════════════════════════
-@st.cache_resource(show_spinner=False)
 def load_qa_generator(model_name: str):
-    """Load ViT5 model cho Question-Answer Generation (cached).
+    """Lấy QAGenerator của session hiện tại cho model_name.
     
     Args:
         model_name: Tên model HuggingFace ( shnl/vit5-vinewsqa-qg-ae)
@@ -211,13 +210,24 @@ def load_qa_generator(model_name: str):
         QAGenerator instance
     
     Caching:
-    - @st.cache_resource: Load 1 lần duy nhất, tái sử dụng cross-session
-    - Model được load vào RAM/GPU và giữ nguyên suốt app chạy
-    - Reload chỉ khi model_name thay đổi hoặc restart app
+    - Weight model nằm trong registry dùng chung của process (plms.model_registry): nạp 1 lần,
+      dùng chung giữa các session
+    - Mỗi session giữ 1 QAGenerator; đổi model → trả model cũ về registry (release)
+    - Session đóng/bỏ dở → Streamlit xoá session_state, QAGenerator bị thu gom và tự trả model
+      (weakref.finalize trong QAGenerator), nên refcount luôn về 0 khi không còn session nào dùng
+    - Model không còn session nào dùng được giải phóng theo LRU khi vượt
+      MODEL_REGISTRY_RAM_GB / MODEL_REGISTRY_VRAM_GB (thay vì giữ mãi như st.cache_resource)
     """
     from generator import QAGenerator
     clean_model_name = (model_name or "").strip() or None
-    return QAGenerator(model_name=clean_model_name)
+    current = st.session_state.get("qa_generator")
+    if current is not None and st.session_state.get("qa_generator_name") == clean_model_name:
+        return current
+    if current is not None:
+        current.release()
+    st.session_state["qa_generator"] = QAGenerator(model_name=clean_model_name)
+    st.session_state["qa_generator_name"] = clean_model_name
+    return st.session_state["qa_generator"]
 
 
 @st.cache_resource(show_spinner=False)
@@ -387,7 +397,11 @@ with col_main:
                 try:
                     # Yêu cầu thêm 50% để bù cho lọc chất lượng (trùng lặp, answer leakage…)
                     _request_pairs = max(num_pairs + 2, int(num_pairs * 1.5))
-                    qa_pairs = qa_gen.generate(ctx, num_pairs=_request_pairs)
+                    # Hiển thị từng cặp Q-A ngay khi ViT5 sinh xong
+                    qa_pairs = []
+                    for pair in qa_gen.iter_generate(ctx, num_pairs=_request_pairs):
+                        qa_pairs.append(pair)
+                        st.write(f"**{len(qa_pairs)}.** {pair['question']} → *{pair['answer']}*")
                     if not qa_pairs:
                         s.update(label="ViT5 không trả về kết quả", state="error")
                         st.warning(
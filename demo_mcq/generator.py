@@ -17,6 +17,10 @@ Dùng:
     gen = QAGenerator()
     pairs = gen.generate("Vấn đề bùng nổ về dữ liệu: khi....")
     # [{"question": "…", "answer": "…"}, …]
+
+    # Hoặc nhận từng cặp ngay khi sinh xong (hiển thị dần trên UI):
+    for pair in gen.iter_generate("Vấn đề bùng nổ về dữ liệu: khi...."):
+        print(pair)
 """
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -28,14 +32,22 @@ Dùng:
 # logging: Ghi log cảnh báo/lỗi từ thư viện transformers
 import os
 import re
+import sys
+import weakref
 import unicodedata
 import logging
 import time
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator
 
 # Cấu hình logging: Chỉ show WARNING trở lên (ẩn các log INFO spam từ transformers)
 logging.basicConfig(level=logging.WARNING)
 
+# Demo chạy từ thư mục demo_mcq → thêm thư mục gốc của repo vào sys.path để import plms
+# (plms/__init__ import lười: chỉ các module plms thực sự dùng tới mới được nạp, cần torch)
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # HẰNG SỐ VÀ CẤU HÌNH MỨC CẦU CỪ 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -46,6 +58,8 @@ DEFAULT_MODEL = "shnl/vit5-vinewsqa-qg-ae"
 MAX_INPUT_LEN = 512
 MAX_OUTPUT_LEN = 128
 HL_TOKEN = "<hl>"
+# Adaptive decoding (QAGenerator(adaptive=True)): ngưỡng log-prob trung bình mỗi token của output greedy
+ADAPTIVE_LOGPROB_THRESHOLD = -0.5
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -152,6 +166,26 @@ def _is_multitask(model_name: str) -> bool:
     return "qg" in parts and "ae" in parts
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# MODEL REGISTRY: nạp mỗi model 1 lần, dùng chung giữa các QAGenerator (và TransformersQG của plms)
+# ═══════════════════════════════════════════════════════════════════════════════
+def _model_registry():
+    """
+    Registry model dùng chung của cả process: plms.model_registry.default_registry().
+    Dùng chung 1 registry với TransformersQG/Evaluation nên ngân sách RAM/VRAM
+    (MODEL_REGISTRY_RAM_GB / MODEL_REGISTRY_VRAM_GB) áp dụng cho mọi model trong process.
+    """
+    from plms.model_registry import default_registry
+    return default_registry()
+
+
+def _release_models(registry, keys: List[tuple]):
+    """Trả các model đã acquire về registry (gọi bởi release() hoặc khi QAGenerator bị thu gom)."""
+    for key in keys:
+        registry.release(key)
+    keys.clear()
+
+
 # ───────────────────────── class chính ──────────────────────────
 class QAGenerator:
     """
@@ -160,12 +194,25 @@ class QAGenerator:
     Tham số:
         model_name : Tên model HF hub.
         device     : "cpu" | "cuda" | "auto".
+        quantize   : Quantize int8 các lớp Linear để chạy nhanh hơn trên CPU.
+        backend    : "torch" | "onnx" (ONNX Runtime trên CPU).
+        draft_model: Model draft nhỏ cùng tokenizer cho assisted decoding khi sinh câu hỏi.
+        constrained_ae: Ràng buộc đáp án AE chỉ là span của context (không phải lọc bỏ đáp án sai).
+        compiled   : torch.compile encoder + bước decoder, input pad theo bucket cố định (warm-up lúc load).
+        adaptive   : Greedy trước, chỉ chạy beam search khi output greedy có độ tin cậy thấp.
     """
 
     def __init__(
         self,
         model_name: str = None,
         device: str = "auto",
+        quantize: bool = None,
+        backend: str = None,
+        draft_model: str = None,
+        constrained_ae: bool = None,
+        compiled: bool = None,
+        adaptive: bool = None,
+        adaptive_threshold: float = None,
     ):
         """
         Khởi tạo QA Generator: Device, model_name, load model từ HuggingFace.
@@ -179,6 +226,29 @@ class QAGenerator:
             model_name: Tên model HF (VD: "shnl/vit5-vinewsqa-qg-ae")
                        Nếu None, sẽ lấy từ env var VIQAG_MODEL hoặc DEFAULT_MODEL
             device: "cuda" (GPU) | "cpu" (CPU) | "auto" (auto-detect)
+            quantize: True → quantize động int8 (chỉ chạy trên CPU, model int8 được cache trên đĩa)
+                      Nếu None, lấy từ env var VIQAG_QUANTIZE (mặc định tắt)
+            backend: "torch" | "onnx". "onnx" → export model sang ONNX 1 lần (lưu cache),
+                     sau đó sinh text bằng ONNX Runtime trên CPU. Nếu None, lấy từ env var VIQAG_BACKEND
+            draft_model: Model draft nhỏ (VD: vit5-small fine-tune cùng tác vụ, cùng tokenizer). Khi có,
+                         câu hỏi được sinh bằng greedy + assisted decoding (draft đề xuất token, model chính
+                         kiểm tra) thay cho beam search. Chỉ dùng với backend "torch".
+                         Nếu None, lấy từ env var VIQAG_DRAFT_MODEL (mặc định không dùng)
+            constrained_ae: True → khi trích xuất đáp án, model chỉ được sinh token tạo thành 1 đoạn
+                            liên tiếp của context (trie các span, qua prefix_allowed_tokens_fn)
+                            → mọi đáp án đều dùng được, cần ít lượt sinh hơn.
+                            Nếu None, lấy từ env var VIQAG_CONSTRAINED_AE (mặc định tắt)
+            compiled: True → torch.compile encoder và bước decoder; prompt được pad lên độ dài cố định
+                      (plms.compiled.DEFAULT_BUCKETS) nên encoder chỉ gặp vài shape đã compile. Mỗi bucket được warm-up
+                      1 lần lúc load (thời gian lưu ở self.compile_seconds), artifact compile được cache
+                      trên đĩa cho lần chạy sau. Chỉ dùng với backend "torch" không quantize.
+                      Nếu None, lấy từ env var VIQAG_COMPILED (mặc định tắt)
+            adaptive: True → mỗi prompt cần 1 kết quả được sinh greedy trước; chỉ khi log-prob trung bình
+                      mỗi token < adaptive_threshold, hoặc đáp án AE không nằm trong context, mới sinh lại
+                      bằng beam search. Thống kê ở self.adaptive_stats.
+                      Nếu None, lấy từ env var VIQAG_ADAPTIVE (mặc định tắt)
+            adaptive_threshold: Ngưỡng log-prob của adaptive. Nếu None, lấy từ env var
+                                VIQAG_ADAPTIVE_THRESHOLD (mặc định ADAPTIVE_LOGPROB_THRESHOLD)
         
         Raises:
             RuntimeError: Nếu thiếu thư viện torch/transformers
@@ -186,6 +256,25 @@ class QAGenerator:
         # Ưu tiên: param → biến env → hằng số DEFAULT_MODEL
         self.model_name = model_name or os.getenv("VIQAG_MODEL", DEFAULT_MODEL)
         self.device     = device
+        self.quantize   = quantize if quantize is not None else os.getenv("VIQAG_QUANTIZE", "0") == "1"
+        self.backend    = backend or os.getenv("VIQAG_BACKEND", "torch")
+        if self.backend not in ("torch", "onnx"):
+            raise ValueError(f"backend không hợp lệ: '{self.backend}' (chọn 'torch' hoặc 'onnx')")
+        if self.backend == "onnx":
+            self.quantize = False  # Quantize int8 chỉ áp dụng cho backend torch
+        self.draft_model_name = draft_model or os.getenv("VIQAG_DRAFT_MODEL") or None
+        self.constrained_ae = (constrained_ae if constrained_ae is not None
+                               else os.getenv("VIQAG_CONSTRAINED_AE", "0") == "1")
+        self.compiled = compiled if compiled is not None else os.getenv("VIQAG_COMPILED", "0") == "1"
+        self.adaptive = adaptive if adaptive is not None else os.getenv("VIQAG_ADAPTIVE", "0") == "1"
+        self.adaptive_threshold = (adaptive_threshold if adaptive_threshold is not None
+                                   else float(os.getenv("VIQAG_ADAPTIVE_THRESHOLD", ADAPTIVE_LOGPROB_THRESHOLD)))
+        if self.compiled and (self.backend != "torch" or self.quantize):
+            print("[Generator] Bỏ qua compiled mode (chỉ hỗ trợ backend torch, không quantize)")
+            self.compiled = False
+        if self.backend == "onnx" and self.draft_model_name:
+            print("[Generator] Bỏ qua draft model (assisted decoding chỉ hỗ trợ backend torch)")
+            self.draft_model_name = None
         
         # Detect: Model này hỗ trợ QG+AE hay chỉ QG?
         # multitask=True → Dùng 2-stage (AE → QG)
@@ -194,8 +283,20 @@ class QAGenerator:
 
         # Khởi tạo None (sẽ gán trong _load_local())
         self._model      = None
+        self._draft      = None
         self._tokenizer  = None
         self._device_str = "cpu"
+        # Khóa các model đang giữ trong registry dùng chung (trả lại bằng release(), hoặc tự động khi
+        # QAGenerator bị thu gom, ví dụ session Streamlit đã đóng)
+        self._registry = None
+        self._registry_keys: List[tuple] = []
+        self._finalizer = None
+        # Thời gian warm-up (chủ yếu là compile) của từng bucket ở chế độ compiled
+        self.compile_seconds: Dict[int, float] = {}
+        # Thống kê assisted decoding: token sinh ra, số forward của model chính / model draft
+        self.assisted_stats = {"generated_tokens": 0, "target_forward_calls": 0, "draft_forward_calls": 0}
+        # Thống kê adaptive decoding: số prompt sinh greedy, số prompt phải sinh lại bằng beam search
+        self.adaptive_stats = {"samples": 0, "rebeamed": 0}
 
         # Gọi hàm tải model từ HuggingFace
         self._load_local()
@@ -204,12 +305,64 @@ class QAGenerator:
     def _load_local(self):
         try:
             import torch
-            from transformers import AutoTokenizer, T5Tokenizer, T5ForConditionalGeneration, AutoModelForSeq2SeqLM
+            import transformers  # noqa: F401 (chỉ kiểm tra đã cài, dùng trong _load_model)
         except ImportError:
             raise RuntimeError(
                 "Thiếu thư viện. Chạy:  pip install torch transformers sentencepiece"
             )
 
+        if self.quantize or self.backend == "onnx":
+            self._device_str = "cpu"  # Model int8 / ONNX Runtime chỉ chạy trên CPU
+        elif self.device == "auto":
+            self._device_str = "cuda" if torch.cuda.is_available() else "cpu"
+        else:
+            self._device_str = self.device
+
+        # Model dùng chung qua registry của process: QAGenerator khác cùng cấu hình không nạp lại
+        self._registry = _model_registry()
+        self._finalizer = weakref.finalize(self, _release_models, self._registry, self._registry_keys)
+        key = self._registry.key(self.model_name, loader="QAGenerator", quantize=self.quantize,
+                                 backend=self.backend, compiled=self.compiled, device=self._device_str)
+        self._tokenizer, self._model, self.compile_seconds = self._registry.acquire(key, self._load_model)
+        self._registry_keys.append(key)
+
+        # Model draft cho assisted decoding (fp32, cùng device với model chính)
+        if self.draft_model_name:
+            key = self._registry.key(self.draft_model_name, loader="QAGenerator.draft",
+                                     vocab_size=len(self._tokenizer), device=self._device_str)
+            self._draft = self._registry.acquire(key, self._load_draft)
+            self._registry_keys.append(key)
+
+        mode = "multitask QG+AE" if self.multitask else "pipeline QG-only"
+        if self.quantize:
+            mode += ", int8"
+        if self.backend == "onnx":
+            mode += ", onnxruntime"
+        if self._draft is not None:
+            mode += f", draft {self.draft_model_name}"
+        if self.constrained_ae:
+            mode += ", constrained AE"
+        if self.compiled:
+            mode += ", compiled"
+        if self.adaptive:
+            mode += f", adaptive ({self.adaptive_threshold})"
+        print(f"[Generator] Model sẵn sàng trên '{self._device_str}' ({mode}).")
+
+    def _load_model(self):
+        """
+        Nạp tokenizer + model chính (quantize / ONNX / compile theo cấu hình), chuyển lên device.
+        Chỉ được gọi qua registry khi cấu hình này chưa có trong registry.
+
+        Returns:
+            (tokenizer, model, compile_seconds)
+        """
+        import torch
+        from transformers import (AutoConfig, AutoTokenizer, T5Tokenizer, T5ForConditionalGeneration,
+                                  AutoModelForSeq2SeqLM)
+        from plms.quantization import quantize_model, quantized_cache_path, load_quantized, save_quantized
+        from plms.onnx_backend import onnx_cache_path, load_onnx_model, export_onnx_model
+
+        self.compile_seconds = {}
         print(f"[Generator] Đang load model '{self.model_name}' (lần đầu ~1–3 phút)…")
 
         
@@ -231,36 +384,113 @@ class QAGenerator:
         if HL_TOKEN not in self._tokenizer.get_vocab():
             self._tokenizer.add_special_tokens({"additional_special_tokens": [HL_TOKEN]})
         
-        #Tải Mô hình
-        try:
-            self._model = T5ForConditionalGeneration.from_pretrained(
-                self.model_name
-            )
-        except Exception:
-            self._model = AutoModelForSeq2SeqLM.from_pretrained(
-                self.model_name
-            )
-        #Đồng bộ hóa kích thước của Mô hình (Model) với kích thước của Bộ tách từ (Tokenizer).
-        #tạo thêm một vector mới ở lớp Embedding để cấp chỗ trống cho token <hl>
-        self._model.resize_token_embeddings(len(self._tokenizer))
-
-        import torch
-        if self.device == "auto":
-            self._device_str = "cuda" if torch.cuda.is_available() else "cpu"
+        # Model int8 / graph ONNX đã có từ lần chạy trước → nạp thẳng, bỏ qua weight fp32.
+        # Khóa cache giống plms: tên + revision (commit trên hub / thời điểm sửa weight của model local)
+        # + số token (+ phiên bản torch với int8) → model được cập nhật thì cache cũ không bị dùng nhầm
+        config = AutoConfig.from_pretrained(self.model_name)
+        quantized_path = quantized_cache_path(self.model_name, config, len(self._tokenizer))
+        onnx_path = onnx_cache_path(self.model_name, config, len(self._tokenizer))
+        onnx_model = None
+        if self.backend == "onnx":
+            try:
+                import optimum.onnxruntime  # noqa: F401
+            except ImportError:
+                raise RuntimeError("Thiếu thư viện. Chạy:  pip install optimum[onnxruntime]")
+            onnx_model = load_onnx_model(onnx_path)
+
+        if onnx_model is not None:
+            print(f"[Generator] Nạp graph ONNX từ cache '{onnx_path}'")
+            self._model = onnx_model
+        elif self.quantize and os.path.exists(quantized_path):
+            print(f"[Generator] Nạp model int8 từ cache '{quantized_path}'")
+            self._model = load_quantized(quantized_path)
         else:
-            self._device_str = self.device
+            #Tải Mô hình
+            try:
+                self._model = T5ForConditionalGeneration.from_pretrained(
+                    self.model_name
+                )
+            except Exception:
+                self._model = AutoModelForSeq2SeqLM.from_pretrained(
+                    self.model_name
+                )
+            #Đồng bộ hóa kích thước của Mô hình (Model) với kích thước của Bộ tách từ (Tokenizer).
+            #tạo thêm một vector mới ở lớp Embedding để cấp chỗ trống cho token <hl>
+            self._model.resize_token_embeddings(len(self._tokenizer))
+
+            # Quantize động int8: weight các lớp Linear lưu dạng int8, activation quantize lúc chạy
+            if self.quantize:
+                self._model = quantize_model(self._model)
+                save_quantized(self._model, quantized_path)
+
+            # Export ONNX (encoder + decoder + decoder-with-past) 1 lần rồi nạp lại từ cache
+            if self.backend == "onnx":
+                print(f"[Generator] Export ONNX → '{onnx_path}' (chỉ lần đầu)")
+                self._model = export_onnx_model(self._model, self._tokenizer, onnx_path)
 
         self._model.to(self._device_str)
-        # train() (để huấn luyện) và eval() (để sử dụng)
-        self._model.eval()
-        mode = "multitask QG+AE" if self.multitask else "pipeline QG-only"
-        print(f"[Generator] Model sẵn sàng trên '{self._device_str}' ({mode}).")
+        # train() (để huấn luyện) và eval() (để sử dụng); model ONNX không có 2 chế độ này
+        if isinstance(self._model, torch.nn.Module):
+            self._model.eval()
+
+        if self.compiled:
+            self._compile()
+        return self._tokenizer, self._model, self.compile_seconds
+
+    def _load_draft(self):
+        """Nạp model draft cho assisted decoding (qua registry)."""
+        from transformers import AutoModelForSeq2SeqLM
+
+        print(f"[Generator] Đang load draft model '{self.draft_model_name}'…")
+        draft = AutoModelForSeq2SeqLM.from_pretrained(self.draft_model_name)
+        draft.resize_token_embeddings(len(self._tokenizer))
+        draft.to(self._device_str)
+        draft.eval()
+        return draft
+
+    def release(self):
+        """
+        Trả model về registry khi không dùng QAGenerator này nữa. Model vẫn được giữ lại cho lần
+        dùng sau cho tới khi vượt ngân sách bộ nhớ (MODEL_REGISTRY_RAM_GB / MODEL_REGISTRY_VRAM_GB).
+        QAGenerator bị thu gom mà chưa gọi release() → model cũng được trả tự động.
+        """
+        if self._finalizer is not None:
+            self._finalizer()  # Chỉ chạy 1 lần (kể cả khi bị thu gom sau đó)
+
+    @staticmethod
+    def memory_report() -> Dict:
+        """Bộ nhớ (GB) của từng model đang giữ trong registry dùng chung, số nơi đang dùng mỗi model."""
+        return _model_registry().memory_report()
+
+    def _compile(self):
+        """
+        torch.compile encoder (shape theo bucket) và bước decoder qua plms.compiled, sau đó warm-up
+        từng bucket bằng prompt giả với cùng cấu hình beam search như _infer.
+        Artifact compile (graph FX + kernel) được cache ở plms.compiled.COMPILE_CACHE_DIR.
+        """
+        from plms.compiled import DEFAULT_BUCKETS, compile_model, warmup
+
+        compile_model(self._model)
+        print(f"[Generator] Compile + warm-up {len(DEFAULT_BUCKETS)} bucket (lần đầu có thể mất vài phút)…")
+        # Adaptive / assisted decoding sinh greedy (num_beams=1) → warm-up cả greedy để request đầu không compile lại
+        beams = (4, 1) if self.adaptive or self.draft_model_name else (4,)
+        for num_beams in beams:
+            seconds = warmup(self._model, self._tokenizer.pad_token_id, num_beams=num_beams)
+            for bucket, value in seconds.items():
+                self.compile_seconds[bucket] = self.compile_seconds.get(bucket, 0.0) + value
+
+    def _pad_to_bucket(self, inputs) -> Dict:
+        """Pad prompt đã tokenize (bên phải, attention_mask = 0) lên độ dài bucket của chế độ compiled."""
+        from plms.compiled import pad_to_bucket
+
+        return pad_to_bucket(inputs, self._tokenizer.pad_token_id)
 
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
     # INFERENCE: Sinh text từ prompt (QA generation core)
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
     def _infer(self, prompt: str, max_new_tokens: int = MAX_OUTPUT_LEN,
-               num_return_sequences: int = 1) -> List[str]:
+               num_return_sequences: int = 1, prefix_allowed_tokens_fn=None,
+               answer_context: str = None) -> List[str]:
         """
         Inference: Sinh 1 hoặc nhiều kết quả text từ prompt.
         
@@ -277,6 +507,9 @@ class QAGenerator:
             prompt: Chuỗi prompt gủi cho model (VD: "extract answers: [context]")
             max_new_tokens: Độ dài tối đa output (default=128)
             num_return_sequences: Số output sinh ra (VD: 2 → sinh 2 answers khác nhau)
+            prefix_allowed_tokens_fn: Giới hạn token được sinh ở mỗi bước (xem _span_constraint)
+            answer_context: Context của đáp án AE: ở chế độ adaptive, kết quả greedy không nằm trong
+                            context sẽ được sinh lại bằng beam search
         
         Returns:
             List string: Danh sách kết quả (độ dài = num_return_sequences)
@@ -295,6 +528,14 @@ class QAGenerator:
             max_length=MAX_INPUT_LEN,
             truncation=True,
         ).to(self._device_str)  # Move tensors sang GPU/CPU
+        if self.compiled:
+            inputs = self._pad_to_bucket(inputs)  # Chỉ dùng các shape đã compile
+
+        # ─ Adaptive: thử greedy trước, đủ tin cậy thì không cần beam search ─
+        if self.adaptive and num_return_sequences == 1:
+            text = self._infer_greedy(inputs, max_new_tokens, prefix_allowed_tokens_fn, answer_context)
+            if text is not None:
+                return [text]
         
         # ─ Bước 2: Config beam search ─
         # num_beams: Số lượng hypotheses theo dõi song song
@@ -309,6 +550,7 @@ class QAGenerator:
                 num_beams=num_beams,            # Beam search
                 num_return_sequences=num_return_sequences,  # Số output
                 early_stopping=True,            # Dừng sớm khi tìm được solution tốt
+                prefix_allowed_tokens_fn=prefix_allowed_tokens_fn,
             )
         
         # ─ Bước 4: Decode → text ─
@@ -316,15 +558,124 @@ class QAGenerator:
         # skip_special_tokens=True: Bỏ <hl>, <pad>, </s>, etc
         return [self._tokenizer.decode(i, skip_special_tokens=True) for i in ids]
 
+    def _infer_greedy(self, inputs, max_new_tokens: int, prefix_allowed_tokens_fn=None,
+                      answer_context: str = None) -> Optional[str]:
+        """
+        Sinh greedy kèm điểm từng token (output_scores) cho chế độ adaptive.
+
+        Log-prob trung bình mỗi token (bỏ pad, tính cả </s>) >= adaptive_threshold và (nếu là AE) đáp án
+        nằm trong context → trả về kết quả greedy. Ngược lại trả về None để _infer sinh lại bằng beam search.
+        """
+        import torch
+
+        with torch.no_grad():
+            out = self._model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                num_beams=1,
+                do_sample=False,
+                output_scores=True,
+                return_dict_in_generate=True,
+                prefix_allowed_tokens_fn=prefix_allowed_tokens_fn,
+            )
+            scores = self._model.compute_transition_scores(out.sequences, out.scores, normalize_logits=True)[0]
+        tokens = out.sequences[0, 1:]  # bỏ decoder start token
+        keep = tokens != self._tokenizer.pad_token_id
+        logprob = scores[keep].mean().item() if keep.any() else float("-inf")
+        text = self._tokenizer.decode(out.sequences[0], skip_special_tokens=True)
+
+        self.adaptive_stats["samples"] += 1
+        if logprob >= self.adaptive_threshold and (
+                answer_context is None or (_clean(text) and _answer_in_context(_clean(text), answer_context))):
+            return text
+        self.adaptive_stats["rebeamed"] += 1
+        return None
+
     def _infer_one(self, prompt: str, max_new_tokens: int = MAX_OUTPUT_LEN) -> str:
         """
         Sinh 1 kết quả (wrapper của _infer()).
         
+        Có draft model → greedy + assisted decoding (_infer_assisted) thay cho beam search.
+
         Returns:
             String đầu tiên từ _infer (default num_return_sequences=1)
         """
+        if self._draft is not None:
+            return self._infer_assisted(prompt, max_new_tokens)
         return self._infer(prompt, max_new_tokens)[0]
 
+    def _infer_assisted(self, prompt: str, max_new_tokens: int = MAX_OUTPUT_LEN) -> str:
+        """
+        Greedy decoding có draft model hỗ trợ (assistant_model của transformers).
+
+        Mỗi lượt, draft đề xuất vài token, model chính kiểm tra tất cả trong 1 forward và giữ phần
+        khớp với greedy của nó → output giống hệt greedy không có draft, nhưng ít forward hơn.
+        Số forward được đếm qua forward hook để tính tỉ lệ chấp nhận (xem assisted_summary()).
+
+        Returns:
+            String câu hỏi sinh ra
+        """
+        import torch
+
+        inputs = self._tokenizer(
+            prompt, return_tensors="pt", max_length=MAX_INPUT_LEN, truncation=True,
+        ).to(self._device_str)
+        counts = {"target": 0, "draft": 0}
+        hooks = [
+            self._model.register_forward_hook(lambda *_: counts.__setitem__("target", counts["target"] + 1)),
+            self._draft.register_forward_hook(lambda *_: counts.__setitem__("draft", counts["draft"] + 1)),
+        ]
+        try:
+            with torch.no_grad():
+                ids = self._model.generate(
+                    **inputs,
+                    max_new_tokens=max_new_tokens,
+                    num_beams=1,
+                    do_sample=False,
+                    assistant_model=self._draft,
+                )
+        finally:
+            for hook in hooks:
+                hook.remove()
+        self.assisted_stats["generated_tokens"] += ids.shape[1] - 1  # bỏ decoder start token
+        self.assisted_stats["target_forward_calls"] += counts["target"]
+        self.assisted_stats["draft_forward_calls"] += counts["draft"]
+        return self._tokenizer.decode(ids[0], skip_special_tokens=True)
+
+    def assisted_summary(self) -> Dict[str, float]:
+        """
+        Tỉ lệ chấp nhận của assisted decoding: token draft được chấp nhận / token draft đề xuất.
+        Mỗi forward của model chính nhận thêm đúng 1 token của nó, nên
+        token được chấp nhận = token sinh ra - số forward của model chính.
+        """
+        stats = dict(self.assisted_stats)
+        accepted = max(stats["generated_tokens"] - stats["target_forward_calls"], 0)
+        stats["accepted_tokens"] = accepted
+        stats["acceptance_rate"] = accepted / stats["draft_forward_calls"] if stats["draft_forward_calls"] else 0.0
+        return stats
+
+    def _span_constraint(self, context: str, max_new_tokens: int):
+        """
+        Tạo prefix_allowed_tokens_fn cho model.generate(): output chỉ được là 1 span token của context.
+
+        - Token đầu tiên (decoder start) bị bỏ khi tra trie
+        - </s> chỉ được phép sau khi đã sinh ít nhất 1 token
+        - Prefix không còn nhánh con (hết span / quá max_new_tokens) → chỉ cho phép </s>
+        """
+        from plms.constrained_decoding import SpanTrie
+
+        trie = SpanTrie([self._tokenizer.encode(context, add_special_tokens=False)], max_new_tokens)
+        eos = self._tokenizer.eos_token_id
+
+        def allowed(batch_id, decoder_input_ids):
+            prefix = decoder_input_ids.tolist()[1:]
+            tokens = trie.next_tokens(prefix)  # Rỗng khi prefix không phải span hoặc đã hết span
+            if prefix or not tokens:
+                tokens.append(eos)
+            return tokens
+
+        return allowed
+
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
     # STAGE 1 (AE): EXTRACT ANSWERS từ context (Multitask model)
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -358,9 +709,13 @@ class QAGenerator:
         seqs_per_sent = max(1, -(-need // max(len(sentences), 1)))  # làm tròn
         seqs_per_sent = min(seqs_per_sent, 4)  # tối đa 4
 
+        # ─ Constrained AE: đáp án luôn nằm trong context → không cần sinh dư gấp đôi để bù phần bị lọc
+        constraint = self._span_constraint(context, 128) if self.constrained_ae else None
+        target = need if self.constrained_ae else need * 2
+
         # ─ Bước 1: Loop qua từng câu, sinh answers ─
         for sentence in sentences:
-            if len(answers) >= need * 2:  # đủ candidate rồi, dừng
+            if len(answers) >= target:  # đủ candidate rồi, dừng
                 break
             
             # Tìm vị trí câu trong context (để highlight)
@@ -378,7 +733,8 @@ class QAGenerator:
             
             # ─ Bước 3: Gủi prompt "extract answers: [highlighted_context]" ─
             prompt = f"extract answers: {highlighted}"
-            raws = self._infer(prompt, max_new_tokens=128, num_return_sequences=seqs_per_sent)
+            raws = self._infer(prompt, max_new_tokens=128, num_return_sequences=seqs_per_sent,
+                               prefix_allowed_tokens_fn=constraint, answer_context=context)
             
             # ─ Bước 4: Filter + Deduplicate ─
             for raw in (_clean(r) for r in raws):
@@ -479,6 +835,23 @@ class QAGenerator:
         context: str,
         num_pairs: int = 5,
     ) -> List[Dict[str, str]]:
+        """
+        Sinh tối đa `num_pairs` cặp Q-A từ `context` và trả về cùng lúc.
+        
+        Gom toàn bộ kết quả của iter_generate() thành list.
+        
+        Returns:
+            List[Dict]: [{"question": "...", "answer": "..."}, ...]
+        """
+        pairs = list(self.iter_generate(context, num_pairs))
+        print(f"[Generator] Tổng: {len(pairs)} cặp Q-A")
+        return pairs
+
+    def iter_generate(
+        self,
+        context: str,
+        num_pairs: int = 5,
+    ) -> Iterator[Dict[str, str]]:
         """
         ★ HÀM CHÍNH: Sinh tối đa `num_pairs` cặp Q-A từ `context`.
         
@@ -490,25 +863,23 @@ class QAGenerator:
         1. Clean context (xóa dấu cách thừa)
         2. Extract answers multitask → Nếu ko đủ → Fallback tách câu
         3. Loop qua từng answer: Sinh question + Dedup
-        4. Return max num_pairs cặp Q-A
+        4. Yield từng cặp Q-A ngay khi sinh xong (tối đa num_pairs cặp)
         
         Params:
             context: Đoạn văn tiếng Việt (VD: "Big data là tập hợp...")
                     Nên >= 50 ký tự để model hoạt động tốt
             num_pairs: Số cặp Q-A mong muốn (default=5)
         
-        Returns:
-            List[Dict]: [{"question": "...", "answer": "..."}, ...]
+        Yields:
+            Dict: {"question": "...", "answer": "..."}
             VD:
-            [
-                {"question": "Big data là gì?", "answer": "Big data"},
-                {"question": "Big data được định nghĩa là sao?", "answer": "Dữ liệu lớn"},
-                ...
-            ]
+            {"question": "Big data là gì?", "answer": "Big data"}
+            {"question": "Big data được định nghĩa là sao?", "answer": "Dữ liệu lớn"}
+            ...
         """
         context = _clean(context)
         if not context:
-            return []  # Rỗng → Return []
+            return  # Rỗng → không yield gì
 
         # ══════════════════════════════════════════════════════════════════════════════
         # STAGE 1: EXTRACT ANSWERS
@@ -539,17 +910,17 @@ class QAGenerator:
         # ─ Check: Có answers không? ─
         if not answers:
             print("[AE] Không tìm được đáp án nào.")
-            return []  # Không có answers → Fail
+            return  # Không có answers → Fail
 
         # ══════════════════════════════════════════════════════════════════════════════
         # STAGE 2: GENERATE QUESTIONS
         # ══════════════════════════════════════════════════════════════════════════════
-        pairs: List[Dict[str, str]] = []  # Lưu Q-A pairs cuối cùng
-        seen_q: set = set()               # Tracking questions (loại trùng)
+        n_pairs = 0          # Số Q-A pairs đã yield
+        seen_q: set = set()  # Tracking questions (loại trùng)
 
         for answer in answers:
             # ─ Early stop: Đủ pairs rồi ─
-            if len(pairs) >= num_pairs:
+            if n_pairs >= num_pairs:
                 break
             
             # ─ Filter: Answer quá ngắn (1 ký tự, chỉ số, etc) ─
@@ -565,8 +936,9 @@ class QAGenerator:
             if question and question not in seen_q:
                 # Question hợp lệ + chưa có → Thêm
                 seen_q.add(question)
-                pairs.append({"question": question, "answer": answer})
+                n_pairs += 1
                 print(f"[QG] -> Q: {question}")
+                yield {"question": question, "answer": answer}
             elif question:
                 # Question có nhưng trùng lặp
                 print(f"[QG] -> Skip (trùng): {question}")
@@ -574,7 +946,3 @@ class QAGenerator:
                 # Model không sinh được question cho answer này
                 print(f"[QG] -> Không sinh được câu hỏi cho '{answer}'")
 
-        # ─ Final log ─
-        print(f"[Generator] Tổng: {len(pairs)} cặp Q-A")
-        return pairs
-
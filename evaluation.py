@@ -1,6 +1,4 @@
 import fire
-from plms.model_evaluation_qag import Evaluation
-from plms.compute_metrics import Evaluate
 class QAGenerationEvaluation:
     def generate(
         self,
@@ -26,11 +24,18 @@ class QAGenerationEvaluation:
         is_qg: bool = None,
         is_ae: bool = None,
         is_qag: bool = True,
-        use_reference_answer: bool = False
+        use_reference_answer: bool = False,
+        max_tokens: int = None,
+        generation_cache: str = None,
+        chunk_size: int = None,
+        adaptive_decoding: bool = False,
+        adaptive_threshold: float = -0.5
     ):
         assert (
             model
         ), "Please specify your model, default. --model='VietAI/vit5-base'"
+        # Import khi dùng tới: lệnh `evaluate` không cần nạp torch/transformers/datasets
+        from plms.model_evaluation_qag import Evaluation
         eval = Evaluation(
             model = model,
             model_ae = model_ae,
@@ -54,7 +59,12 @@ class QAGenerationEvaluation:
             is_qg = is_qg,
             is_ae = is_ae,
             is_qag = is_qag,
-            use_reference_answer = use_reference_answer
+            use_reference_answer = use_reference_answer,
+            max_tokens = max_tokens,
+            generation_cache = generation_cache,
+            chunk_size = chunk_size,
+            adaptive_decoding = adaptive_decoding,
+            adaptive_threshold = adaptive_threshold
         )
         eval.evaluation()
 
@@ -65,6 +75,7 @@ class QAGenerationEvaluation:
         assert (
             result_path
         ), "result_path cannot be empty."
+        from plms.compute_metrics import Evaluate
         evaluator = Evaluate(result_path)
         evaluator.compute_metrics()
 
@@ -1,3 +1,25 @@
-from .trainer import Trainer
-from .data import get_dataset, DEFAULT_CACHE_DIR
-from .spacy_module import SpacyPipeline
\ No newline at end of file
+import importlib
+
+# Tên public -> submodule chứa nó. Submodule chỉ được import khi truy cập tên lần đầu (PEP 562),
+# nên `import plms` không kéo theo torch, transformers, datasets hay spaCy.
+_LAZY_IMPORTS = {
+    'Trainer': '.trainer',
+    'get_dataset': '.data',
+    'DEFAULT_CACHE_DIR': '.data',
+    'SpacyPipeline': '.spacy_module',
+    'Profiler': '.profiling',
+}
+
+__all__ = tuple(_LAZY_IMPORTS)
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
@@ -0,0 +1,116 @@
+""" Adaptive decoding: greedy first, beam search only for low-confidence outputs. """
+from typing import Dict, List
+import torch
+from .constrained_decoding import ContextSpanConstraint
+
+__all__ = ('DEFAULT_LOGPROB_THRESHOLD', 'AdaptiveDecodingStats', 'mean_logprob', 'is_input_span', 'adaptive_generate')
+
+# Ngưỡng log-prob trung bình mỗi token của output greedy; thấp hơn -> decode lại bằng beam search
+DEFAULT_LOGPROB_THRESHOLD = -0.5
+
+
+class AdaptiveDecodingStats:
+    """Thống kê cộng dồn của adaptive decoding: số mẫu, số mẫu phải decode lại bằng beam search và lý do."""
+
+    def __init__(self):
+        self.samples = 0
+        self.low_confidence = 0
+        self.not_in_input = 0
+        self.rebeamed = 0
+
+    def update(self, samples: int, low_confidence: int, not_in_input: int, rebeamed: int):
+        self.samples += samples
+        self.low_confidence += low_confidence
+        self.not_in_input += not_in_input
+        self.rebeamed += rebeamed
+
+    @property
+    def greedy_rate(self):
+        """Tỉ lệ mẫu giữ nguyên kết quả greedy (không cần beam search)."""
+        return 1 - self.rebeamed / self.samples if self.samples else 0.0
+
+    def as_dict(self):
+        return {
+            'samples': self.samples,
+            'low_confidence': self.low_confidence,
+            'not_in_input': self.not_in_input,
+            'rebeamed': self.rebeamed,
+            'greedy_rate': self.greedy_rate
+        }
+
+
+def mean_logprob(model, output, pad_token_id: int):
+    """Log-prob trung bình mỗi token của từng output greedy (bỏ decoder start token và pad sau EOS).
+
+    Args:
+        model: Model đã generate
+        output: Kết quả model.generate(..., output_scores=True, return_dict_in_generate=True)
+        pad_token_id: Token pad
+
+    Returns:
+        Tensor (batch,) log-prob trung bình của từng dòng
+    """
+    scores = model.compute_transition_scores(output.sequences, output.scores, normalize_logits=True)
+    mask = (output.sequences[:, 1:] != pad_token_id).to(scores.dtype)
+    scores = torch.where(mask.bool(), scores, torch.zeros_like(scores))
+    return scores.sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+
+
+def is_input_span(output_ids: List[int], input_ids: List[int], special_ids=()):
+    """Output (bỏ token đặc biệt) có phải 1 đoạn token liên tiếp, khác rỗng, của input hay không."""
+    output_ids = [i for i in output_ids if i not in special_ids]
+    if len(output_ids) == 0:
+        return False
+    first, length = output_ids[0], len(output_ids)
+    return any(input_ids[n:n + length] == output_ids
+               for n in range(len(input_ids) - length + 1) if input_ids[n] == first)
+
+
+def adaptive_generate(model, tokenizer, encode: Dict, num_beams: int, threshold: float = DEFAULT_LOGPROB_THRESHOLD,
+                      span_output: bool = False, stats: AdaptiveDecodingStats = None):
+    """Decode greedy cả batch, chỉ decode lại bằng beam search các mẫu có output không đáng tin.
+
+    Mẫu bị decode lại khi log-prob trung bình mỗi token của output greedy thấp hơn `threshold`, hoặc
+    (với `span_output`, dùng cho AE) output không phải 1 span token của input. Mẫu còn lại giữ kết quả
+    greedy, nên phần lớn batch chỉ tốn 1 lượt greedy thay vì `num_beams` hypothesis.
+
+    Args:
+        model: Model seq2seq (đã ở device của `encode`)
+        tokenizer: Tokenizer của model
+        encode: Tham số model.generate() của batch (input_ids, attention_mask, max_length,
+                có thể kèm prefix_allowed_tokens_fn là ContextSpanConstraint); num_beams bị bỏ qua
+        num_beams: Số beam khi decode lại
+        threshold: Ngưỡng log-prob trung bình mỗi token (0 -> luôn decode lại, -inf -> luôn giữ greedy)
+        span_output: Output phải là 1 span của input (AE)
+        stats: Nơi cộng dồn thống kê (tuỳ chọn)
+
+    Returns:
+        List token id output của từng mẫu, cùng thứ tự với batch
+    """
+    encode = {k: v for k, v in encode.items() if k != 'num_beams'}
+    output = model.generate(**encode, num_beams=1, output_scores=True, return_dict_in_generate=True)
+    sequences = output.sequences.tolist()
+    low_confidence = (mean_logprob(model, output, tokenizer.pad_token_id) < threshold).tolist()
+    not_in_input = [False] * len(sequences)
+    if span_output:
+        special = set(tokenizer.all_special_ids)
+        not_in_input = [not is_input_span(s, i, special) for s, i in zip(sequences, encode['input_ids'].tolist())]
+    rows = [n for n, (a, b) in enumerate(zip(low_confidence, not_in_input)) if a or b]
+    if stats is not None:
+        stats.update(len(sequences), sum(low_confidence), sum(not_in_input), len(rows))
+    if len(rows) == 0 or num_beams <= 1:
+        return sequences
+
+    # Decode lại các mẫu không đáng tin bằng beam search (ràng buộc span được cắt theo các mẫu đó)
+    index = torch.tensor(rows, device=encode['input_ids'].device)
+    subset = dict(encode)
+    for key in ('input_ids', 'attention_mask'):
+        if key in subset:
+            subset[key] = subset[key].index_select(0, index)
+    constraint = subset.get('prefix_allowed_tokens_fn')
+    if isinstance(constraint, ContextSpanConstraint):
+        subset['prefix_allowed_tokens_fn'] = ContextSpanConstraint(
+            [constraint.tries[n] for n in rows], constraint.eos_token_id)
+    for n, sequence in zip(rows, model.generate(**subset, num_beams=num_beams).tolist()):
+        sequences[n] = sequence
+    return sequences
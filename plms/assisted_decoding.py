@@ -0,0 +1,98 @@
+""" Assisted (speculative) greedy decoding with a small draft model. """
+from typing import Dict
+import torch
+
+__all__ = ('ForwardCounter', 'AssistedDecodingStats', 'assisted_generate')
+
+
+class ForwardCounter:
+    """Đếm số lần gọi forward của 1 module trong khối `with` (qua forward hook)."""
+
+    def __init__(self, module):
+        self.module = module
+        self.count = 0
+        self._handle = None
+
+    def _hook(self, *_):
+        self.count += 1
+
+    def __enter__(self):
+        self._handle = self.module.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, *_):
+        self._handle.remove()
+
+
+class AssistedDecodingStats:
+    """Thống kê cộng dồn của assisted decoding.
+
+    Mỗi lượt, model draft đề xuất vài token (mỗi token 1 forward của draft), model chính kiểm tra
+    tất cả trong 1 forward và nhận thêm đúng 1 token của chính nó. Do đó số token draft được chấp nhận
+    = số token sinh ra - số forward của model chính.
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self.generated_tokens = 0
+        self.target_forward_calls = 0
+        self.draft_forward_calls = 0
+
+    def update(self, generated_tokens: int, target_forward_calls: int, draft_forward_calls: int):
+        self.samples += 1
+        self.generated_tokens += generated_tokens
+        self.target_forward_calls += target_forward_calls
+        self.draft_forward_calls += draft_forward_calls
+
+    @property
+    def accepted_tokens(self):
+        return max(self.generated_tokens - self.target_forward_calls, 0)
+
+    @property
+    def acceptance_rate(self):
+        """Tỉ lệ token draft đề xuất được model chính chấp nhận."""
+        return self.accepted_tokens / self.draft_forward_calls if self.draft_forward_calls else 0.0
+
+    def as_dict(self):
+        return {
+            'samples': self.samples,
+            'generated_tokens': self.generated_tokens,
+            'target_forward_calls': self.target_forward_calls,
+            'draft_forward_calls': self.draft_forward_calls,
+            'accepted_tokens': self.accepted_tokens,
+            'acceptance_rate': self.acceptance_rate,
+            # Greedy thường: 1 token / forward của model chính
+            'tokens_per_target_forward': self.generated_tokens / self.target_forward_calls
+            if self.target_forward_calls else 0.0
+        }
+
+
+def assisted_generate(model, draft_model, encode: Dict, max_length_output: int, stats: AssistedDecodingStats = None):
+    """Greedy decoding có model draft hỗ trợ (`assistant_model` của transformers) cho 1 batch.
+
+    transformers 4.35 chỉ hỗ trợ assisted generation với batch size 1 và greedy/sampling, nên
+    batch được tách ra từng mẫu (bỏ padding) và chạy lần lượt. Output giống hệt greedy decoding
+    của model chính; model draft chỉ giảm số forward của model chính.
+
+    Args:
+        model: Model chính (đã ở device của `encode`)
+        draft_model: Model draft nhỏ, dùng chung tokenizer với model chính
+        encode: Dict tensor của batch (input_ids, attention_mask) trên device của model
+        max_length_output: Độ dài tối đa output
+        stats: Nơi cộng dồn thống kê acceptance (None -> không thống kê)
+
+    Returns:
+        List tensor token id của output từng mẫu, cùng thứ tự với batch
+    """
+    outputs = []
+    for input_ids, attention_mask in zip(encode['input_ids'], encode['attention_mask']):
+        input_ids = input_ids[attention_mask.bool()].unsqueeze(0)
+        with ForwardCounter(model) as target, ForwardCounter(draft_model) as draft:
+            tensor = model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                    assistant_model=draft_model, max_length=max_length_output,
+                                    num_beams=1, do_sample=False)
+        if stats is not None:
+            # Bỏ decoder start token khi đếm số token sinh ra
+            stats.update(tensor.shape[1] - 1, target.count, draft.count)
+        outputs.append(tensor[0])
+    return outputs
@@ -0,0 +1,134 @@
+""" Split long documents into overlapping sentence-aligned windows and merge QA pairs back. """
+import re
+from typing import List, NamedTuple
+
+__all__ = ('DocumentWindow', 'DocumentQA', 'DocumentChunker', 'merge_document_qa')
+
+
+class DocumentWindow(NamedTuple):
+    """1 cửa sổ của tài liệu: văn bản và vị trí ký tự bắt đầu/kết thúc trong tài liệu gốc."""
+    text: str
+    start: int
+    end: int
+
+
+class DocumentQA(NamedTuple):
+    """Cặp QA của tài liệu, kèm vị trí ký tự [start, end) của answer trong tài liệu gốc."""
+    question: str
+    answer: str
+    start: int
+    end: int
+
+
+def _normalize(text: str):
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+class DocumentChunker:
+    """Chia tài liệu dài thành các cửa sổ gối đầu nhau, mỗi cửa sổ gồm các câu liên tiếp.
+
+    Câu được tách bằng `SpacyPipeline.sentence` và đếm token bằng tokenizer của model. Mỗi cửa sổ
+    nhận thêm câu cho tới khi vượt `max_tokens`; cửa sổ sau bắt đầu lại từ các câu cuối của cửa sổ trước
+    (tổng không quá `overlap_tokens`), nên answer nằm gần ranh giới vẫn có đủ ngữ cảnh ở 1 trong 2 cửa sổ.
+    Câu đơn lẻ dài hơn `max_tokens` được giữ nguyên thành 1 cửa sổ (xử lý như input quá dài thông thường).
+    """
+
+    def __init__(self, tokenizer, spacy_module, max_tokens: int = 448, overlap_tokens: int = 64):
+        """
+        Args:
+            tokenizer: Tokenizer dùng để đếm token
+            spacy_module: SpacyPipeline để tách câu
+            max_tokens: Số token tối đa mỗi cửa sổ (chưa tính task prefix, <hl> và </s>)
+            overlap_tokens: Số token tối đa lặp lại giữa 2 cửa sổ liên tiếp
+        """
+        assert overlap_tokens < max_tokens, f'overlap_tokens ({overlap_tokens}) >= max_tokens ({max_tokens})'
+        self.tokenizer = tokenizer
+        self.spacy_module = spacy_module
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def sentence_spans(self, document: str):
+        """Vị trí ký tự (start, end) của từng câu trong tài liệu."""
+        spans, cursor = [], 0
+        for sentence in self.spacy_module.sentence(document):
+            start = document.find(sentence, cursor)
+            if start == -1:
+                continue
+            spans.append((start, start + len(sentence)))
+            cursor = start + len(sentence)
+        return spans
+
+    def split(self, document: str):
+        """Chia 1 tài liệu thành list DocumentWindow (1 cửa sổ nếu tài liệu đủ ngắn)."""
+        spans = self.sentence_spans(document)
+        if len(spans) == 0:
+            return [DocumentWindow(document, 0, len(document))]
+        lengths = [len(i) for i in self.tokenizer(
+            [document[s:e] for s, e in spans], add_special_tokens=False)['input_ids']]
+        windows, first = [], 0
+        while first < len(spans):
+            last, total = first, lengths[first]
+            while last + 1 < len(spans) and total + lengths[last + 1] <= self.max_tokens:
+                last += 1
+                total += lengths[last]
+            start, end = spans[first][0], spans[last][1]
+            windows.append(DocumentWindow(document[start:end], start, end))
+            if last + 1 == len(spans):
+                break
+            # Lùi lại các câu cuối làm phần gối đầu, luôn tiến ít nhất 1 câu
+            next_first, overlap = last + 1, 0
+            while next_first - 1 > first and overlap + lengths[next_first - 1] <= self.overlap_tokens:
+                next_first -= 1
+                overlap += lengths[next_first]
+            first = next_first
+        return windows
+
+
+def merge_document_qa(document: str, windows: List[DocumentWindow], window_qa: List):
+    """Gộp cặp QA của các cửa sổ về tài liệu gốc và bỏ trùng lặp ở phần gối đầu.
+
+    Answer được định vị trong cửa sổ sinh ra nó rồi đổi sang vị trí trong tài liệu. Cặp QA của 1 cửa sổ có
+    cùng thứ tự với answer (AE sinh answer theo thứ tự câu, span extractor theo vị trí), nên answer được tìm
+    tiếp từ sau answer trước đó (giống `DocumentChunker.sentence_spans`): answer xuất hiện nhiều lần được gán
+    đúng lần xuất hiện của nó thay vì luôn lấy lần đầu tiên. Cùng 1 answer
+    (cùng vị trí) sinh ra từ nhiều cửa sổ chỉ giữ lại cặp của cửa sổ mà answer nằm gần giữa nhất
+    (nhiều ngữ cảnh 2 bên nhất); câu hỏi trùng nhau (không phân biệt hoa thường, khoảng trắng) chỉ giữ 1.
+
+    Args:
+        document: Tài liệu gốc
+        windows: Các cửa sổ của tài liệu (kết quả DocumentChunker.split)
+        window_qa: List cặp (question, answer) của từng cửa sổ (None nếu cửa sổ không có answer)
+
+    Returns:
+        List DocumentQA theo thứ tự vị trí answer trong tài liệu (None nếu không có cặp nào)
+    """
+    best = {}
+    for window, pairs in zip(windows, window_qa):
+        cursor = 0
+        for question, answer in pairs or []:
+            position = window.text.find(answer, cursor)
+            if position == -1:
+                # Không theo thứ tự (ví dụ keyword của spaCy AE) -> lần xuất hiện đầu tiên trong cửa sổ
+                position = window.text.find(answer)
+            else:
+                cursor = position + len(answer)
+            if position == -1:
+                start = document.find(answer, window.start)
+                start = document.find(answer) if start == -1 else start
+                if start == -1:
+                    continue
+                distance = float('inf')
+            else:
+                start = window.start + position
+                distance = abs(position + len(answer) / 2 - len(window.text) / 2)
+            key = (start, start + len(answer))
+            if key not in best or distance < best[key][0]:
+                best[key] = (distance, DocumentQA(question, answer, *key))
+    output, seen = [], set()
+    for _, qa in sorted(best.values(), key=lambda x: (x[1].start, x[1].end)):
+        question = _normalize(qa.question)
+        if question in seen:
+            continue
+        seen.add(question)
+        output.append(qa)
+    return output if len(output) > 0 else None
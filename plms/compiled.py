@@ -0,0 +1,97 @@
+""" Compiled static-shape generation with torch.compile and fixed length buckets. """
+import os
+import time
+import logging
+from os.path import join as pj
+from typing import Dict, List
+import torch
+
+__all__ = ('DEFAULT_BUCKETS', 'COMPILE_CACHE_DIR', 'bucket_length', 'pad_to_bucket', 'configure_compile_cache',
+           'compile_model', 'warmup')
+
+# Độ dài input cố định (token): mỗi batch được pad lên bucket nhỏ nhất chứa được nó
+DEFAULT_BUCKETS = (64, 128, 256, 512)
+# Thư mục cache artifact của inductor (graph FX + kernel đã build), dùng lại giữa các lần chạy
+COMPILE_CACHE_DIR = pj(os.path.expanduser('~'), '.cache', 'plms', 'inductor')
+
+
+def bucket_length(length: int, buckets: List[int] = DEFAULT_BUCKETS):
+    """Bucket nhỏ nhất >= length (dài hơn bucket lớn nhất -> giữ nguyên độ dài)."""
+    for bucket in sorted(buckets):
+        if length <= bucket:
+            return bucket
+    return length
+
+
+def pad_to_bucket(encode: Dict, pad_token_id: int, buckets: List[int] = DEFAULT_BUCKETS):
+    """Pad input_ids/attention_mask của batch (bên phải) lên độ dài bucket, để encoder chỉ gặp vài shape cố định.
+
+    Token pad bị che bởi attention_mask nên output không đổi so với không pad.
+    """
+    length = encode['input_ids'].shape[1]
+    extra = bucket_length(length, buckets) - length
+    if extra == 0:
+        return encode
+    padded = dict(encode)
+    for key, value in (('input_ids', pad_token_id), ('attention_mask', 0)):
+        if key in encode:
+            tensor = encode[key]
+            padded[key] = torch.cat([tensor, tensor.new_full((tensor.shape[0], extra), value)], dim=1)
+    return padded
+
+
+def configure_compile_cache(cache_dir: str = None):
+    """Bật cache artifact của inductor trên đĩa để lần chạy sau không phải compile lại từ đầu.
+
+    Phải gọi trước lần compile đầu tiên trong process (biến môi trường do người dùng đặt sẵn được giữ nguyên).
+    """
+    cache_dir = cache_dir or COMPILE_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', cache_dir)
+    os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+    return os.environ['TORCHINDUCTOR_CACHE_DIR']
+
+
+def compile_model(model, cache_dir: str = None):
+    """Compile encoder và bước decoder (forward) của model seq2seq bằng `torch.compile`.
+
+    Encoder chỉ gặp vài độ dài cố định (input đã pad theo bucket, xem `pad_to_bucket`), nên được compile
+    theo shape (torch tự chuyển sang shape động nếu batch size thay đổi). Bước decoder (model.forward, gọi
+    1 lần cho mỗi token trong generate) có KV cache dài dần qua từng bước nên được compile với shape động,
+    tránh compile lại ở mỗi độ dài. transformers 4.35 chưa có static KV cache cho T5.
+
+    Args:
+        model: Model seq2seq PyTorch (đã ở device và eval mode)
+        cache_dir: Thư mục cache artifact của inductor (None -> COMPILE_CACHE_DIR)
+
+    Returns:
+        Chính model đó (forward của encoder và model đã được thay bằng bản compile)
+    """
+    if not hasattr(torch, 'compile'):
+        raise ImportError('compiled mode cần torch>=2.0 (torch.compile)')
+    logging.info(f'compiling model, inductor cache: {configure_compile_cache(cache_dir)}')
+    encoder = model.get_encoder()
+    encoder.forward = torch.compile(encoder.forward)
+    model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+
+def warmup(model, pad_token_id: int, buckets: List[int] = DEFAULT_BUCKETS, batch_size: int = 1,
+           num_beams: int = 1, max_length_output: int = 8):
+    """Chạy generate trên input giả cho từng bucket để compile trước khi nhận request thật.
+
+    Returns:
+        {bucket: số giây} thời gian lần chạy đầu tiên của từng bucket (chủ yếu là thời gian compile)
+    """
+    device = next(model.parameters()).device
+    seconds = {}
+    for bucket in sorted(buckets):
+        input_ids = torch.full((batch_size, bucket), pad_token_id, dtype=torch.long, device=device)
+        attention_mask = torch.ones_like(input_ids)
+        start = time.perf_counter()
+        with torch.no_grad():
+            model.generate(input_ids=input_ids, attention_mask=attention_mask, num_beams=num_beams,
+                           max_length=max_length_output)
+        seconds[bucket] = time.perf_counter() - start
+        logging.info(f'warm-up bucket {bucket}: {round(seconds[bucket], 2)}s')
+    return seconds
@@ -0,0 +1,84 @@
+""" Constrain answer extraction to spans of the input context. """
+from typing import List
+
+__all__ = ('SpanTrie', 'ContextSpanConstraint')
+
+
+class SpanTrie:
+    """Trie của mọi đoạn token liên tiếp (span) trong 1 chuỗi token, độ dài tối đa `max_span_length`.
+
+    Mỗi hậu tố của chuỗi được chèn vào trie (cắt ở `max_span_length`), nên 1 prefix thuộc trie khi và chỉ khi
+    nó là span của chuỗi, và các nhánh con của nó là mọi token có thể đi tiếp mà vẫn là span.
+    """
+
+    def __init__(self, segments: List[List[int]], max_span_length: int):
+        """
+        Args:
+            segments: Các đoạn token; span không được vượt qua ranh giới giữa 2 đoạn (ví dụ token <hl>)
+            max_span_length: Độ dài span tối đa (số token)
+        """
+        self.root = {}
+        for segment in segments:
+            for start in range(len(segment)):
+                node = self.root
+                for token in segment[start:start + max_span_length]:
+                    node = node.setdefault(token, {})
+
+    def next_tokens(self, prefix: List[int]):
+        """Các token có thể nối vào sau `prefix` để vẫn là span (list rỗng nếu prefix không phải span)."""
+        node = self.root
+        for token in prefix:
+            node = node.get(token)
+            if node is None:
+                return []
+        return list(node.keys())
+
+
+class ContextSpanConstraint:
+    """`prefix_allowed_tokens_fn` cho model.generate(): output chỉ được là 1 span của input.
+
+    Trie được xây từ chính `input_ids` của batch (bỏ task prefix, token đặc biệt như <hl>, </s>, pad),
+    nên không cần truyền context riêng và dùng được với mọi cách chia batch/sắp xếp input.
+    EOS chỉ được phép sau khi đã sinh ít nhất 1 token; nếu không còn token hợp lệ thì chỉ cho phép EOS.
+    """
+
+    def __init__(self, tries: List[SpanTrie], eos_token_id: int):
+        self.tries = tries
+        self.eos_token_id = eos_token_id
+
+    @classmethod
+    def from_batch(cls, input_ids, tokenizer, max_span_length: int, prefixes: List[str] = None):
+        """Xây trie cho từng dòng của batch.
+
+        Args:
+            input_ids: Tensor (batch x độ dài) input của encoder
+            tokenizer: Tokenizer của model
+            max_span_length: Độ dài span tối đa (thường là max_length_output)
+            prefixes: Các task prefix (ví dụ 'extract answers') cần bỏ khỏi đầu input
+        """
+        special = set(tokenizer.all_special_ids)
+        prefix_ids = [tokenizer.encode(f'{p}:', add_special_tokens=False) for p in prefixes or []]
+        tries = []
+        for row in input_ids.tolist():
+            for ids in prefix_ids:
+                if row[:len(ids)] == ids:
+                    row = row[len(ids):]
+                    break
+            segments, segment = [], []
+            for token in row:
+                if token in special:
+                    segments.append(segment)
+                    segment = []
+                else:
+                    segment.append(token)
+            segments.append(segment)
+            tries.append(SpanTrie([s for s in segments if len(s) > 0], max_span_length))
+        return cls(tries, tokenizer.eos_token_id)
+
+    def __call__(self, batch_id: int, decoder_input_ids):
+        # Bỏ decoder start token ở đầu output
+        prefix = decoder_input_ids.tolist()[1:]
+        allowed = self.tries[batch_id].next_tokens(prefix)
+        if len(prefix) > 0 or len(allowed) == 0:
+            allowed.append(self.eos_token_id)
+        return allowed
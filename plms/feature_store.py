@@ -0,0 +1,172 @@
+""" Memory-mapped columnar store for encoded features. """
+import os
+import json
+import shutil
+import hashlib
+from typing import List, Dict
+import numpy as np
+
+__all__ = ('FeatureStore', 'FeatureStoreWriter', 'fingerprint', 'tokenizer_fingerprint')
+
+# Tăng version khi thay đổi định dạng lưu trữ để cache cũ tự bị bỏ qua
+STORE_VERSION = 2
+META_FILE = 'meta.json'
+
+
+def fingerprint(*items) -> str:
+    """Tạo mã băm sha256 cho một dãy giá trị (chuỗi, số, list, dict... có thể chuyển sang JSON).
+
+    Args:
+        items: Các giá trị cần băm (thứ tự có ý nghĩa)
+
+    Returns:
+        Chuỗi hex sha256
+    """
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(json.dumps(item, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Mã băm của tokenizer: tên, lớp, từ điển và special token (gồm cả <hl> đã thêm vào)."""
+    if getattr(tokenizer, 'is_fast', False):
+        vocabulary = tokenizer.backend_tokenizer.to_str()
+    else:
+        vocabulary = sorted(tokenizer.get_vocab().items())
+    return fingerprint(type(tokenizer).__name__, tokenizer.name_or_path, len(tokenizer),
+                       tokenizer.all_special_tokens, vocabulary)
+
+
+def _column_files(path: str, column: str):
+    """Đường dẫn file dữ liệu và file offset của 1 cột."""
+    return os.path.join(path, f'{column}.bin'), os.path.join(path, f'{column}.offsets.bin')
+
+
+class FeatureStoreWriter:
+    """Ghi feature đã encode ra đĩa theo dạng cột, từng mẫu một (streaming).
+
+    Mỗi cột (input_ids, labels) gồm:
+    - `<cột>.bin`: toàn bộ token id nối liền nhau, kiểu int32
+    - `<cột>.offsets.bin`: vị trí bắt đầu của từng mẫu, kiểu int64 (n + 1 phần tử)
+    Dữ liệu được ghi vào thư mục tạm và chỉ đổi tên thành `path` khi close(), nên một
+    store dở dang (bị ngắt giữa chừng) không bao giờ bị đọc nhầm là cache hợp lệ.
+    """
+
+    def __init__(self, path: str, key: str, padding: Dict = None, pad_token_id: int = 0):
+        """
+        Args:
+            path: Thư mục store
+            key: Fingerprint của cache (tokenizer, độ dài tối đa, prefix, dữ liệu)
+            padding: {tên cột: độ dài} nếu cần pad khi đọc, None -> không pad
+            pad_token_id: Token id dùng để pad
+        """
+        self.path = path
+        self.tmp_path = f'{path}.tmp'
+        # dropped: index (trong dữ liệu gốc) của các mẫu bị drop khi encode, do nơi ghi store điền vào
+        self.meta = {'version': STORE_VERSION, 'key': key, 'padding': padding, 'pad_token_id': pad_token_id,
+                     'columns': None, 'size': 0, 'dropped': []}
+        self.files = {}
+        self.offsets = {}
+        if os.path.exists(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+
+    def append(self, feature: Dict):
+        """Ghi thêm 1 mẫu (dict có input_ids, có thể kèm labels)."""
+        if self.meta['columns'] is None:
+            self.meta['columns'] = [c for c in ['input_ids', 'labels'] if c in feature]
+            for c in self.meta['columns']:
+                self.files[c] = open(_column_files(self.tmp_path, c)[0], 'wb')
+                self.offsets[c] = [0]
+        for c in self.meta['columns']:
+            ids = np.asarray(feature[c], dtype=np.int32)
+            self.files[c].write(ids.tobytes())
+            self.offsets[c].append(self.offsets[c][-1] + len(ids))
+        self.meta['size'] += 1
+
+    def extend(self, features: List[Dict]):
+        """Ghi thêm nhiều mẫu."""
+        for feature in features:
+            self.append(feature)
+
+    def close(self):
+        """Hoàn tất: ghi offset + meta rồi đổi tên thư mục tạm thành thư mục store."""
+        for c in self.meta['columns'] or []:
+            self.files[c].close()
+            np.asarray(self.offsets[c], dtype=np.int64).tofile(_column_files(self.tmp_path, c)[1])
+        self.meta['columns'] = self.meta['columns'] or []
+        with open(os.path.join(self.tmp_path, META_FILE), 'w') as f:
+            json.dump(self.meta, f)
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.rename(self.tmp_path, self.path)
+
+
+class FeatureStore:
+    """Đọc feature từ store bằng memory-map (không nạp toàn bộ dữ liệu vào RAM).
+
+    Dùng như 1 list các dict: `len(store)`, `store[i]` -> {'input_ids', 'attention_mask', 'labels'}.
+    Token id của từng mẫu là view trực tiếp trên file (zero-copy), chỉ được pad khi store
+    được ghi với `padding`. `store.dropped` là index (trong dữ liệu gốc) của các mẫu bị drop khi encode.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Thư mục store đã được FeatureStoreWriter ghi ra
+        """
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.padding = self.meta['padding'] or {}
+        self.dropped = self.meta['dropped']
+        self.pad_token_id = self.meta['pad_token_id']
+        self.columns = {}
+        for c in self.meta['columns']:
+            data_file, offset_file = _column_files(path, c)
+            # np.memmap không map được file rỗng
+            data = np.memmap(data_file, dtype=np.int32, mode='r') if os.path.getsize(data_file) > 0 \
+                else np.zeros(0, dtype=np.int32)
+            self.columns[c] = (data, np.memmap(offset_file, dtype=np.int64, mode='r'))
+
+    @staticmethod
+    def exists(path: str, key: str = None):
+        """Kiểm tra store đã ghi xong tại `path` (và có đúng fingerprint `key` nếu truyền vào)."""
+        meta_file = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_file):
+            return False
+        with open(meta_file) as f:
+            meta = json.load(f)
+        return meta.get('version') == STORE_VERSION and (key is None or meta.get('key') == key)
+
+    def __len__(self):
+        return self.meta['size']
+
+    def lengths(self, column: str = 'input_ids'):
+        """Số token của từng mẫu (sau khi pad nếu store có padding)."""
+        if column in self.padding:
+            return np.full(len(self), self.padding[column], dtype=np.int64)
+        return np.diff(self.columns[column][1])
+
+    def _get(self, column: str, idx: int):
+        data, offsets = self.columns[column]
+        ids = data[offsets[idx]:offsets[idx + 1]]
+        if column not in self.padding:
+            return ids
+        return np.concatenate([ids, np.full(self.padding[column] - len(ids), self.pad_token_id, dtype=np.int32)])
+
+    def __getitem__(self, idx: int):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        input_ids = self._get('input_ids', idx)
+        length = int(self.columns['input_ids'][1][idx + 1] - self.columns['input_ids'][1][idx])
+        attention_mask = np.zeros(len(input_ids), dtype=np.int32)
+        attention_mask[:length] = 1
+        feature = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'labels' in self.columns:
+            feature['labels'] = self._get('labels', idx)
+        return feature
@@ -0,0 +1,146 @@
+""" Persistent content-addressed cache for generated text. """
+import os
+import sqlite3
+import logging
+import threading
+from os.path import join as pj
+from collections import OrderedDict
+from typing import List, Dict
+from .feature_store import fingerprint
+
+__all__ = ('GenerationCache', 'model_identity', 'DEFAULT_GENERATION_CACHE')
+
+# File SQLite mặc định khi bật cache mà không chỉ định đường dẫn
+DEFAULT_GENERATION_CACHE = pj(os.path.expanduser('~'), '.cache', 'plms', 'generation_cache.sqlite')
+
+# SQLite giới hạn số tham số trong 1 câu lệnh (mặc định 999)
+SQLITE_MAX_VARIABLES = 900
+
+
+def model_identity(model_name: str, model):
+    """Định danh model dùng trong khóa cache: tên + revision (commit hash trên hub nếu có).
+
+    Args:
+        model_name: Tên model trên hub hoặc đường dẫn local
+        model: Model đã nạp (có thể được bọc bởi DataParallel) hoặc config của model
+
+    Returns:
+        Chuỗi dạng `<tên>@<revision>`
+    """
+    model = getattr(model, 'module', model)
+    revision = getattr(getattr(model, 'config', model), '_commit_hash', None)
+    if revision is None and os.path.isdir(model_name):
+        # Model local: dùng thời điểm sửa file weight làm revision
+        weights = [pj(model_name, f) for f in os.listdir(model_name) if f.endswith(('.bin', '.safetensors'))]
+        revision = str(max([os.path.getmtime(f) for f in weights], default=0))
+    return f'{model_name}@{revision}'
+
+
+class GenerationCache:
+    """Cache kết quả generate theo nội dung input.
+
+    Khóa = sha256 của (model + revision, prefix tác vụ, chuỗi input cuối cùng sau khi chèn <hl>,
+    num_beams, max_length_output), nên cùng 1 input luôn cho cùng 1 khóa dù được gọi từ
+    generate_a, generate_q, answer_q hay generate_qa_end2end.
+    Tầng 1 là LRU trong RAM (giới hạn `capacity` phần tử), tầng 2 là file SQLite trên đĩa
+    (None -> chỉ dùng RAM). An toàn khi dùng từ nhiều thread.
+    """
+
+    def __init__(self, path: str = DEFAULT_GENERATION_CACHE, capacity: int = 10000):
+        """
+        Args:
+            path: File SQLite lưu cache (None -> chỉ cache trong RAM)
+            capacity: Số kết quả tối đa giữ trong RAM
+        """
+        self.path = path
+        self.capacity = capacity
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.deduplicated = 0
+        self.connection = None
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS generation (key TEXT PRIMARY KEY, output TEXT)')
+            self.connection.commit()
+
+    @staticmethod
+    def key(model_id: str, prefix_type: str, text: str, num_beams: int, max_length_output: int):
+        """Khóa cache của 1 input."""
+        return fingerprint(model_id, prefix_type, text, num_beams, max_length_output)
+
+    def _remember(self, key: str, output: str):
+        """Đưa kết quả vào LRU trong RAM, loại phần tử ít dùng nhất khi đầy."""
+        self.memory[key] = output
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def get_many(self, keys: List[str]):
+        """Tra cứu nhiều khóa cùng lúc (RAM trước, sau đó SQLite).
+
+        Args:
+            keys: Danh sách khóa (có thể trùng lặp, mỗi lần xuất hiện được tính 1 lượt tra cứu)
+
+        Returns:
+            Dict {khóa: output} của các khóa có trong cache
+        """
+        found = {}
+        with self.lock:
+            for k in set(keys):
+                if k in self.memory:
+                    self.memory.move_to_end(k)
+                    found[k] = self.memory[k]
+            missing = [k for k in set(keys) if k not in found]
+            if self.connection is not None:
+                for i in range(0, len(missing), SQLITE_MAX_VARIABLES):
+                    chunk = missing[i:i + SQLITE_MAX_VARIABLES]
+                    rows = self.connection.execute(
+                        f'SELECT key, output FROM generation WHERE key IN ({",".join("?" * len(chunk))})', chunk)
+                    for k, output in rows:
+                        found[k] = output
+                        self._remember(k, output)
+            hits = sum(k in found for k in keys)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, outputs: Dict[str, str]):
+        """Lưu nhiều kết quả (RAM + SQLite)."""
+        with self.lock:
+            for k, v in outputs.items():
+                self._remember(k, v)
+            if self.connection is not None:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO generation (key, output) VALUES (?, ?)', list(outputs.items()))
+                self.connection.commit()
+
+    def record_deduplicated(self, n: int):
+        """Ghi nhận số input trùng lặp trong 1 lần gọi đã được gộp lại (không generate lại)."""
+        with self.lock:
+            self.deduplicated += n
+
+    @property
+    def hit_rate(self):
+        """Tỉ lệ tra cứu trúng cache kể từ khi khởi tạo."""
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def stats(self):
+        """Thống kê cache: số lượt trúng/trượt, tỉ lệ trúng, số input trùng đã gộp, kích thước."""
+        with self.lock:
+            size = len(self.memory) if self.connection is None else \
+                self.connection.execute('SELECT COUNT(*) FROM generation').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate,
+                'deduplicated': self.deduplicated, 'memory_size': len(self.memory), 'size': size}
+
+    def clear(self):
+        """Xóa toàn bộ cache (RAM + SQLite) và reset thống kê."""
+        with self.lock:
+            self.memory.clear()
+            self.hits = self.misses = self.deduplicated = 0
+            if self.connection is not None:
+                self.connection.execute('DELETE FROM generation')
+                self.connection.commit()
+        logging.info(f'generation cache is cleared: {self.path}')
@@ -132,7 +132,7 @@ def generate_qa(
         input_answer = [input_answer] if type(input_answer) is str else input_answer
         batch = [highlight_sentence(input_text, i, None) for i in input_answer]
         if split_level is not None and split_level == "sentence":
-            batch = [[_i for _i in spacy.sentence(i) if _i.count(ADDITIONAL_SP_TOKENS['hl']) == 2] for i in batch]
+            batch = [[_i for _i in s if _i.count(ADDITIONAL_SP_TOKENS['hl']) == 2] for s in spacy.sentences(batch)]
             batch = [i[0] for i in batch if len(i) > 0]
             if len(batch) == 0:
                 raise AnswerNotFoundError(input_text)
@@ -2,13 +2,13 @@
 # IMPORT CÁC THƯ VIỆN CẦN THIẾT
 # ============================================================================
 import os
+import time
 import logging
-import pickle  # Dùng để lưu/đọc object Python dưới dạng binary
+import threading
 import re  # Regular expression để xử lý chuỗi
 import urllib  # Kiểm tra kết nối internet
 from itertools import chain  # Nối nhiều list lại thành một
 from typing import List, Dict  # Type hints cho Python
-from multiprocessing import Pool  # Xử lý song song đa luồng
 import numpy as np
 from tqdm import tqdm  # Thanh tiến trình
 import torch  # PyTorch framework
@@ -16,6 +16,22 @@ from torch.nn import functional  # Hàm loss và activation
 import transformers  # Thư viện Hugging Face Transformers
 from .exceptions import ExceedMaxLengthError, HighlightNotFoundError, AnswerNotFoundError
 from .spacy_module import SpacyPipeline, VALID_METHODS
+from .scheduler import TokenBudgetScheduler
+from .feature_store import FeatureStore, FeatureStoreWriter, fingerprint, tokenizer_fingerprint
+from .generation_cache import GenerationCache, model_identity
+from .pipeline import PipelinedQAG
+from .quantization import quantize_model, quantized_cache_path, load_quantized, save_quantized
+from .onnx_backend import onnx_cache_path, load_onnx_model, export_onnx_model, VALID_BACKENDS
+from .parallel_inference import DeviceShardedExecutor
+from .assisted_decoding import AssistedDecodingStats, assisted_generate
+from .constrained_decoding import ContextSpanConstraint
+from .adaptive_decoding import DEFAULT_LOGPROB_THRESHOLD, AdaptiveDecodingStats, adaptive_generate
+from .span_extractor import is_span_extractor, load_span_extractor, extract_spans
+from .chunking import DocumentChunker, merge_document_qa
+from .compiled import DEFAULT_BUCKETS, compile_model, pad_to_bucket, warmup
+from .model_registry import ModelRegistry, default_registry
+from .tokenization_pool import TokenizationPool
+from .profiling import stage, active_profiler
 
 # Xuất các class/function chính của module này
 __all__ = ('TransformersQG', 'ADDITIONAL_SP_TOKENS', 'TASK_PREFIX', 'clean', 'internet_connection')
@@ -51,6 +67,9 @@ NUM_WORKERS = int(os.getenv('NUM_WORKERS', '0'))
 # Có sử dụng xử lý song song (multiprocessing) hay không
 PARALLEL_PROCESSING = bool(int(os.getenv('PARALLEL_PROCESSING', '0')))
 
+# Số mẫu được tokenize trong 1 lần gọi fast tokenizer
+ENCODE_CHUNK_SIZE = int(os.getenv('ENCODE_CHUNK_SIZE', '4096'))
+
 # Model mặc định cho từng ngôn ngữ
 DEFAULT_MODELS = {
     'vi': 'VietAI/vit5-base'  # Model tiếng Việt từ VietAI
@@ -61,30 +80,6 @@ DEFAULT_MODELS = {
 # HÀM TIỆN ÍCH (UTILITY FUNCTIONS)
 # ============================================================================
 
-def pickle_save(obj, path: str):
-    """Lưu object Python ra file binary bằng pickle.
-    
-    Args:
-        obj: Object Python cần lưu (có thể là dict, list, model state, v.v.)
-        path: Đường dẫn file đích để lưu
-    """
-    with open(path, "wb") as fp:
-        pickle.dump(obj, fp)
-
-
-def pickle_load(path: str):
-    """Đọc lại object Python từ file pickle đã lưu trước đó.
-    
-    Args:
-        path: Đường dẫn file pickle cần đọc
-        
-    Returns:
-        Object Python đã được lưu trong file
-    """
-    with open(path, "rb") as fp:
-        return pickle.load(fp)
-
-
 def clean(string):
     """Xóa khoảng trắng thừa ở đầu và cuối chuỗi.
     
@@ -103,6 +98,40 @@ def clean(string):
     return None
 
 
+def context_window(context: str, highlight: str, offsets: List, window: int):
+    """Cắt context còn khoảng `window` token quanh highlight (lần xuất hiện đầu tiên, giống EncodePlus).
+
+    Highlight luôn được giữ nguyên vẹn; số token còn lại được chia đều 2 bên, bên nào chạm đầu/cuối
+    context thì phần dư chuyển sang bên kia. Context ngắn hơn `window` hoặc không tìm thấy highlight
+    -> giữ nguyên.
+
+    Args:
+        context: Văn bản gốc
+        highlight: Câu/answer cần giữ (None -> giữ nguyên context)
+        offsets: Vị trí ký tự (bắt đầu, kết thúc) của từng token trong context
+        window: Số token tối đa của context sau khi cắt
+
+    Returns:
+        Chuỗi con của context
+    """
+    offsets = [(s, e) for s, e in offsets if e > s]
+    if highlight is None or len(offsets) <= window:
+        return context
+    char_start = context.find(highlight)
+    if char_start == -1:
+        return context
+    char_end = char_start + len(highlight)
+    inside = [n for n, (s, e) in enumerate(offsets) if s < char_end and char_start < e]
+    if len(inside) == 0:
+        return context
+    first, last = inside[0], inside[-1]
+    remaining = max(window - (last - first + 1), 0)
+    left = min(remaining // 2, first)
+    right = min(remaining - left, len(offsets) - 1 - last)
+    left = min(remaining - right, first)
+    return context[min(offsets[first - left][0], char_start):max(offsets[last + right][1], char_end)]
+
+
 def internet_connection(host='http://google.com'):
     """Kiểm tra xem có kết nối internet hay không.
     
@@ -124,7 +153,9 @@ def load_language_model(model_name,
                         use_auth_token: bool = False,
                         torch_dtype=None,
                         device_map: str = None,
-                        low_cpu_mem_usage: bool = False):
+                        low_cpu_mem_usage: bool = False,
+                        quantize: bool = False,
+                        backend: str = 'torch'):
     """Tải tokenizer và model từ Hugging Face, bổ sung special token cần thiết.
 
     Hàm này thực hiện các bước:
@@ -133,6 +164,8 @@ def load_language_model(model_name,
     3. Chọn đúng class model theo config.model_type (T5, MT5, BART, MBART, etc.)
     4. Thêm token đặc biệt <hl> để đánh dấu span highlight trong input
     5. Resize embedding layer để phù hợp với tokenizer mới
+    6. (quantize=True) Quantize int8 các lớp Linear cho inference trên CPU, lưu cache để lần sau nạp nhanh
+    7. (backend='onnx') Export sang ONNX 1 lần, các lần sau nạp thẳng graph ONNX đã lưu
     
     Args:
         model_name: Tên model trên Hugging Face hub hoặc đường dẫn local
@@ -141,6 +174,8 @@ def load_language_model(model_name,
         torch_dtype: Kiểu dữ liệu tensor (float32, float16, bfloat16, etc.)
         device_map: Sơ đồ phân bổ model lên các thiết bị
         low_cpu_mem_usage: Giảm bộ nhớ CPU khi tải model
+        quantize: Quantize động int8 các lớp Linear (chỉ dùng cho inference trên CPU)
+        backend: 'torch' (mặc định) hoặc 'onnx' (ONNX Runtime trên CPU, chỉ dùng cho inference)
         
     Returns:
         tuple: (tokenizer, model, config)
@@ -156,6 +191,27 @@ def load_language_model(model_name,
     config = transformers.AutoConfig.from_pretrained(
         model_name, local_files_only=local_files_only, cache_dir=cache_dir, use_auth_token=use_auth_token)
     
+    # Token <hl> dùng để đánh dấu câu trả lời trong context
+    tokenizer.add_special_tokens({'additional_special_tokens': list(ADDITIONAL_SP_TOKENS.values())})
+
+    if backend not in VALID_BACKENDS:
+        raise ValueError(f'unknown backend: {backend}, choose from {VALID_BACKENDS}')
+    assert not (quantize and backend == 'onnx'), '`quantize` is only available for the torch backend'
+
+    # Graph ONNX đã export từ trước -> nạp thẳng, bỏ qua weight PyTorch
+    if backend == 'onnx':
+        onnx_path = onnx_cache_path(model_name, config, len(tokenizer))
+        model = load_onnx_model(onnx_path)
+        if model is not None:
+            return tokenizer, model, config
+
+    # Model int8 đã quantize từ trước -> nạp thẳng, bỏ qua weight fp32
+    if quantize:
+        quantized_path = quantized_cache_path(model_name, config, len(tokenizer))
+        model = load_quantized(quantized_path)
+        if model is not None:
+            return tokenizer, model, config
+
     # Chọn class model phù hợp theo loại kiến trúc (mỗi loại có class riêng)
     if config.model_type == 't5':  # T5 model requires T5ForConditionalGeneration class
         model_class = transformers.T5ForConditionalGeneration.from_pretrained
@@ -185,12 +241,18 @@ def load_language_model(model_name,
     # Tải model với các tham số đã chuẩn bị
     model = model_class(model_name, **param)
     
-    # Đồng bộ tokenizer/model với token đặc biệt (<hl>) dùng trong pipeline QG
-    # Token <hl> dùng để đánh dấu câu trả lời trong context
-    tokenizer.add_special_tokens({'additional_special_tokens': list(ADDITIONAL_SP_TOKENS.values())})
-    
-    # Resize embedding layer của model để khớp với số token mới trong tokenizer
+    # Đồng bộ tokenizer/model với token đặc biệt (<hl>) dùng trong pipeline QG:
+    # resize embedding layer của model để khớp với số token mới trong tokenizer
     model.resize_token_embeddings(len(tokenizer))
+
+    # Quantize int8 và lưu cache cho lần nạp sau
+    if quantize:
+        model = quantize_model(model)
+        save_quantized(model, quantized_path)
+
+    # Export sang ONNX và lưu graph cho lần nạp sau
+    if backend == 'onnx':
+        model = export_onnx_model(model, tokenizer, onnx_path)
     
     return tokenizer, model, config
 
@@ -272,6 +334,12 @@ class Dataset(torch.utils.data.Dataset):
         """Trả về số lượng sample trong dataset."""
         return len(self.data)
 
+    def lengths(self):
+        """Số token input của từng sample (FeatureStore đọc trực tiếp từ offset, không cần duyệt dữ liệu)."""
+        if isinstance(self.data, FeatureStore):
+            return self.data.lengths().tolist()
+        return [len(i['input_ids']) for i in self.data]
+
     def to_tensor(self, name, data):
         """Chuyển data thành tensor với dtype phù hợp.
         
@@ -298,6 +366,101 @@ class Dataset(torch.utils.data.Dataset):
         return {k: self.to_tensor(k, v) for k, v in self.data[idx].items()}
 
 
+class PackedDataset(torch.utils.data.Dataset):
+    """Feature dạng đóng gói: token id chưa pad của mọi mẫu nối liền nhau (int32) + offset của từng mẫu.
+
+    Mỗi mẫu chỉ là 1 view trên mảng chung (không tạo list Python hay tensor cho từng mẫu), việc pad,
+    attention_mask và labels bỏ qua trong loss do PackedCollator tạo theo từng batch. Cùng định dạng cột
+    với FeatureStore nên store trên đĩa được dùng trực tiếp (memory-map, không copy).
+    """
+
+    def __init__(self, columns: Dict):
+        """
+        Args:
+            columns: {tên cột: (mảng token id int32 nối liền, mảng offset int64 gồm n + 1 phần tử)}
+        """
+        self.columns = columns
+        self.size = len(columns['input_ids'][1]) - 1 if 'input_ids' in columns else 0
+
+    @classmethod
+    def pack(cls, features):
+        """Đóng gói feature (list dict, FeatureStore hoặc PackedDataset) thành PackedDataset.
+
+        Feature đã pad sẵn thì input_ids được cắt theo attention_mask; labels được giữ nguyên.
+        Không có feature nào (kể cả FeatureStore rỗng) -> dataset rỗng vẫn có cột input_ids.
+        """
+        if isinstance(features, PackedDataset):
+            return features
+        columns = dict(features.columns) if isinstance(features, FeatureStore) else {}
+        for c in ['input_ids', 'labels']:
+            if isinstance(features, FeatureStore) or len(features) == 0 or c not in features[0]:
+                continue
+            rows = [np.asarray(f[c], dtype=np.int32) for f in features]
+            if c == 'input_ids':
+                rows = [r[:int(np.sum(f['attention_mask']))] if 'attention_mask' in f else r
+                        for r, f in zip(rows, features)]
+            offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum([len(r) for r in rows], out=offsets[1:])
+            columns[c] = (np.concatenate(rows) if len(rows) > 0 else np.zeros(0, dtype=np.int32), offsets)
+        if 'input_ids' not in columns:
+            columns['input_ids'] = (np.zeros(0, dtype=np.int32), np.zeros(1, dtype=np.int64))
+        return cls(columns)
+
+    def __len__(self):
+        return self.size
+
+    def lengths(self):
+        """Số token input của từng mẫu (tính từ offset, không duyệt dữ liệu)."""
+        return np.diff(self.columns['input_ids'][1])
+
+    def __getitem__(self, idx):
+        """Dict {tên cột: mảng int32 1 chiều} của mẫu thứ idx (view, không copy)."""
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return {c: data[offsets[idx]:offsets[idx + 1]] for c, (data, offsets) in self.columns.items()}
+
+
+class PackedCollator:
+    """Gộp các mẫu của PackedDataset thành batch, pad tới mẫu dài nhất của batch.
+
+    Toàn bộ batch được xử lý bằng numpy theo dạng vector: token của các mẫu được nối lại và ghi 1 lần
+    vào ma trận đã pad bằng mask `vị trí < độ dài`. attention_mask lấy từ chính mask đó, labels được pad
+    bằng CE_IGNORE_INDEX (bị bỏ qua khi tính loss).
+    """
+
+    def __init__(self, pad_token_id: int):
+        """
+        Args:
+            pad_token_id: Token id dùng để pad `input_ids`
+        """
+        self.pad_token_id = pad_token_id
+
+    @staticmethod
+    def pad(rows: List, value: int):
+        """Pad list mảng 1 chiều thành tensor (số mẫu x độ dài lớn nhất), trả về (tensor, mask)."""
+        lengths = np.fromiter((len(r) for r in rows), dtype=np.int64, count=len(rows))
+        mask = np.arange(lengths.max(initial=0)) < lengths[:, None]
+        padded = np.full(mask.shape, value, dtype=np.int64)
+        padded[mask] = np.concatenate(rows) if len(rows) > 0 else []
+        return torch.from_numpy(padded), torch.from_numpy(mask)
+
+    def __call__(self, batch: List[Dict]):
+        """
+        Args:
+            batch: List dict mảng token id (output của PackedDataset.__getitem__)
+
+        Returns:
+            Dict tensor 2 chiều: input_ids, attention_mask (và labels nếu có)
+        """
+        input_ids, mask = self.pad([i['input_ids'] for i in batch], self.pad_token_id)
+        output = {'input_ids': input_ids, 'attention_mask': mask.long()}
+        if 'labels' in batch[0]:
+            output['labels'] = self.pad([i['labels'] for i in batch], CE_IGNORE_INDEX)[0]
+        return output
+
+
 class EncodePlus:
     """Wrapper cho bước tokenize input/output, có thể dùng trong multiprocessing.
     
@@ -372,19 +535,10 @@ class EncodePlus:
             Dict feature đã tokenized (input_ids, attention_mask, có thể kèm labels)
             hoặc None nếu drop_overflow_error_text=True và mẫu quá dài
         """
-        # Bước 1: Chèn token <hl> quanh span câu trả lời để model biết vị trí cần hỏi
-        # Ví dụ: "Hà Nội là thủ đô" + highlight="thủ đô" -> "Hà Nội là <hl> thủ đô <hl>"
-        if input_highlight is not None:
-            position = input_sequence.find(input_highlight)
-            if position == -1:
-                if self.drop_highlight_error_text:
-                    return None
-                raise HighlightNotFoundError(input_highlight, input_sequence)
-            input_sequence = '{0}{1} {2} {1}{3}'.format(
-                input_sequence[:position], ADDITIONAL_SP_TOKENS['hl'], input_highlight,
-                input_sequence[position+len(input_highlight):])
-        if self.prefix is not None:
-            input_sequence = f'{self.prefix}: {input_sequence}'
+        # Bước 1 + 2: Chèn <hl> quanh span cần đánh dấu và thêm task prefix
+        input_sequence = self.build_input(input_sequence, input_highlight)
+        if input_sequence is None:
+            return None
 
         # Bước 3: Xử lý overlength (mẫu quá dài)
         # Có 3 chế độ:
@@ -412,6 +566,129 @@ class EncodePlus:
             encode['labels'] = self.tokenizer.encode(output_sequence, **self.param_out)
         return encode
 
+    def build_input(self, input_sequence: str, input_highlight: str = None):
+        """Tạo chuỗi input cuối cùng: chèn <hl> quanh highlight và thêm task prefix.
+
+        Ví dụ: "Hà Nội là thủ đô" + highlight="thủ đô" -> "generate question: Hà Nội là <hl> thủ đô <hl>"
+
+        Args:
+            input_sequence: Câu/văn bản đầu vào (context)
+            input_highlight: Chuỗi con cần đánh dấu bằng <hl> (None -> không đánh dấu)
+
+        Returns:
+            Chuỗi input đã xử lý, hoặc None nếu không tìm thấy highlight và drop_highlight_error_text=True
+        """
+        if input_highlight is not None:
+            position = input_sequence.find(input_highlight)
+            if position == -1:
+                if self.drop_highlight_error_text:
+                    return None
+                raise HighlightNotFoundError(input_highlight, input_sequence)
+            input_sequence = '{0}{1} {2} {1}{3}'.format(
+                input_sequence[:position], ADDITIONAL_SP_TOKENS['hl'], input_highlight,
+                input_sequence[position+len(input_highlight):])
+        if self.prefix is not None:
+            input_sequence = f'{self.prefix}: {input_sequence}'
+        return input_sequence
+
+    def encode_batch(self, data: List):
+        """Tokenize cả một chunk dữ liệu bằng 1 lần gọi fast tokenizer (Rust).
+
+        Khác với encode_plus (tokenize từng mẫu tới 3 lần: check input, check output, encode thật),
+        mỗi chuỗi ở đây chỉ được tokenize 1 lần. Để vẫn phát hiện được mẫu quá dài, tokenizer cắt ở
+        max_length + 1: mẫu nào có đúng max_length + 1 token là mẫu vượt độ dài. Các mẫu hợp lệ cho
+        kết quả giống hệt encode_plus. Tokenizer không phải fast tokenizer -> quay về encode_plus.
+
+        Args:
+            data: List tuple (input_sequence, output_sequence, input_highlight)
+
+        Returns:
+            List feature cùng độ dài và thứ tự với `data` (None ở vị trí mẫu bị drop)
+        """
+        if not getattr(self.tokenizer, 'is_fast', False):
+            return [self.encode_plus(*i) for i in data]
+
+        # Bước 1: Highlight + prefix cho cả chunk
+        with stage('highlight', samples=len(data)):
+            inputs = [self.build_input(i[0], i[2]) for i in data]
+        valid = [n for n, i in enumerate(inputs) if i is not None]
+        with_output = [n for n in valid if data[n][1] is not None]
+        output = [None] * len(data)
+        if len(valid) == 0:
+            return output
+
+        # Bước 2: Tokenize 1 lần cho cả chunk (input và output)
+        check_overflow = self.drop_overflow_error_text or not self.skip_overflow_error
+        param_in = {'truncation': True, 'max_length': self.max_length + 1 if check_overflow else self.max_length}
+        param_out = {'truncation': True,
+                     'max_length': self.max_length_output + 1 if check_overflow else self.max_length_output}
+        with stage('tokenize', samples=len(valid)) as s:
+            if type(self.tokenizer) is transformers.models.mbart.tokenization_mbart_fast.MBartTokenizerFast:
+                encode = self.tokenizer([inputs[n] for n in valid], **param_in)
+            else:
+                encode = self.tokenizer(text_target=[inputs[n] for n in valid], **param_in)
+            labels = {}
+            if len(with_output) > 0:
+                labels = dict(zip(with_output, self.tokenizer([data[n][1] for n in with_output], **param_out)['input_ids']))
+            s.update(tokens=sum(len(i) for i in encode['input_ids']))
+
+        # Bước 3: Quyết định drop/raise từ độ dài vừa tokenize, sau đó pad nếu cần
+        for position, n in enumerate(valid):
+            feature = {k: encode[k][position] for k in encode.keys()}
+            if n in labels:
+                feature['labels'] = labels[n]
+            if check_overflow and (len(feature['input_ids']) > self.max_length or
+                                   len(feature.get('labels', [])) > self.max_length_output):
+                if not self.drop_overflow_error_text:  # Báo lỗi nếu không cho phép drop
+                    raise ExceedMaxLengthError(self.max_length)
+                continue  # Loại bỏ mẫu overlength
+            if 'padding' in self.param_in:
+                feature = self.pad(feature)
+            output[n] = feature
+        return output
+
+    def pad(self, feature: Dict):
+        """Pad feature của 1 mẫu về max_length (input) và max_length_output (labels)."""
+        pad_token_id = self.tokenizer.pad_token_id
+        padded = {}
+        for k, v in feature.items():
+            length = self.max_length_output if k == 'labels' else self.max_length
+            value = pad_token_id if k in ['input_ids', 'labels'] else 0
+            padded[k] = list(v) + [value] * (length - len(v))
+        return padded
+
+
+class LazyAttribute:
+    """Thuộc tính được nạp ở lần truy cập đầu tiên bằng method `loader` của object.
+
+    Loader gán giá trị cho thuộc tính (có thể nạp nhiều thuộc tính cùng lúc, ví dụ tokenizer + model).
+    Gán giá trị trực tiếp (kể cả None) thì không bao giờ gọi loader. Việc nạp được khóa bằng
+    `_load_lock` của object nên nhiều thread truy cập cùng lúc chỉ nạp 1 lần.
+    """
+
+    def __init__(self, loader: str):
+        self.loader = loader
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = f'_{name}'
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        if self.name not in obj.__dict__:
+            with obj.__dict__['_load_lock']:
+                if self.name not in obj.__dict__:
+                    getattr(obj, self.loader)()
+        return obj.__dict__[self.name]
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.name] = value
+
+
+# Các thành phần của TransformersQG chỉ nạp khi dùng tới
+LAZY_COMPONENTS = ('model_ae', 'spacy_module', 'model_draft', 'inference_pool', 'tokenization_pool')
+
 
 # ============================================================================
 # CLASS TRANSFORMERSQG - MODEL CHÍNH
@@ -430,15 +707,32 @@ class TransformersQG:
     - Multitask model: 1 model làm nhiều task
     - Pipeline model: model AE riêng + model QG riêng
     - SpaCy backend: dùng spaCy cho AE (keyword extraction)
+
+    Chỉ model chính được nạp khi khởi tạo. Model AE riêng, spaCy, model draft và inference pool
+    được nạp ở lần dùng đầu tiên (ví dụ chỉ gọi generate_q với answer có sẵn thì không nạp spaCy).
     """
+    spacy_module = LazyAttribute('_load_spacy_module')
+    answer_model_type = LazyAttribute('_load_answer_model_type')
+    tokenizer_ae = LazyAttribute('_load_answer_model')
+    model_ae = LazyAttribute('_load_answer_model')
+    add_prefix_ae = LazyAttribute('_load_answer_model')
+    model_draft = LazyAttribute('_load_draft_model')
+    assisted_stats = LazyAttribute('_load_draft_model')
+    inference_pool = LazyAttribute('_load_inference_pool')
+    tokenization_pool = LazyAttribute('_load_tokenization_pool')
 
     def __init__(self,
                  model: str = None,
                  max_length: int = 512,
                  max_length_output: int = 256,
                  model_ae: str = None,
+                 model_draft: str = None,
                  max_length_ae: int = 512,
                  max_length_output_ae: int = 64,
+                 constrained_ae: bool = False,
+                 adaptive_decoding: bool = False,
+                 adaptive_threshold: float = DEFAULT_LOGPROB_THRESHOLD,
+                 context_window: int = None,
                  cache_dir: str = None,
                  add_prefix: bool = None,
                  language: str = 'vi',
@@ -454,7 +748,20 @@ class TransformersQG:
                  is_qg: bool = None,
                  is_qag: bool = None,
                  is_qa: bool = None,
-                 is_ae: bool = None):
+                 is_ae: bool = None,
+                 length_bucketing: bool = False,
+                 max_tokens: int = None,
+                 generation_cache=None,
+                 quantize: bool = False,
+                 backend: str = 'torch',
+                 inference_workers: int = None,
+                 threads_per_worker: int = None,
+                 spacy_n_process: int = 1,
+                 compiled: bool = False,
+                 compile_buckets: List[int] = None,
+                 compile_num_beams: int = 4,
+                 compile_batch_size: int = 1,
+                 model_registry=None):
         """Khởi tạo model và các thành phần phụ trợ cho sinh câu hỏi.
 
         Args:
@@ -462,8 +769,20 @@ class TransformersQG:
             max_length: Độ dài tối đa input (số token)
             max_length_output: Độ dài tối đa output (số token)
             model_ae: Tên model cho Answer Extraction (nếu riêng)
+            model_draft: Model draft nhỏ (cùng tokenizer, ví dụ vit5-small fine-tune cùng tác vụ) cho assisted
+                         decoding: draft đề xuất token, model chính kiểm tra. Chỉ dùng khi generate greedy
+                         (num_beams=1) bằng model chính, output giống hệt greedy không có draft
             max_length_ae: Độ dài tối đa input cho model AE
             max_length_output_ae: Độ dài tối đa output cho model AE
+            constrained_ae: Ràng buộc output của AE (multitask/pipeline) chỉ được là 1 span token của context,
+                            nên mọi answer sinh ra đều nằm trong context và không bị lọc bỏ
+            adaptive_decoding: Khi num_beams > 1: decode greedy trước, chỉ decode lại bằng beam search các input
+                               có log-prob trung bình mỗi token < adaptive_threshold, hoặc (AE) answer không phải
+                               1 span của context. Thống kê ở self.adaptive_stats
+            adaptive_threshold: Ngưỡng log-prob trung bình mỗi token của adaptive_decoding (cao hơn -> nhiều input
+                                phải decode lại hơn, chất lượng gần beam search hơn)
+            context_window: Chỉ giữ khoảng K token context quanh câu/answer được highlight trong input của AE và
+                            QG (None -> giữ toàn bộ context). Nhỏ hơn -> encode nhanh hơn nhưng ít ngữ cảnh hơn
             cache_dir: Thư mục cache model/tokenizer
             add_prefix: Có thêm prefix tác vụ vào input hay không
             language: Ngôn ngữ dùng cho pipeline spaCy (ví dụ: 'vi', 'en')
@@ -480,7 +799,38 @@ class TransformersQG:
             is_qag: Model có hỗ trợ Question-Answer Generation không
             is_qa: Model có hỗ trợ Question Answering không
             is_ae: Model có hỗ trợ Answer Extraction không
+            length_bucketing: True -> khi inference, sắp xếp input theo số token và chỉ pad
+                              mỗi batch tới input dài nhất (kết quả vẫn trả về đúng thứ tự ban đầu)
+            max_tokens: Ngân sách token mỗi batch khi inference (input tokens x num_beams). Khi đặt giá trị này
+                        (hoặc không truyền batch_size), batch được chia theo ngân sách và tự chia nhỏ khi OOM
+            generation_cache: Cache kết quả generate theo nội dung input, dùng chung cho mọi tác vụ.
+                              True -> file SQLite mặc định, str -> đường dẫn file SQLite,
+                              GenerationCache -> dùng chung cache có sẵn, None -> tắt
+            quantize: Inference trên CPU với các lớp Linear đã quantize động int8 (weight int8 được cache
+                      trên đĩa). Bật tùy chọn này thì model luôn chạy trên CPU, kể cả khi có GPU
+            backend: Backend chạy generate: 'torch' hoặc 'onnx' (ONNX Runtime trên CPU, graph encoder/decoder
+                     có KV cache được export 1 lần và lưu cạnh model). Chỉ dùng cho inference
+            inference_workers: Số process worker inference trên CPU (None -> chạy trong process hiện tại).
+                               Các batch của generate_prediction được chia cho các worker, weight dùng chung
+                               qua shared memory. Chỉ áp dụng khi chạy trên CPU với backend 'torch'
+                               (nhiều GPU thì batch luôn được chia cho các GPU, mỗi GPU 1 bản model)
+            threads_per_worker: Số thread torch của mỗi worker (None -> chia đều số core cho các worker)
+            spacy_n_process: Số process spaCy khi tách câu theo batch (`SpacyPipeline.sentences`)
+            compiled: Chế độ compiled cho inference: encoder và bước decoder được `torch.compile` (artifact cache
+                      trên đĩa), input được pad lên các độ dài cố định `compile_buckets` và mỗi bucket được
+                      warm-up 1 lần lúc nạp model. Chỉ dùng với backend 'torch', không quantize, không device_map
+            compile_buckets: Các độ dài input cố định của chế độ compiled (None -> DEFAULT_BUCKETS)
+            compile_num_beams: Số beam khi warm-up ở chế độ compiled, nên bằng num_beams dùng khi generate
+                               (adaptive_decoding -> warm-up thêm greedy)
+            compile_batch_size: Batch size khi warm-up ở chế độ compiled, nên bằng batch_size dùng khi generate
+            model_registry: Nạp checkpoint (model chính, model AE, model draft) qua registry dùng chung trong process:
+                            instance khác cùng checkpoint dùng lại weight đã nạp, checkpoint không còn ai dùng
+                            bị loại theo LRU khi vượt ngân sách RAM/VRAM. True -> registry mặc định (ngân sách
+                            MODEL_REGISTRY_RAM_GB / MODEL_REGISTRY_VRAM_GB), ModelRegistry -> dùng registry đó,
+                            None -> nạp riêng. Chỉ dùng cho inference (weight dùng chung không được train),
+                            không dùng với chế độ compiled. Gọi `release()` khi không dùng instance nữa
         """
+        self._load_lock = threading.RLock()
 
         # Bước 1: Nếu không truyền model, lấy model mặc định theo ngôn ngữ
         if model is None:
@@ -508,10 +858,45 @@ class TransformersQG:
         self.model_name_ae = model_ae
         self.max_length_ae = max_length_ae
         self.max_length_output_ae = max_length_output_ae
+        self.constrained_ae = constrained_ae
+        self.adaptive_decoding = adaptive_decoding
+        self.adaptive_threshold = adaptive_threshold
+        self.adaptive_stats = AdaptiveDecodingStats()
+        self.context_window = context_window
+        self.length_bucketing = length_bucketing
+        self.max_tokens = max_tokens
+        self.pipeline_stats = None  # Thống kê lần chạy generate_qa(pipelined=True) gần nhất
+        if generation_cache is True:
+            generation_cache = GenerationCache()
+        elif isinstance(generation_cache, str):
+            generation_cache = GenerationCache(generation_cache)
+        self.generation_cache = generation_cache or None
         # Bước 4: Nạp model chính (QG/QA/QAG) từ Hugging Face
-        self.tokenizer, self.model, config = load_language_model(
-            self.model_name, cache_dir=cache_dir, use_auth_token=use_auth_token, device_map=device_map,
-            torch_dtype=torch_dtype, low_cpu_mem_usage=low_cpu_mem_usage)
+        self.quantize = quantize
+        self.backend = backend
+        self.load_times = {}  # Thời gian nạp (giây) của từng thành phần, xem startup_report()
+        # Thiết bị tính toán (CPU/GPU): model int8 (quantize) và backend ONNX chỉ chạy trên CPU
+        cpu_only = quantize or backend == 'onnx'
+        self.device = 'cuda' if torch.cuda.device_count() > 0 and not cpu_only else 'cpu'
+        # Chế độ compiled (compile + warm-up ở bước 6) được quyết định trước khi nạp, vì nằm trong khóa registry
+        if compiled and (backend != 'torch' or quantize or device_map is not None):
+            logging.warning('compiled mode is only used with the torch backend without quantize/device_map, ignored')
+            compiled = False
+        self.compiled = compiled
+        self.compile_buckets = tuple(sorted(set(compile_buckets or DEFAULT_BUCKETS)))
+        self.compile_num_beams = compile_num_beams
+        self.compile_batch_size = compile_batch_size
+        if model_registry is True:
+            model_registry = default_registry()
+        if model_registry is not None and compiled:
+            logging.warning('model registry is not used in compiled mode (compiled models are not shared), ignored')
+            model_registry = None
+        self.model_registry = model_registry
+        self._registry_keys = []  # Khóa các checkpoint đang giữ trong registry, trả lại bằng release()
+        self.tokenizer, self.model, config = self._timed_load(
+            'model', self._load_checkpoint, load_language_model, self.model_name, cache_dir=cache_dir,
+            use_auth_token=use_auth_token, device_map=device_map, torch_dtype=torch_dtype,
+            low_cpu_mem_usage=low_cpu_mem_usage, quantize=quantize, backend=backend)
         
         # Kiểm tra xem model đã được fine-tune chưa (có add_prefix trong config không)
         if 'add_prefix' not in config.to_dict().keys():
@@ -527,21 +912,19 @@ class TransformersQG:
         # 1. spaCy backend: dùng thuật toán NLP truyền thống (positionrank, textrank, v.v.)
         # 2. Multitask: cùng 1 model làm cả AE và QG
         # 3. Pipeline: model AE riêng + model QG riêng
+        # Model AE riêng, spaCy, model draft và inference pool chỉ được nạp ở lần dùng đầu tiên (xem LazyAttribute)
         if self.model_name_ae is None:
             # Nếu không chỉ định model_ae:
             # - Nếu model chính hỗ trợ AE -> dùng model chính
             # - Không thì dùng positionrank (spaCy backend mặc định)
             self.model_name_ae = self.model_name if self.is_ae else "positionrank"
         
-        # Chọn backend AE: spaCy / multitask (chung model) / pipeline (model riêng)
-        self.answer_model_type = None
-        
+        # Chọn backend AE: spaCy / multitask (chung model) / pipeline (model riêng) / extractive (span model)
         # Kiểm tra xem model_ae có phải là phương pháp spaCy không
         if self.model_name_ae in VALID_METHODS:
             # Sử dụng spaCy backend (positionrank, textrank, yake, v.v.)
             logging.info(f'use spaCy answer extraction model: {self.model_name_ae}')
             self.tokenizer_ae = self.model_ae = self.add_prefix_ae = None
-            self.spacy_module = SpacyPipeline(language, self.model_name_ae)
             self.answer_model_type = 'spacy'
         else:
             # Sử dụng LMQG fine-tuned model cho AE
@@ -553,37 +936,186 @@ class TransformersQG:
                 assert self.is_ae, f"the model ({self.model_name_ae}) is not fine-tuned for AE"
                 self.tokenizer_ae = self.model_ae = self.add_prefix_ae = None
                 self.answer_model_type = 'multitask'
-            else:
-                # Pipeline: model AE riêng
-                logging.info(f"loading 2nd model for AE: {self.model_name_ae}")
-                self.tokenizer_ae, self.model_ae, config_ae = load_language_model(model_ae, cache_dir=cache_dir, use_auth_token=use_auth_token)
-                self.add_prefix_ae = config_ae.add_prefix
-                self.answer_model_type = 'pipeline'
-            
-            # Dù sao cũng cần spaCy để tách câu (sentence segmentation)
-            self.spacy_module = SpacyPipeline(language)
+            # Model AE riêng: pipeline hay extractive chỉ biết sau khi đọc config của checkpoint
+            # -> xác định ở lần dùng đầu tiên (_load_answer_model_type), không gọi mạng lúc khởi tạo
+
+        # Model draft cho assisted decoding (nếu có)
+        self.model_name_draft = model_draft
+        if model_draft is None or backend != 'torch':
+            if model_draft is not None:
+                logging.warning(f'`model_draft` is not supported with the {backend} backend, ignored')
+            self.model_draft = self.assisted_stats = None
+
+        # Bước 6: Thiết lập thiết bị tính toán (CPU/GPU, đã chọn và chuyển model lên ở bước 4)
+        # Flag đánh dấu có dùng DataParallel không (chỉ bật trong train(), inference dùng DeviceShardedExecutor)
+        self.parallel = False
+
+        # Chế độ compiled: compile + warm-up các bucket ngay lúc nạp model
+        if self.compiled:
+            self._timed_load('compile', self._compile, self.model, self.tokenizer)
+        
+        # Bước 7: Chia inference cho nhiều GPU (mỗi GPU 1 bản model) hoặc nhiều process trên CPU (nếu bật)
+        multi_gpu = self.device == 'cuda' and torch.cuda.device_count() > 1
+        use_pool = multi_gpu or inference_workers is not None
+        if use_pool and (backend != 'torch' or device_map is not None or self.compiled):
+            logging.warning('sharded inference is only used with the torch backend without device_map and '
+                            'compiled mode, ignored')
+            use_pool = False
+        if not use_pool:
+            self.inference_pool = None
+        # Tham số cho các thành phần nạp lúc dùng lần đầu
+        self._load_options = {
+            'cache_dir': cache_dir, 'use_auth_token': use_auth_token, 'language': language,
+            'spacy_n_process': spacy_n_process, 'multi_gpu': multi_gpu, 'inference_workers': inference_workers,
+            'threads_per_worker': threads_per_worker}
 
-        # Bước 6: Thiết lập thiết bị tính toán (CPU/GPU) và DataParallel nếu nhiều GPU
-        self.device = 'cuda' if torch.cuda.device_count() > 0 else 'cpu'
-        self.parallel = False  # Flag đánh dấu có dùng DataParallel không
-        
-        # Nếu có nhiều hơn 1 GPU -> sử dụng DataParallel để phân tán tính toán
-        if torch.cuda.device_count() > 1:
-            self.parallel = True
-            self.model = torch.nn.DataParallel(self.model)  # Wrap model chính
-            if self.model_ae is not None:
-                self.model_ae = torch.nn.DataParallel(self.model_ae)  # Wrap model AE nếu có
-        
-        # Chuyển model lên device (GPU hoặc CPU)
-        self.model.to(self.device)
-        if self.model_ae is not None:
-            self.model_ae.to(self.device)
-        
         # Log thông tin cấu hình
         logging.info(f'Model `{self.model_name}`')
-        logging.info(f'\t * Num of GPU in use: {torch.cuda.device_count()}')
+        logging.info(f'\t * Num of GPU in use: {torch.cuda.device_count() if self.device == "cuda" else 0}')
+        logging.info(f'\t * Inference shards: {torch.cuda.device_count() if multi_gpu else inference_workers or 1}')
+        logging.info(f'\t * Quantize (int8): {self.quantize}')
+        logging.info(f'\t * Backend: {self.backend}')
+        logging.info(f'\t * Draft model: {self.model_name_draft if self.backend == "torch" else None}')
         logging.info(f'\t * Prefix: {self.add_prefix}')
         logging.info(f'\t * Language: {language} (ignore at the training phase)')
+        logging.info(f'\t * Startup: {round(self.load_times["model"], 2)}s (other components are loaded on first use)')
+
+    def is_loaded(self, name: str):
+        """Thành phần nạp lúc dùng lần đầu (`model_ae`, `spacy_module`, ...) đã được nạp/gán chưa."""
+        return f'_{name}' in self.__dict__
+
+    def startup_report(self):
+        """Thời gian nạp (giây) của từng thành phần đã nạp, danh sách thành phần chưa từng dùng tới và
+        bộ nhớ của từng model trong model registry (nếu dùng)."""
+        return {
+            'load_seconds': dict(self.load_times),
+            'total_seconds': sum(self.load_times.values()),
+            'not_loaded': [n for n in LAZY_COMPONENTS if not self.is_loaded(n)],
+            'model_registry': None if self.model_registry is None else self.model_registry.memory_report()
+        }
+
+    def _timed_load(self, name: str, loader, *args, **kwargs):
+        """Gọi hàm nạp và ghi lại thời gian vào self.load_times[name]."""
+        start = time.perf_counter()
+        output = loader(*args, **kwargs)
+        self.load_times[name] = time.perf_counter() - start
+        logging.info(f'loaded `{name}` in {round(self.load_times[name], 2)}s')
+        return output
+
+    def _load_checkpoint(self, loader, model_name: str, quantize_dynamic: bool = False, **kwargs):
+        """Nạp checkpoint bằng `loader` (trả về tuple (tokenizer, model, ...)) và chuyển model lên self.device.
+
+        Có model registry -> mỗi checkpoint (cùng tên, tùy chọn nạp và device) chỉ được nạp 1 lần trong process,
+        các instance khác dùng chung weight; khóa được giữ lại để trả về registry trong `release()`.
+
+        Args:
+            loader: Hàm nạp (load_language_model, load_span_extractor)
+            model_name: Tên model
+            quantize_dynamic: Quantize động int8 model sau khi nạp (loader không tự quantize)
+            **kwargs: Tham số của loader
+        """
+        def load():
+            output = loader(model_name, **kwargs)
+            model = quantize_model(output[1]) if quantize_dynamic else output[1]
+            model.to(self.device)
+            return (output[0], model) + tuple(output[2:])
+
+        if self.model_registry is None:
+            return load()
+        options = {k: v for k, v in kwargs.items() if k not in ('cache_dir', 'use_auth_token', 'local_files_only')}
+        # compiled nằm trong khóa: model compile bị thay forward tại chỗ, không được đưa cho instance không compile
+        key = ModelRegistry.key(model_name, loader=loader.__name__, device=self.device,
+                                quantize_dynamic=quantize_dynamic, compiled=self.compiled, **options)
+        output = self.model_registry.acquire(key, load)
+        self._registry_keys.append(key)
+        return output
+
+    def release(self):
+        """Trả các checkpoint đã nạp qua model registry (registry có thể loại chúng khi cần bộ nhớ).
+
+        Sau khi gọi, không dùng instance này để inference nữa. Không có registry -> không làm gì.
+        """
+        if self.model_registry is None:
+            return
+        for key in self._registry_keys:
+            self.model_registry.release(key)
+        self._registry_keys = []
+
+    def _compile(self, model, tokenizer):
+        """Compile model (xem `compile_model`) và warm-up mọi bucket không dài hơn max_length.
+
+        Warm-up dùng đúng batch size và số beam của request thật (adaptive decoding chạy greedy trước
+        nên warm-up thêm num_beams=1), để request đầu tiên của mỗi bucket không phải compile lại.
+        """
+        model.eval()
+        compile_model(model)
+        buckets = [b for b in self.compile_buckets if b <= max(self.max_length, self.max_length_ae)]
+        seconds = {}
+        for num_beams in sorted({self.compile_num_beams, 1 if self.adaptive_decoding else self.compile_num_beams}):
+            for bucket, value in warmup(model, tokenizer.pad_token_id, buckets, batch_size=self.compile_batch_size,
+                                        num_beams=num_beams).items():
+                seconds[bucket] = seconds.get(bucket, 0.0) + value
+        return seconds
+
+    def _load_spacy_module(self):
+        options = self._load_options
+        algorithm = self.model_name_ae if self.model_name_ae in VALID_METHODS else None
+        # AE dạng spaCy dùng thuật toán keyword, các loại AE khác chỉ cần spaCy để tách câu
+        self.spacy_module = self._timed_load('spacy_module', SpacyPipeline, options['language'], algorithm,
+                                             n_process=options['spacy_n_process'])
+
+    def _load_answer_model_type(self):
+        options = self._load_options
+        config_ae = transformers.AutoConfig.from_pretrained(
+            self.model_name_ae, cache_dir=options['cache_dir'], use_auth_token=options['use_auth_token'],
+            local_files_only=not internet_connection())
+        # Extractive: encoder + đầu start/end, chấm điểm mọi span của paragraph trong 1 forward
+        # Pipeline: model AE sinh answer (seq2seq) riêng
+        self.answer_model_type = 'extractive' if is_span_extractor(config_ae) else 'pipeline'
+
+    def _load_answer_model(self):
+        options = self._load_options
+        if self.answer_model_type == 'extractive':
+            logging.info(f"loading extractive span model for AE: {self.model_name_ae}")
+            tokenizer_ae, model_ae = self._timed_load(
+                'model_ae', self._load_checkpoint, load_span_extractor, self.model_name_ae,
+                quantize_dynamic=self.quantize, cache_dir=options['cache_dir'],
+                use_auth_token=options['use_auth_token'], local_files_only=not internet_connection())
+            add_prefix_ae = None
+        else:
+            logging.info(f"loading 2nd model for AE: {self.model_name_ae}")
+            tokenizer_ae, model_ae, config_ae = self._timed_load(
+                'model_ae', self._load_checkpoint, load_language_model, self.model_name_ae,
+                cache_dir=options['cache_dir'], use_auth_token=options['use_auth_token'], quantize=self.quantize,
+                backend=self.backend)
+            add_prefix_ae = config_ae.add_prefix
+        if self.compiled and self.answer_model_type == 'pipeline':
+            self._timed_load('compile_ae', self._compile, model_ae, tokenizer_ae)
+        self.tokenizer_ae, self.model_ae, self.add_prefix_ae = tokenizer_ae, model_ae, add_prefix_ae
+
+    def _load_draft_model(self):
+        options = self._load_options
+        logging.info(f'loading draft model for assisted decoding: {self.model_name_draft}')
+        tokenizer_draft, model_draft, _ = self._timed_load(
+            'model_draft', self._load_checkpoint, load_language_model, self.model_name_draft,
+            cache_dir=options['cache_dir'], use_auth_token=options['use_auth_token'], quantize=self.quantize)
+        assert tokenizer_draft.get_vocab() == self.tokenizer.get_vocab(), \
+            f'the draft model ({self.model_name_draft}) must share the tokenizer of {self.model_name}'
+        model_draft.eval()
+        self.model_draft, self.assisted_stats = model_draft, AssistedDecodingStats()
+
+    def _load_inference_pool(self):
+        options = self._load_options
+        models = {'model': self.model}
+        if self.answer_model_type == 'pipeline':
+            models['model_ae'] = self.model_ae
+        self.inference_pool = self._timed_load(
+            'inference_pool', DeviceShardedExecutor, models, devices=None if options['multi_gpu'] else [],
+            cpu_workers=options['inference_workers'], threads_per_worker=options['threads_per_worker'])
+
+    def _load_tokenization_pool(self):
+        # Worker nhận tokenizer 1 lần và được dùng lại cho mọi lần encode (mọi split/tác vụ khi train)
+        self.tokenization_pool = self._timed_load('tokenization_pool', TokenizationPool, {'model': self.tokenizer})
 
     def push_to_hub(self, repo_id):
         """Push model và tokenizer lên Hugging Face Hub.
@@ -625,6 +1157,7 @@ class TransformersQG:
             Danh sách các cặp (question, answer) cho mỗi context
             - Nếu input là 1 context: trả về list[(q1, a1), (q2, a2), ...]
             - Nếu input là list context: trả về [list1, list2, ...]
+            - Context bị drop vì quá dài (drop_overflow_error_text): None
         """
         logging.info(f'running model for `question_answer_pair_generation`')
         assert self.is_qag, "`generate_qa_end2end` is available for end2end_qag_model"
@@ -667,7 +1200,8 @@ class TransformersQG:
 
         # Parse output string thành danh sách cặp (question, answer)
         # Mỗi context có thể sinh ra nhiều cặp QA, phân tách bằng splitting_symbol
-        output = [format_qa(o.split(splitting_symbol)) for o in output]
+        # Context bị drop khi encode (quá dài, drop_overflow_error_text) -> None
+        output = [None if o is None else format_qa(o.split(splitting_symbol)) for o in output]
         
         # Nếu input ban đầu là 1 string -> trả về 1 list, không phải list của list
         return output[0] if single_input else output
@@ -678,12 +1212,18 @@ class TransformersQG:
                     num_beams: int = 4,
                     cache_path: str = None,
                     num_questions: int = None,
-                    sentence_level: bool = False):
+                    sentence_level: bool = False,
+                    pipelined: bool = False,
+                    document: bool = False,
+                    window_length: int = None,
+                    window_overlap: int = 64):
         """Sinh cặp QA từ context.
 
         Luồng xử lý:
+        - Nếu document=True: chia tài liệu dài thành các cửa sổ theo câu (xem `generate_qa_document`)
         - Nếu model là QAG end-to-end: gọi `generate_qa_end2end` trực tiếp
         - Nếu là pipeline: chạy AE trước để tìm answer, sau đó chạy QG cho từng answer
+        - Nếu pipelined=True: AE và QG chạy gối đầu theo từng chunk context (xem `PipelinedQAG`)
         
         Args:
             list_context: Văn bản đầu vào (1 context hoặc list)
@@ -692,11 +1232,23 @@ class TransformersQG:
             cache_path: Đường dẫn cache feature đã encode
             num_questions: Giới hạn số câu hỏi (chủ yếu cho spaCy AE)
             sentence_level: Bật prediction theo câu để giảm độ phức tạp
+            pipelined: Chạy QG cho các chunk AE đã xong trong khi chunk AE tiếp theo đang chạy
+                       (thống kê mức sử dụng từng stage được lưu ở `self.pipeline_stats`)
+            document: Chế độ tài liệu dài: input dài hơn max_length không bị bỏ/raise mà được chia thành các cửa sổ
+                      gối đầu nhau; output là DocumentQA (question, answer, start, end) với vị trí trong tài liệu
+            window_length: Số token tối đa mỗi cửa sổ ở chế độ tài liệu (None -> max_length trừ phần prefix/<hl>)
+            window_overlap: Số token gối đầu giữa 2 cửa sổ liên tiếp ở chế độ tài liệu
             
         Returns:
             Danh sách cặp (question, answer) cho mỗi context
             - Nếu không tìm thấy answer nào: trả về None cho context đó
         """
+        if document:
+            return self.generate_qa_document(list_context, batch_size=batch_size, num_beams=num_beams,
+                                             cache_path=cache_path, num_questions=num_questions,
+                                             sentence_level=sentence_level, pipelined=pipelined,
+                                             window_length=window_length, window_overlap=window_overlap)
+
         # Nếu model hỗ trợ QAG end-to-end -> gọi trực tiếp
         if self.is_qag:
             return self.generate_qa_end2end(list_context, batch_size, num_beams, cache_path)
@@ -704,19 +1256,109 @@ class TransformersQG:
         # Chuẩn hóa input
         single_input = type(list_context) is str
         list_context = [list_context] if single_input else list_context
-        original_input_length = len(list_context)
+
+        # Chạy AE và QG gối đầu nhau theo từng chunk context
+        if pipelined:
+            executor = PipelinedQAG(self, chunk_size=batch_size or PipelinedQAG.default_chunk_size)
+            output_list = executor.run(list_context, batch_size=batch_size, num_beams=num_beams,
+                                       cache_path=cache_path, num_questions=num_questions,
+                                       sentence_level=sentence_level)
+            self.pipeline_stats = executor.stats
+            return output_list[0] if single_input else output_list
 
         # Bước 1: Chạy Answer Extraction để tìm các câu trả lời tiềm năng
         logging.info('running model for `ae`')
-        list_answer = self.generate_a(
-            list_context,
-            batch_size=batch_size,
-            num_beams=num_beams,
-            cache_path=cache_path,
-            sentence_level=sentence_level,
-            num_questions=num_questions
-        )
+        with stage('answer_extraction', contexts=len(list_context)):
+            list_answer = self.generate_a(
+                list_context,
+                batch_size=batch_size,
+                num_beams=num_beams,
+                cache_path=cache_path,
+                sentence_level=sentence_level,
+                num_questions=num_questions
+            )
         
+        # Bước 2-6: Chạy QG cho từng answer và gom kết quả theo context
+        with stage('question_generation', contexts=len(list_context)):
+            output_list = self.generate_q_from_answers(list_context, list_answer, batch_size=batch_size,
+                                                       num_beams=num_beams, cache_path=cache_path,
+                                                       sentence_level=sentence_level)
+
+        # Trả về kết quả: unwrap nếu input ban đầu là single string
+        return output_list[0] if single_input else output_list
+
+    def generate_qa_document(self,
+                             list_document: str or List,
+                             batch_size: int = None,
+                             num_beams: int = 4,
+                             cache_path: str = None,
+                             num_questions: int = None,
+                             sentence_level: bool = False,
+                             pipelined: bool = False,
+                             window_length: int = None,
+                             window_overlap: int = 64):
+        """Sinh cặp QA cho tài liệu dài (ví dụ 1 chương sách) bằng các cửa sổ gối đầu nhau.
+
+        Mỗi tài liệu được chia thành các cửa sổ gồm các câu liên tiếp (xem `DocumentChunker`), cửa sổ của mọi
+        tài liệu được gộp thành 1 lượt generate_qa (chia batch chung), sau đó cặp QA được gộp lại theo tài liệu,
+        bỏ trùng lặp ở phần gối đầu và gắn vị trí ký tự của answer trong tài liệu gốc (xem `merge_document_qa`).
+
+        Args:
+            list_document: 1 tài liệu hoặc danh sách tài liệu
+            batch_size: Batch size cho inference
+            num_beams: Số beam search
+            cache_path: Đường dẫn cache feature đã encode
+            num_questions: Giới hạn số câu hỏi mỗi cửa sổ (chủ yếu cho spaCy AE)
+            sentence_level: Bật prediction theo câu để giảm độ phức tạp
+            pipelined: Chạy AE và QG gối đầu nhau (xem `PipelinedQAG`)
+            window_length: Số token tối đa mỗi cửa sổ (None -> max_length trừ phần prefix/<hl>)
+            window_overlap: Số token gối đầu giữa 2 cửa sổ liên tiếp
+
+        Returns:
+            List DocumentQA (question, answer, start, end) cho mỗi tài liệu (None nếu không có cặp nào)
+        """
+        single_input = type(list_document) is str
+        list_document = [list_document] if single_input else list_document
+        if window_length is None:
+            # Chừa chỗ cho task prefix, 2 token <hl> và </s>
+            window_length = min(self.max_length, self.max_length_ae or self.max_length) - 32
+        chunker = DocumentChunker(self.tokenizer, self.spacy_module, window_length, window_overlap)
+        # Tách câu mọi tài liệu trong 1 lượt nlp.pipe, chunker.split dùng lại kết quả trong cache
+        self.spacy_module.sentences(list_document)
+        windows = [chunker.split(d) for d in list_document]
+        logging.info(f'split {len(list_document)} documents into {sum(len(w) for w in windows)} windows')
+        window_qa = self.generate_qa([w.text for w in chain(*windows)], batch_size=batch_size, num_beams=num_beams,
+                                     cache_path=cache_path, num_questions=num_questions,
+                                     sentence_level=sentence_level, pipelined=pipelined)
+        output, start = [], 0
+        for document, document_windows in zip(list_document, windows):
+            output.append(merge_document_qa(document, document_windows,
+                                            window_qa[start:start + len(document_windows)]))
+            start += len(document_windows)
+        return output[0] if single_input else output
+
+    def generate_q_from_answers(self,
+                                list_context: List,
+                                list_answer: List,
+                                batch_size: int = None,
+                                num_beams: int = 4,
+                                cache_path: str = None,
+                                sentence_level: bool = False):
+        """Bước QG của generate_qa: sinh câu hỏi cho mọi answer của từng context.
+
+        Args:
+            list_context: Danh sách context
+            list_answer: Danh sách answer của từng context (kết quả của generate_a, None nếu không có answer)
+            batch_size: Batch size cho inference
+            num_beams: Số beam search
+            cache_path: Đường dẫn cache feature đã encode
+            sentence_level: Bật prediction theo câu để giảm độ phức tạp
+
+        Returns:
+            Danh sách cặp (question, answer) cho mỗi context (None nếu context không có answer)
+        """
+        original_input_length = len(list_context)
+
         # Bước 2: Lọc ra các context có tìm thấy answer (bỏ qua những cái None)
         valid_context_id = [n for n, a in enumerate(list_answer) if a is not None]
         list_context = [list_context[n] for n in valid_context_id]
@@ -732,7 +1374,7 @@ class TransformersQG:
         
         # Bước 4: Chạy Question Generation cho từng cặp (context, answer)
         logging.info('running model for `qg`')
-        list_question = self.generate_q(
+        list_question = [] if len(qg_input) == 0 else self.generate_q(
             qg_input,
             list_answer=qg_hl,  # Highlight answer trong context
             batch_size=batch_size,
@@ -745,17 +1387,47 @@ class TransformersQG:
 
         # Bước 5: Gồm kết quả về đúng cấu trúc theo từng context ban đầu
         # list_length chứa ranh giới để biết question/answer nào thuộc context nào
-        list_question = [list_question[list_length[n - 1]:list_length[n]] for n in range(1, len(list_length))]
-        list_answer = [qg_hl[list_length[n - 1]:list_length[n]] for n in range(1, len(list_length))]
-        
-        # Bước 6: Tạo output list với đầy đủ các context (kể cả những cái không tìm thấy answer)
-        output_list = [None] * original_input_length
-        # Điền kết quả vào đúng vị trí ban đầu
-        for n, _id in enumerate(valid_context_id):
-            output_list[_id] = [(q, a) for q, a in zip(list_question[n], list_answer[n])]
-        
-        # Trả về kết quả: unwrap nếu input ban đầu là single string
-        return output_list[0] if single_input else output_list
+        with stage('post_filter', task='qg', samples=len(qg_hl)):
+            list_question = [list_question[list_length[n - 1]:list_length[n]] for n in range(1, len(list_length))]
+            list_answer = [qg_hl[list_length[n - 1]:list_length[n]] for n in range(1, len(list_length))]
+
+            # Bước 6: Tạo output list với đầy đủ các context (kể cả những cái không tìm thấy answer)
+            output_list = [None] * original_input_length
+            # Điền kết quả vào đúng vị trí ban đầu
+            for n, _id in enumerate(valid_context_id):
+                # Bỏ answer bị drop ở bước QG (không có câu hỏi)
+                output_list[_id] = [(q, a) for q, a in zip(list_question[n], list_answer[n]) if q is not None]
+        
+        return output_list
+
+    def iter_qa(self,
+                list_context: List,
+                batch_size: int = None,
+                num_beams: int = 4,
+                chunk_size: int = None,
+                num_questions: int = None,
+                sentence_level: bool = False):
+        """Phiên bản streaming của generate_qa: sinh cặp QA theo từng chunk context và trả kết quả ngay.
+
+        Bộ nhớ chỉ phụ thuộc vào chunk_size, nên có thể dùng cho corpus rất lớn.
+
+        Args:
+            list_context: Danh sách context
+            batch_size: Batch size cho inference
+            num_beams: Số beam search
+            chunk_size: Số context mỗi lần yield (None -> batch_size, hoặc 64 nếu không có batch_size)
+            num_questions: Giới hạn số câu hỏi (chủ yếu cho spaCy AE)
+            sentence_level: Bật prediction theo câu để giảm độ phức tạp
+
+        Yields:
+            (list index của context trong `list_context`, list kết quả giống generate_qa)
+        """
+        chunk_size = chunk_size or batch_size or 64
+        for start in range(0, len(list_context), chunk_size):
+            chunk = list_context[start:start + chunk_size]
+            output = self.generate_qa(chunk, batch_size=batch_size, num_beams=num_beams,
+                                      num_questions=num_questions, sentence_level=sentence_level)
+            yield list(range(start, start + len(chunk))), output
 
     def generate_a(self,
                    context: str or List,
@@ -766,10 +1438,11 @@ class TransformersQG:
                    num_questions: int = None):
         """Trích xuất đáp án (answer) từ context.
 
-        Có 3 cách trích xuất answer tùy thuộc vào backend:
+        Có 4 cách trích xuất answer tùy thuộc vào backend:
         1. spaCy: Dùng thuật toán keyword extraction (positionrank, textrank, yake, v.v.)
         2. Multitask model: Dùng model chính đã fine-tune cho AE task
         3. Pipeline model: Dùng model AE riêng biệt
+        4. Extractive model: Chấm điểm mọi span của paragraph trong 1 forward (không generate theo từng câu)
         
         Args:
             context: Văn bản đầu vào (1 context hoặc list)
@@ -777,7 +1450,7 @@ class TransformersQG:
             num_beams: Số beam search (cho model-based AE)
             cache_path: Đường dẫn cache feature đã encode
             sentence_level: Bật prediction theo từng câu (giảm độ phức tạp)
-            num_questions: Số đáp án tối đa cần trích xuất (chủ yếu cho spaCy backend)
+            num_questions: Số đáp án tối đa cần trích xuất (spaCy và extractive backend)
             
         Returns:
             Danh sách đáp án cho mỗi context
@@ -794,14 +1467,20 @@ class TransformersQG:
             else:
                 return [self.spacy_module.keyword(c, num_questions) for c in context]
         
-        # Nếu dùng model-based AE (multitask hoặc pipeline)
+        # Nếu dùng model-based AE (multitask, pipeline hoặc extractive)
         # Chuẩn hóa input
         single_input = type(context) is str
         context = [context] if single_input else context
+
+        # Extractive: 1 forward cho mỗi paragraph (cửa sổ max_length_ae token), không cần tách câu
+        if self.answer_model_type == 'extractive':
+            list_answer = extract_spans(self.model_ae, self.tokenizer_ae, context, device=self.device,
+                                        max_length=self.max_length_ae, batch_size=batch_size, top_k=num_questions)
+            return self._answers_or_error(context, list_answer, single_input)
         
         # Bước 1: Tách context thành danh sách câu (sentence segmentation)
         # Ví dụ: "Hà Nội là thủ đô. Việt Nam ở châu Á." -> ["Hà Nội là thủ đô.", "Việt Nam ở châu Á."]
-        list_sentences = [self.spacy_module.sentence(c) for c in context]
+        list_sentences = self.spacy_module.sentences(context)
         
         # Nếu sentence_level=False: input là (context, sentence) để model biết cần extract answer từ câu nào
         # Nếu sentence_level=True: input chỉ là câu (giảm độ phức tạp)
@@ -824,7 +1503,9 @@ class TransformersQG:
                 prefix_type='ae' if self.add_prefix else None,
                 cache_path=cache_path,
                 num_beams=num_beams,
-                batch_size=batch_size
+                batch_size=batch_size,
+                constrained=self.constrained_ae,
+                span_output=True
             )
         elif self.answer_model_type == 'pipeline':
             # Dùng model AE riêng biệt
@@ -835,23 +1516,30 @@ class TransformersQG:
                 cache_path=cache_path,
                 num_beams=num_beams,
                 batch_size=batch_size,
-                switch_to_model_ae=True  # Chuyển sang dùng model_ae
+                switch_to_model_ae=True,  # Chuyển sang dùng model_ae
+                constrained=self.constrained_ae,
+                span_output=True
             )
         else:
             raise ValueError(f"unknown answer model type: {self.answer_model_type}")
         
         # Bước 4: Khôi phục lại cấu trúc nested theo context ban đầu
-        # Làm sạch khoảng trắng thừa
-        answer = [clean(a) for a in answer]
-        
-        # Chia answer theo ranh giới list_length
-        list_answer = [answer[list_length[n - 1]:list_length[n]] for n in range(1, len(list_length))]
-        
-        # Lọc chỉ giữ những answer thực sự nằm trong context/sentence
-        # (Bỏ qua answer None hoặc không tìm thấy trong context)
-        list_answer = [[a for a, c in zip(a_sent, c_sent) if a is not None and a in c]
-                       for a_sent, c_sent in zip(list_answer, list_inputs)]
-        
+        with stage('post_filter', task='ae', samples=len(answer)) as s:
+            # Làm sạch khoảng trắng thừa (None: câu bị drop khi encode do quá dài/không tìm thấy highlight)
+            answer = [None if a is None else clean(a) for a in answer]
+
+            # Chia answer theo ranh giới list_length
+            list_answer = [answer[list_length[n - 1]:list_length[n]] for n in range(1, len(list_length))]
+
+            # Lọc chỉ giữ những answer thực sự nằm trong context/sentence
+            # (Bỏ qua answer None hoặc không tìm thấy trong context)
+            list_answer = [[a for a, c in zip(a_sent, c_sent) if a is not None and a in c]
+                           for a_sent, c_sent in zip(list_answer, list_inputs)]
+            s.update(kept=sum(len(a) for a in list_answer))
+        return self._answers_or_error(context, list_answer, single_input)
+
+    def _answers_or_error(self, context: List, list_answer: List, single_input: bool):
+        """Bước cuối của generate_a: context không có answer -> None (hoặc raise nếu không cho phép drop)."""
         # Đánh dấu None cho context không tìm thấy answer nào
         list_answer = [None if len(a) == 0 else a for a in list_answer]
         
@@ -884,7 +1572,9 @@ class TransformersQG:
             sentence_level: Bật prediction theo câu để giảm độ phức tạp
             
         Returns:
-            Câu hỏi sinh ra (string hoặc list string)
+            Câu hỏi sinh ra (string hoặc list string cùng độ dài với list_context). None với mẫu bị drop
+            (answer không nằm trong context hoặc input quá dài khi bật drop_highlight_error_text/
+            drop_overflow_error_text)
         """
         assert self.is_qg, "model is not fine-tuned for QG"
         
@@ -934,7 +1624,7 @@ class TransformersQG:
             cache_path: Đường dẫn cache feature đã encode
             
         Returns:
-            Câu trả lời (string hoặc list string)
+            Câu trả lời (string hoặc list string), None với mẫu bị drop vì quá dài (drop_overflow_error_text)
         """
         logging.info(f'running model for `question_answering`')
         assert self.is_qa, "model is not fine-tuned for QA"
@@ -965,7 +1655,10 @@ class TransformersQG:
                             batch_size: int = None,
                             cache_path: str = None,
                             sentence_level: bool = False,
-                            switch_to_model_ae: bool = False):
+                            switch_to_model_ae: bool = False,
+                            max_tokens: int = None,
+                            constrained: bool = False,
+                            span_output: bool = False):
         """Hàm generate tổng quát cho QG/AE/QA - core inference method.
 
         Đây là hàm chính thực hiện inference cho tất cả các tác vụ.
@@ -974,6 +1667,7 @@ class TransformersQG:
         2. Tạo DataLoader cho batch processing
         3. Chạy model.generate() với beam search
         4. Decode output tokens thành text
+        Nếu bật generation_cache: chỉ generate input chưa có trong cache (xem `_cached_prediction`)
         
         Args:
             inputs: Danh sách input text
@@ -984,13 +1678,207 @@ class TransformersQG:
             cache_path: Đường dẫn cache feature đã encode (tiết kiệm thời gian)
             sentence_level: Chỉ xử lý ở mức câu (giảm độ phức tạp)
             switch_to_model_ae: Dùng model_ae thay vì model chính
-            
+            max_tokens: Ngân sách token mỗi batch (input tokens x num_beams), None -> dùng self.max_tokens
+            constrained: Output chỉ được là 1 span token của input (dùng cho AE, xem ContextSpanConstraint)
+            span_output: Output phải là 1 span của input (AE): adaptive_decoding decode lại bằng beam search
+                         các output greedy không thỏa mãn
+
         Returns:
-            Danh sách chuỗi đã generate
+            Danh sách chuỗi đã generate, cùng độ dài và thứ tự với `inputs` (có hay không có generation_cache).
+            None ở vị trí mẫu bị drop khi encode (không tìm thấy highlight hoặc quá dài khi bật
+            drop_highlight_error_text/drop_overflow_error_text)
         """
         # Chuyển model sang eval mode (tắt dropout, batch norm không update, v.v.)
         self.eval()
-        
+
+        # Nếu sentence_level=True: chỉ xử lý câu chứa answer thay vì toàn bộ context
+        # Điều này giảm độ phức tạp và tăng tốc độ
+        if sentence_level:
+            inputs = self._sentence_level_inputs(inputs, highlights)
+        # Chỉ giữ K token context quanh highlight (nếu bật context_window)
+        if self.context_window is not None and highlights is not None:
+            inputs = self._window_inputs(inputs, highlights, switch_to_model_ae)
+
+        assert type(inputs) is list, inputs
+
+        if self.generation_cache is None:
+            return self._run_prediction(inputs, highlights, prefix_type, num_beams, batch_size, cache_path,
+                                        switch_to_model_ae, max_tokens, constrained, span_output)
+        return self._cached_prediction(inputs, highlights, prefix_type, num_beams, batch_size, cache_path,
+                                       switch_to_model_ae, max_tokens, constrained, span_output)
+
+    def iter_prediction(self,
+                        inputs: List,
+                        highlights: List or None = None,
+                        prefix_type: str = None,
+                        num_beams: int = 4,
+                        batch_size: int = None,
+                        chunk_size: int = None,
+                        sentence_level: bool = False,
+                        switch_to_model_ae: bool = False,
+                        max_tokens: int = None,
+                        constrained: bool = False,
+                        span_output: bool = False):
+        """Phiên bản streaming của generate_prediction: trả kết quả dần theo từng chunk input.
+
+        Input được xử lý tuần tự theo từng chunk `chunk_size` mẫu, nên bộ nhớ (feature đã encode,
+        output) chỉ phụ thuộc vào chunk_size chứ không phụ thuộc vào số lượng input. Mỗi chunk đi qua
+        generate_prediction đúng 1 lần (tách câu, cắt context_window và tokenize 1 lần cho mỗi input).
+
+        Args:
+            inputs: Danh sách input text
+            highlights: Danh sách span cần highlight bằng `<hl>` (thường là answer)
+            prefix_type: Prefix tác vụ ('qg', 'ae', 'qag', 'qa')
+            num_beams: Số beam search
+            batch_size: Batch size cho inference
+            chunk_size: Số input mỗi lần yield (None -> batch_size, hoặc 64 nếu không có batch_size)
+            sentence_level: Chỉ xử lý ở mức câu (giảm độ phức tạp)
+            switch_to_model_ae: Dùng model_ae thay vì model chính
+            max_tokens: Ngân sách token mỗi batch (input tokens x num_beams), None -> dùng self.max_tokens
+            constrained: Output chỉ được là 1 span token của input (dùng cho AE)
+            span_output: Output phải là 1 span của input (AE, xem generate_prediction)
+
+        Yields:
+            (list index của input trong `inputs`, list output tương ứng). Output là None với mẫu bị drop
+            (không tìm thấy highlight hoặc quá dài)
+        """
+        chunk_size = chunk_size or batch_size or 64
+        for start in range(0, len(inputs), chunk_size):
+            indices = list(range(start, min(start + chunk_size, len(inputs))))
+            # Output của generate_prediction cùng độ dài với input (None ở vị trí mẫu bị drop)
+            outputs = self.generate_prediction(
+                [inputs[i] for i in indices],
+                highlights=None if highlights is None else [highlights[i] for i in indices],
+                prefix_type=prefix_type,
+                num_beams=num_beams,
+                batch_size=batch_size,
+                sentence_level=sentence_level,
+                switch_to_model_ae=switch_to_model_ae,
+                max_tokens=max_tokens,
+                constrained=constrained,
+                span_output=span_output)
+            yield indices, outputs
+
+    def _cached_prediction(self,
+                           inputs: List,
+                           highlights: List or None,
+                           prefix_type: str,
+                           num_beams: int,
+                           batch_size: int,
+                           cache_path: str,
+                           switch_to_model_ae: bool,
+                           max_tokens: int,
+                           constrained: bool = False,
+                           span_output: bool = False):
+        """generate_prediction có dùng generation cache.
+
+        Input được đưa về chuỗi cuối cùng (đã chèn <hl> + prefix) để tạo khóa cache. Chỉ những
+        khóa chưa có trong cache mới được generate, và mỗi khóa chỉ generate 1 lần dù xuất hiện
+        nhiều lần trong cùng 1 lần gọi. Kết quả trả về cùng độ dài và thứ tự với `inputs`
+        (None ở vị trí mẫu bị drop do lỗi highlight/overlength).
+        """
+        if switch_to_model_ae:
+            model_id = model_identity(self.model_name_ae, self.model_ae)
+            max_length_output = self.max_length_output_ae
+        else:
+            model_id = model_identity(self.model_name, self.model)
+            max_length_output = self.max_length_output
+        if self.quantize:
+            model_id = f'{model_id}+int8'  # Output của model int8 có thể khác fp32
+        if self.backend != 'torch':
+            model_id = f'{model_id}+{self.backend}'
+        if constrained:
+            model_id = f'{model_id}+span'  # Output bị ràng buộc trong span của input
+        if self.adaptive_decoding and num_beams > 1:
+            model_id = f'{model_id}+adaptive{self.adaptive_threshold}'  # Output có thể là kết quả greedy
+
+        # Bước 1: Chuỗi input cuối cùng -> khóa cache (không tìm thấy highlight -> không có khóa)
+        texts = self._final_inputs(inputs, highlights, prefix_type, switch_to_model_ae)
+        keys = [None if t is None else self.generation_cache.key(model_id, prefix_type, t, num_beams, max_length_output)
+                for t in texts]
+
+        # Bước 2: Tra cache, gộp các input trùng lặp chưa có trong cache
+        found = self.generation_cache.get_many([k for k in keys if k is not None])
+        missing = {}
+        for k, t in zip(keys, texts):
+            if k is not None and k not in found:
+                missing.setdefault(k, t)
+        n_missing = sum(k is not None and k not in found for k in keys)
+        self.generation_cache.record_deduplicated(n_missing - len(missing))
+
+        # Bước 3: Generate phần còn thiếu (input đã có <hl> + prefix nên không truyền highlight/prefix nữa)
+        if len(missing) > 0:
+            generated = self._run_prediction(list(missing.values()), None, None, num_beams, batch_size, cache_path,
+                                             switch_to_model_ae, max_tokens, constrained, span_output)
+            generated = dict(zip(missing.keys(), generated))
+            # Mẫu bị drop khi encode (quá dài) -> None, không lưu vào cache
+            self.generation_cache.put_many({k: v for k, v in generated.items() if v is not None})
+            found.update(generated)
+        stats = self.generation_cache.stats()
+        logging.info(f'generation cache: {len(inputs) - n_missing}/{len(inputs)} hit in this call, '
+                     f'{len(missing)} generated, hit rate {round(stats["hit_rate"] * 100, 1)}%')
+        return [found.get(k) for k in keys]
+
+    def _sentence_level_inputs(self, inputs: List, highlights: List):
+        """Thay mỗi context bằng câu đầu tiên chứa highlight (giữ nguyên context nếu không tìm thấy)."""
+        assert highlights is not None, '`sentence_level` cần tham số `highlights` để xác định câu chứa answer.'
+        assert len(highlights) == len(inputs), str([len(highlights), len(inputs)])
+        list_sentence = []
+        # Tách câu 1 lượt cho mọi context (context lặp lại chỉ parse 1 lần)
+        for context, answer, sentences in zip(inputs, highlights, self.spacy_module.sentences(inputs)):
+            # Tìm câu chứa answer
+            s = [sentence for sentence in sentences if answer in sentence]
+            list_sentence.append(s[0] if len(s) != 0 else context)  # Fallback về context nếu không tìm thấy
+        return list_sentence
+
+    def _window_inputs(self, inputs: List, highlights: List, switch_to_model_ae: bool = False):
+        """Cắt mỗi context còn self.context_window token quanh highlight tương ứng (xem `context_window`).
+
+        Mỗi context khác nhau chỉ được tokenize 1 lần (AE lặp lại cùng 1 context cho từng câu).
+        Tokenizer không phải bản fast (không có offset_mapping) -> đếm token theo khoảng trắng.
+        """
+        assert len(highlights) == len(inputs), str([len(highlights), len(inputs)])
+        tokenizer = self.tokenizer_ae if switch_to_model_ae else self.tokenizer
+        unique = list(dict.fromkeys(inputs))
+        if getattr(tokenizer, 'is_fast', False):
+            offsets = tokenizer(unique, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+        else:
+            offsets = [[m.span() for m in re.finditer(r'\S+', c)] for c in unique]
+        offsets = dict(zip(unique, offsets))
+        return [context_window(c, h, offsets[c], self.context_window) for c, h in zip(inputs, highlights)]
+
+    def _final_inputs(self, inputs: List, highlights: List or None, prefix_type: str, switch_to_model_ae: bool):
+        """Chuỗi input cuối cùng (đã chèn <hl> + prefix) của từng mẫu, chưa tokenize.
+
+        Returns:
+            List cùng độ dài với `inputs`, None ở vị trí không tìm thấy highlight khi bật
+            drop_highlight_error_text. Mẫu quá dài chỉ được phát hiện khi tokenize (_run_prediction trả về None)
+        """
+        tokenizer = self.tokenizer_ae if switch_to_model_ae else self.tokenizer
+        encoder = EncodePlus(tokenizer, prefix_type=prefix_type,
+                             drop_highlight_error_text=self.drop_highlight_error_text)
+        highlights = [None] * len(inputs) if highlights is None else highlights
+        return [encoder.build_input(i, h) for i, h in zip(inputs, highlights)]
+
+    def _run_prediction(self,
+                        inputs: List,
+                        highlights: List or None,
+                        prefix_type: str,
+                        num_beams: int,
+                        batch_size: int,
+                        cache_path: str,
+                        switch_to_model_ae: bool,
+                        max_tokens: int,
+                        constrained: bool = False,
+                        span_output: bool = False):
+        """Phần chạy model của generate_prediction: tokenize, chia batch, generate và decode.
+
+        Returns:
+            List output cùng độ dài và thứ tự với `inputs`, None ở vị trí mẫu bị drop khi encode
+            (không tìm thấy highlight hoặc quá dài khi bật drop_highlight_error_text/drop_overflow_error_text)
+        """
+        if len(inputs) == 0:
+            return []
         # Chọn model và tokenizer: model chính hoặc model_ae
         if switch_to_model_ae:
             assert self.model_ae is not None and self.tokenizer_ae is not None
@@ -1002,55 +1890,158 @@ class TransformersQG:
             tokenizer = self.tokenizer
             max_length_output = self.max_length_output
 
-        # Nếu sentence_level=True: chỉ xử lý câu chứa answer thay vì toàn bộ context
-        # Điều này giảm độ phức tạp và tăng tốc độ
-        if sentence_level:
-            assert highlights is not None, '`sentence_level` cần tham số `highlights` để xác định câu chứa answer.'
-            assert len(highlights) == len(inputs), str([len(highlights), len(inputs)])
-            list_sentence = []
-            for context, answer in zip(inputs, highlights):
-                # Tìm câu chứa answer
-                s = [sentence for sentence in self.spacy_module.sentence(context) if answer in sentence]
-                list_sentence.append(s[0] if len(s) != 0 else context)  # Fallback về context nếu không tìm thấy
-            inputs = list_sentence
-
-        assert type(inputs) is list, inputs
-        
         # Bước 1: Tokenize tất cả input text (với highlight nếu có)
-        encode_list = self.text_to_encode(
-            inputs,
-            highlights=highlights,
-            prefix_type=prefix_type,
-            cache_path=cache_path,
-            switch_to_model_ae=switch_to_model_ae
-        )
-        
-        # Bước 2: Tạo DataLoader cho batch processing
-        loader = self.get_data_loader(encode_list, batch_size=batch_size)
-        
+        # Feature không pad sẵn, được đóng gói 1 lần (PackedDataset); mỗi batch chỉ pad tới input dài nhất của nó
+        with stage('encode', samples=len(inputs)) as s:
+            features, dropped = self.text_to_encode(
+                inputs,
+                highlights=highlights,
+                prefix_type=prefix_type,
+                cache_path=cache_path,
+                switch_to_model_ae=switch_to_model_ae,
+                padding=False,
+                return_dropped=True
+            )
+            dataset = PackedDataset.pack(features)
+            lengths = dataset.lengths()
+            s.update(tokens=int(lengths.sum()), dropped=len(dropped))
+        if len(dataset) == 0:
+            return [None] * len(inputs)
+        collate_fn = PackedCollator(tokenizer.pad_token_id)
+
+        # Bước 2: Chia batch
+        order = None
+        if self.length_bucketing:
+            # Sắp xếp theo số token để các input dài gần bằng nhau rơi vào cùng batch
+            order = np.argsort(lengths, kind='stable').tolist()
+            dataset = torch.utils.data.Subset(dataset, order)
+            lengths = lengths[order]
+        lengths = lengths.tolist()
+
         # Bước 3: Lặp qua từng batch và generate
-        outputs = []
-        for encode in loader:
-            with torch.no_grad():  # Không tính gradient (tiết kiệm bộ nhớ)
-                # Bỏ labels nếu có (không cần cho inference)
-                if 'labels' in encode:
-                    encode.pop('labels')
-                
-                # Chuyển tensor lên device (GPU/CPU)
-                encode = {k: v.to(self.device) for k, v in encode.items()}
-                
-                # Thêm tham số generate
-                encode['max_length'] = max_length_output
-                encode['num_beams'] = num_beams
-                
-                # Gọi model.generate() (unwrap nếu dùng DataParallel)
-                tensor = model.module.generate(**encode) if self.parallel else model.generate(**encode)
-                
-                # Decode token IDs thành text
-                outputs += tokenizer.batch_decode(tensor, skip_special_tokens=True)
-        
+        max_tokens = self.max_tokens if max_tokens is None else max_tokens
+        # Assisted decoding chỉ áp dụng cho greedy của model chính, không ràng buộc output
+        # (assisted, constrained và adaptive decoding chạy trong process hiện tại)
+        draft_model = self.model_draft if num_beams == 1 and not switch_to_model_ae and not constrained else None
+        adaptive = self.adaptive_decoding and num_beams > 1
+        if self.inference_pool is not None and draft_model is None and not constrained and not adaptive:
+            # Chia các batch cho các process worker (mặc định mỗi worker 1 batch), kết quả giữ đúng thứ tự
+            if max_tokens is None:
+                batch_size = batch_size or max(1, -(-len(dataset) // self.inference_pool.n_workers))
+                batches = list(self.get_data_loader(dataset, batch_size=batch_size, collate_fn=collate_fn))
+            else:
+                scheduler = TokenBudgetScheduler(max_tokens, num_beams=num_beams)
+                batches = [collate_fn([dataset[i] for i in indices]) for indices in scheduler.plan(lengths)]
+            with stage('generate', batches=len(batches), samples=len(dataset), num_beams=num_beams, workers=True):
+                outputs = self.inference_pool.generate(
+                    'model_ae' if switch_to_model_ae else 'model', batches, tokenizer, num_beams, max_length_output)
+        elif batch_size is not None and max_tokens is None:
+            # Batch size cố định
+            loader = self.get_data_loader(dataset, batch_size=batch_size, collate_fn=collate_fn)
+            outputs = []
+            for encode in loader:
+                outputs += self._generate_batch(
+                    model, tokenizer, encode, num_beams, max_length_output, draft_model, constrained, span_output)
+        else:
+            # Chia batch theo ngân sách token, tự chia nhỏ batch khi OOM
+            # (không chỉ định gì -> bắt đầu với 1 batch duy nhất như trước, chỉ chia khi OOM)
+            scheduler = TokenBudgetScheduler(
+                max_tokens,
+                key=(self.model_name_ae if switch_to_model_ae else self.model_name, num_beams),
+                num_beams=num_beams)
+            outputs = [None] * len(dataset)
+            for indices, decoded in scheduler.run(
+                    dataset,
+                    lengths,
+                    lambda encode: self._generate_batch(
+                        model, tokenizer, encode, num_beams, max_length_output, draft_model, constrained, span_output),
+                    collate_fn=collate_fn):
+                for i, text in zip(indices, decoded):
+                    outputs[i] = text
+
+        # Khôi phục thứ tự ban đầu nếu đã sắp xếp theo độ dài
+        if order is not None:
+            restored = [None] * len(outputs)
+            for position, index in enumerate(order):
+                restored[index] = outputs[position]
+            outputs = restored
+        # Giữ đúng vị trí của mẫu bị drop (None) để output khớp với `inputs`
+        if len(dropped) > 0:
+            dropped, generated = set(dropped), iter(outputs)
+            outputs = [None if n in dropped else next(generated) for n in range(len(inputs))]
         return outputs
 
+    def _generate_batch(self, model, tokenizer, encode: Dict, num_beams: int, max_length_output: int,
+                        draft_model=None, constrained: bool = False, span_output: bool = False):
+        """Chạy model.generate() trên 1 batch đã collate và decode thành text.
+
+        Args:
+            model: Model dùng để generate (model chính hoặc model_ae)
+            tokenizer: Tokenizer tương ứng với model
+            encode: Dict tensor của batch (input_ids, attention_mask, có thể kèm labels)
+            num_beams: Số beam search
+            max_length_output: Độ dài tối đa output
+            draft_model: Model draft cho assisted greedy decoding (None -> generate thường)
+            constrained: Output chỉ được là 1 span token của input (ContextSpanConstraint)
+            span_output: Output phải là 1 span của input (kiểm tra của adaptive decoding cho AE)
+
+        Returns:
+            List chuỗi đã decode, cùng thứ tự với batch
+        """
+        with torch.no_grad():  # Không tính gradient (tiết kiệm bộ nhớ)
+            # Bỏ labels nếu có (không cần cho inference)
+            if 'labels' in encode:
+                encode.pop('labels')
+
+            # Kích thước batch cho profiler (tính trên CPU trước khi copy, tránh đồng bộ GPU; tắt profiler -> bỏ qua)
+            info = {}
+            if active_profiler().enabled:
+                info = {'batch_size': len(encode['input_ids']), 'input_tokens': int(encode['attention_mask'].sum())}
+
+            # Chuyển tensor lên device (GPU/CPU)
+            with stage('host_to_device', **info):
+                encode = {k: v.to(self.device) for k, v in encode.items()}
+
+            # Unwrap nếu model đang được bọc DataParallel (sau khi train)
+            if isinstance(model, torch.nn.DataParallel):
+                model = model.module
+
+            # Chế độ compiled: pad lên độ dài bucket để encoder chỉ gặp các shape đã compile
+            if self.compiled:
+                encode = pad_to_bucket(encode, tokenizer.pad_token_id, self.compile_buckets)
+
+            # Assisted decoding: model draft đề xuất token, model chính kiểm tra (từng mẫu một)
+            if draft_model is not None:
+                with stage('generate', mode='assisted', **info):
+                    tensors = assisted_generate(model, draft_model, encode, max_length_output, self.assisted_stats)
+                with stage('decode', batch_size=len(tensors)):
+                    return tokenizer.batch_decode(tensors, skip_special_tokens=True)
+
+            # Thêm tham số generate
+            encode['max_length'] = max_length_output
+            encode['num_beams'] = num_beams
+            if constrained:
+                encode['prefix_allowed_tokens_fn'] = ContextSpanConstraint.from_batch(
+                    encode['input_ids'], tokenizer, max_length_output, prefixes=list(TASK_PREFIX.values()))
+
+            # Adaptive decoding: greedy cho cả batch, beam search chỉ cho các output không đáng tin
+            if self.adaptive_decoding and num_beams > 1:
+                with stage('generate', mode='adaptive', num_beams=num_beams, **info) as s:
+                    sequences = adaptive_generate(model, tokenizer, encode, num_beams, self.adaptive_threshold,
+                                                  span_output, self.adaptive_stats)
+                    s.update(output_tokens=sum(len(i) for i in sequences))
+                with stage('decode', batch_size=len(sequences)):
+                    return tokenizer.batch_decode(sequences, skip_special_tokens=True)
+
+            # Gọi model.generate()
+            with stage('generate', num_beams=num_beams, **info) as s:
+                tensor = model.generate(**encode)
+                s.update(output_tokens=tensor.numel())
+
+            # Decode token IDs thành text
+            with stage('decode', batch_size=len(tensor)):
+                return tokenizer.batch_decode(tensor, skip_special_tokens=True)
+
     def encode_to_loss(self, encode: Dict):
         """Tính loss từ feature đã encode (dùng cho fine-tuning).
 
@@ -1084,46 +2075,49 @@ class TransformersQG:
                        highlights: List = None,
                        prefix_type: str = None,
                        cache_path: str = None,
-                       switch_to_model_ae: bool = False):
+                       switch_to_model_ae: bool = False,
+                       padding: bool = None,
+                       return_dropped: bool = False):
         """Chuyển text đầu vào/đầu ra thành feature tokenized.
 
         Luồng xử lý:
-        1. Kiểm tra cache: nếu đã encode trước đó -> load từ cache
+        1. Kiểm tra cache: nếu đã encode trước đó (cùng tokenizer, cấu hình và dữ liệu) -> đọc từ cache
         2. Tokenize tất cả sample (có thể dùng multiprocessing)
         3. Lọc bỏ các sample lỗi (overlength, highlight không tìm thấy)
-        4. Lưu cache cho lần sau
-        
+        4. Lưu cache cho lần sau (FeatureStore memory-map)
+
         Args:
             inputs: Danh sách input text
             outputs: Danh sách output tương ứng (nếu có, cho training)
             highlights: Danh sách span cần đánh dấu `<hl>`
             prefix_type: Prefix tác vụ
-            cache_path: Đường dẫn cache feature trung gian
+            cache_path: Tiền tố đường dẫn cache feature (store được lưu tại `<cache_path>.<fingerprint>`)
             switch_to_model_ae: Dùng tokenizer_ae và config của model_ae
-            
+            padding: Pad về max_length hay không (None -> chỉ pad khi có nhiều hơn 1 sample)
+            return_dropped: Trả về thêm list index (trong `inputs`) của các mẫu bị drop
+
         Returns:
-            Danh sách feature đã encode (dict có input_ids, attention_mask, labels)
+            Danh sách feature đã encode (dict có input_ids, attention_mask, labels), không gồm mẫu bị drop.
+            Có cache_path -> FeatureStore (dùng như list, dữ liệu được memory-map từ đĩa).
+            return_dropped=True -> tuple (feature, list index của mẫu bị drop)
         """
-        # Bước 1: Kiểm tra cache
-        if cache_path is not None and os.path.exists(cache_path):
-            logging.info(f'loading preprocessed feature from {cache_path}')
-            return pickle_load(cache_path)
-        
-        # Bước 2: Chuẩn bị data cho encoding
+        # Bước 1: Chuẩn bị data cho encoding
         # Đảm bảo outputs và highlights có cùng độ dài với inputs
         outputs = [None] * len(inputs) if outputs is None else outputs
         highlights = [None] * len(inputs) if highlights is None else highlights
         assert len(outputs) == len(inputs) == len(highlights), str([len(outputs), len(inputs), len(highlights)])
-        
+
         # Zip thành danh sách tuple (input, output, highlight)
         data = list(zip(inputs, outputs, highlights))
-        
-        # Bước 3: Tạo EncodePlus object với cấu hình phù hợp
+
+        # Bước 2: Tạo EncodePlus object với cấu hình phù hợp
+        if padding is None:
+            padding = False if len(data) == 1 else True  # padding=True cho batch, False cho single
         config = {'tokenizer': self.tokenizer, 'max_length': self.max_length, 'prefix_type': prefix_type,
                   'max_length_output': self.max_length_output, 'drop_overflow_error_text': self.drop_overflow_error_text,
                   'skip_overflow_error': self.skip_overflow_error, 'drop_highlight_error_text': self.drop_highlight_error_text,
-                  'padding': False if len(data) == 1 else True}  # padding=True cho batch, False cho single
-        
+                  'padding': padding}
+
         # Nếu dùng model_ae -> thay đổi config
         if switch_to_model_ae:
             assert self.model_ae is not None and self.tokenizer_ae is not None
@@ -1131,53 +2125,68 @@ class TransformersQG:
             config['max_length'] = self.max_length_ae
             config['max_length_output'] = self.max_length_output_ae
 
-        logging.info(f'encode all the data       : {len(data)}')
-        
-        # Tạo thư mục cache nếu cần
+        # Bước 3: Kiểm tra cache
+        # Cache được lưu dạng cột (int32 + offset) và đọc bằng memory-map. Khóa cache gồm tokenizer,
+        # độ dài tối đa, prefix, các cờ xử lý lỗi và chính dữ liệu -> cache cũ không bao giờ bị dùng nhầm
+        store_path = store_key = None
         if cache_path is not None:
-            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
-        
+            store_key = fingerprint(
+                tokenizer_fingerprint(config['tokenizer']),
+                {k: v for k, v in config.items() if k != 'tokenizer'},
+                data)
+            store_path = f'{cache_path}.{store_key[:16]}'
+            if FeatureStore.exists(store_path, store_key):
+                logging.info(f'loading preprocessed feature from {store_path}')
+                store = FeatureStore(store_path)
+                return (store, store.dropped) if return_dropped else store
+            os.makedirs(os.path.dirname(store_path), exist_ok=True)
+            # Store lưu token chưa pad, việc pad được thực hiện khi đọc
+            config['padding'] = False
+
+        logging.info(f'encode all the data       : {len(data)}')
+
         # Bước 4: Chọn cách xử lý: song song (multiprocessing) hoặc đơn luồng
+        # Mỗi lần gọi tokenizer xử lý cả một chunk ENCODE_CHUNK_SIZE mẫu
         if PARALLEL_PROCESSING:
-            # Dùng multiprocessing Pool để tăng tốc
-            pool = Pool()
-            out = pool.map(EncodePlus(**config), data)
-            pool.close()
-            out = list(filter(None, out))  # Loại bỏ các mẫu bị drop (overlength/highlight lỗi)
+            # Dùng pool worker giữ sẵn tokenizer, kết quả trả về dần theo thứ tự từng chunk
+            name = 'model_ae' if switch_to_model_ae else 'model'
+            self.tokenization_pool.register(name, config['tokenizer'])
+            encoded_chunks = self.tokenization_pool.encode(
+                name, {k: v for k, v in config.items() if k != 'tokenizer'}, data, ENCODE_CHUNK_SIZE)
         else:
-            # Xử lý đơn luồng (dễ debug hơn)
             f = EncodePlus(**config)
-            out = []
-            files = []  # Danh sách file cache tạm
-            
-            for i in tqdm(data):
-                e = f(i)
-                if e is not None:  # Chỉ giữ các mẫu hợp lệ
-                    out.append(e)
-                
-                # Lưu cache tạm thời sau mỗi 40k sample (tránh out of memory)
-                if len(out) > 40000 and cache_path is not None:
-                    pickle_save(out, f'{cache_path}.tmp{len(files)}')
-                    files.append(f'{cache_path}.tmp{len(files)}')
-                    out = []
-            
-            # Lưu batch cuối cùng
-            if len(out) > 0 and cache_path is not None:
-                pickle_save(out, f'{cache_path}.tmp{len(files)}')
-                files.append(f'{cache_path}.tmp{len(files)}')
-            
-            # Gộp tất cả file tạm lại
-            if len(files) > 0:
-                out = list(chain(*[pickle_load(i) for i in files]))
-        
-        logging.info(f'after remove the overflow : {len(out)}')
-        
-        # Bước 5: Lưu cache để tái sử dụng ở lần chạy sau
-        if cache_path is not None:
-            pickle_save(out, cache_path)
-            logging.info(f'preprocessed feature is saved at {cache_path}')
-        
-        return out
+            chunks = [data[i:i + ENCODE_CHUNK_SIZE] for i in range(0, len(data), ENCODE_CHUNK_SIZE)]
+            # Xử lý đơn luồng (dễ debug hơn)
+            encoded_chunks = (f.encode_batch(chunk) for chunk in tqdm(chunks))
+
+        # Bước 5: Loại bỏ các mẫu bị drop (overlength/highlight lỗi), ghi lại vị trí của chúng
+        # Có cache -> ghi thẳng từng chunk ra store, không giữ toàn bộ feature trong RAM
+        dropped = []
+
+        def kept_features():
+            for n, feature in enumerate(chain(*encoded_chunks)):
+                if feature is None:
+                    dropped.append(n)
+                else:
+                    yield feature
+
+        if store_path is None:
+            out = list(kept_features())
+            logging.info(f'after remove the overflow : {len(out)}')
+            return (out, dropped) if return_dropped else out
+
+        writer = FeatureStoreWriter(
+            store_path,
+            key=store_key,
+            padding={'input_ids': config['max_length'], 'labels': config['max_length_output']} if padding else None,
+            pad_token_id=config['tokenizer'].pad_token_id)
+        writer.extend(kept_features())
+        writer.meta['dropped'] = dropped
+        writer.close()
+        logging.info(f'after remove the overflow : {writer.meta["size"]}')
+        logging.info(f'preprocessed feature is saved at {store_path}')
+        store = FeatureStore(store_path)
+        return (store, store.dropped) if return_dropped else store
 
     def save(self, save_dir):
         """Lưu model và tokenizer ra thư mục.
@@ -1208,31 +2217,39 @@ class TransformersQG:
         self.tokenizer.save_pretrained(save_dir)
 
     @staticmethod
-    def get_data_loader(encode_list, batch_size: int = None, shuffle: bool = False, drop_last: bool = False):
+    def get_data_loader(encode_list,
+                        batch_size: int = None,
+                        shuffle: bool = False,
+                        drop_last: bool = False,
+                        collate_fn=None):
         """Tạo DataLoader từ danh sách feature đã encode.
 
         DataLoader tự động:
         - Chia data thành batch
         - Shuffle data (nếu shuffle=True)
         - Tải data song song với num_workers
-        
+
         Args:
-            encode_list: Danh sách feature đã encode (list các dict)
+            encode_list: Danh sách feature đã encode (list các dict, FeatureStore hoặc torch Dataset)
             batch_size: Batch size (Nếu None -> lấy toàn bộ data làm 1 batch)
             shuffle: Trộn dữ liệu trước mỗi epoch (dùng cho training)
             drop_last: Bỏ batch cuối nếu không đủ số lượng (dùng cho training)
-            
+            collate_fn: Hàm gộp sample thành batch (ví dụ PackedCollator), None -> mặc định
+
         Returns:
             torch.utils.data.DataLoader object
         """
         # Nếu không chỉ định batch_size -> dùng toàn bộ data làm 1 batch
         batch_size = len(encode_list) if batch_size is None else batch_size
-        
+
         # Tham số cho DataLoader
-        params = dict(batch_size=batch_size, shuffle=shuffle, drop_last=drop_last, num_workers=NUM_WORKERS)
+        params = dict(batch_size=batch_size, shuffle=shuffle, drop_last=drop_last, num_workers=NUM_WORKERS,
+                      collate_fn=collate_fn)
         
-        # Tạo và trả về DataLoader
-        return torch.utils.data.DataLoader(Dataset(encode_list), **params)
+        # Tạo và trả về DataLoader (encode_list có thể đã là torch Dataset, ví dụ ConcatDataset)
+        if not isinstance(encode_list, torch.utils.data.Dataset):
+            encode_list = Dataset(encode_list)
+        return torch.utils.data.DataLoader(encode_list, **params)
 
     def train(self):
         """Chuyển model sang training mode.
@@ -1241,7 +2258,14 @@ class TransformersQG:
         - Bật dropout
         - Batch normalization sẽ update running stats
         - Gradient sẽ được tính
+        Nhiều GPU -> bọc model bằng DataParallel để chia batch tính loss cho các GPU
         """
+        if self.device == 'cuda' and torch.cuda.device_count() > 1 and not self.parallel:
+            self.parallel = True
+            self.model = torch.nn.DataParallel(self.model)
+        if self.is_loaded('inference_pool') and self.inference_pool is not None:
+            # Weight sắp thay đổi -> bản copy trên các GPU khác sẽ được tạo lại khi generate
+            self.inference_pool.reset()
         self.model.train()
 
     def eval(self):
@@ -1251,5 +2275,7 @@ class TransformersQG:
         - Tắt dropout
         - Batch normalization dùng running stats (không update)
         - Thường kết hợp với torch.no_grad() để không tính gradient
+        Model ONNX Runtime không có train/eval mode -> bỏ qua
         """
-        self.model.eval()
\ No newline at end of file
+        if isinstance(self.model, torch.nn.Module):
+            self.model.eval()
\ No newline at end of file
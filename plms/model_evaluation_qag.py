@@ -2,8 +2,10 @@ import json
 import logging
 import os
 from itertools import chain
+from typing import List
 from datasets import load_dataset
 from .language_model import TransformersQG
+from .adaptive_decoding import DEFAULT_LOGPROB_THRESHOLD
 from .utils import save_result
 
 logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
@@ -31,7 +33,12 @@ class Evaluation:
                  is_qg: bool = None,
                  is_ae: bool = None,
                  is_qag: bool = True,
-                 use_reference_answer: bool = False):
+                 use_reference_answer: bool = False,
+                 max_tokens: int = None,
+                 generation_cache: str = None,
+                 chunk_size: int = None,
+                 adaptive_decoding: bool = False,
+                 adaptive_threshold: float = DEFAULT_LOGPROB_THRESHOLD):
         logging.info('QAG evaluator.')
         self.model = model
         self.model_ae = model_ae
@@ -56,9 +63,18 @@ class Evaluation:
         self.is_ae = is_ae
         self.is_qag = is_qag
         self.use_reference_answer = use_reference_answer
+        self.max_tokens = max_tokens
+        self.generation_cache = generation_cache
+        self.chunk_size = chunk_size
+        self.adaptive_decoding = adaptive_decoding
+        self.adaptive_threshold = adaptive_threshold
+        self._model = None  # Model đã nạp, dùng lại cho mọi split
 
     def load_model(self):
+        """Nạp model 1 lần cho mọi split (qua model registry dùng chung, nạp lại tức thì nếu checkpoint còn giữ)."""
         os.makedirs(self.export_dir, exist_ok=True)
+        if self._model is not None:
+            return self._model
         if self.model is not None:
             _model = TransformersQG(self.model,
                                     is_ae=None if self.is_ae else True,
@@ -69,11 +85,44 @@ class Evaluation:
                                     drop_answer_error_text=True,
                                     language=self.language,
                                     max_length=self.max_length,
-                                    max_length_output=self.max_length_output)
+                                    max_length_output=self.max_length_output,
+                                    max_tokens=self.max_tokens,
+                                    generation_cache=self.generation_cache,
+                                    adaptive_decoding=self.adaptive_decoding,
+                                    adaptive_threshold=self.adaptive_threshold,
+                                    model_registry=True)
             _model.eval()
+            self._model = _model
             return _model
         raise ValueError("require `-m` or `--model`")
 
+    def iter_reference_qa(self, model, model_input: List, model_highlight: List):
+        """QG với answer cố định theo reference, trả kết quả theo từng chunk paragraph.
+
+        Yields:
+            (list index của paragraph, list các cặp (question, answer) của từng paragraph)
+        """
+        chunk_size = self.chunk_size or self.batch_size or 64
+        for start in range(0, len(model_input), chunk_size):
+            inputs = model_input[start:start + chunk_size]
+            highlights = model_highlight[start:start + chunk_size]
+            model_input_flat = list(chain(*[[i] * len(h) for i, h in zip(inputs, highlights)]))
+            model_highlight_flat = list(chain(*highlights))
+            prediction_flat = model.generate_q(
+                list_context=model_input_flat,
+                list_answer=model_highlight_flat,
+                num_beams=self.n_beams,
+                batch_size=self.batch_size)
+            _index = 0
+            prediction = []
+            for h in highlights:
+                questions = prediction_flat[_index:_index+len(h)]
+                answers = model_highlight_flat[_index:_index+len(h)]
+                # Bỏ answer bị drop khi sinh câu hỏi (None)
+                prediction.append([(q, a) for q, a in zip(questions, answers) if q is not None])
+                _index += len(h)
+            yield list(range(start, start + len(inputs))), prediction
+
     def evaluation(self):
         if self.model_ae is not None:
             metric_file = f"{self.export_dir}/metric.first.answer.paragraph.questions_answers." \
@@ -126,34 +175,27 @@ class Evaluation:
                     prediction = _prediction
             if prediction is None:
                 model = self.load_model()
-                # model prediction
+                # model prediction: kết quả được trả về và ghi ra file theo từng chunk paragraph
                 if not self.use_reference_answer:
                     logging.info("model prediction: (qag model)")
-                    prediction = model.generate_qa(
+                    stream = model.iter_qa(
                         list_context=model_input,
                         num_beams=self.n_beams,
-                        batch_size=self.batch_size)
+                        batch_size=self.batch_size,
+                        chunk_size=self.chunk_size)
                 else:
                     logging.info("model prediction: (qg model, answer fixed by reference)")
-                    model_input_flat = list(chain(*[[i] * len(h) for i, h in zip(model_input, model_highlight)]))
-                    model_highlight_flat = list(chain(*model_highlight))
-                    prediction_flat = model.generate_q(
-                        list_context=model_input_flat,
-                        list_answer=model_highlight_flat,
-                        num_beams=self.n_beams,
-                        batch_size=self.batch_size)
-                    _index = 0
-                    prediction = []
-                    for h in model_highlight:
-                        questions = prediction_flat[_index:_index+len(h)]
-                        answers = model_highlight_flat[_index:_index+len(h)]
-                        prediction.append(list(zip(questions, answers)))
-                        _index += len(h)
+                    stream = self.iter_reference_qa(model, model_input, model_highlight)
 
                 # formatting prediction
-                prediction = [' [SEP] '.join([f"question: {q}, answer: {a}" for q, a in p])
-                              if p is not None else "" for p in prediction]
-                assert len(prediction) == len(model_input), f"{len(prediction)} != {len(model_input)}"
-                for i in range(len(prediction)):
-                    save_result(path=f'{_file}.csv',
-                                result={'prediction': prediction[i], 'reference': gold_reference[i]})
\ No newline at end of file
+                n_prediction = 0
+                for indices, prediction in stream:
+                    for i, p in zip(indices, prediction):
+                        p = ' [SEP] '.join([f"question: {q}, answer: {a}" for q, a in p]) if p is not None else ""
+                        save_result(path=f'{_file}.csv', result={'prediction': p, 'reference': gold_reference[i]})
+                        n_prediction += 1
+                assert n_prediction == len(model_input), f"{n_prediction} != {len(model_input)}"
+        if self._model is not None:
+            logging.info(f'model memory: {self._model.model_registry.memory_report()}')
+            self._model.release()
+            self._model = None
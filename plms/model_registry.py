@@ -0,0 +1,223 @@
+""" Process-wide registry of loaded checkpoints with reference counting and memory-budgeted LRU eviction. """
+import os
+import gc
+import time
+import logging
+import threading
+from collections import OrderedDict
+import torch
+
+__all__ = ('ModelRegistry', 'default_registry', 'model_memory')
+
+# Ngân sách bộ nhớ mặc định (GB) của registry dùng chung; không đặt -> không giới hạn
+MODEL_REGISTRY_RAM_GB = os.getenv('MODEL_REGISTRY_RAM_GB')
+MODEL_REGISTRY_VRAM_GB = os.getenv('MODEL_REGISTRY_VRAM_GB')
+
+_GB = 1024 ** 3
+
+
+def _modules(value):
+    """Các torch.nn.Module nằm trong giá trị đã nạp (model hoặc tuple (tokenizer, model, config), ...)."""
+    if isinstance(value, torch.nn.Module):
+        return [value]
+    if isinstance(value, (tuple, list)):
+        return [m for v in value for m in _modules(v)]
+    return []
+
+
+def model_memory(value):
+    """Số byte weight/buffer của các model trong `value`, theo loại device: {'cpu': ..., 'cuda': ...}.
+
+    Tensor dùng chung (ví dụ embedding được tie với lm_head) chỉ tính 1 lần. Lớp Linear đã quantize động
+    (weight int8 đóng gói, không nằm trong parameters()) được tính qua `_weight_bias()`.
+    Giá trị không phải model PyTorch (ví dụ session ONNX Runtime) -> {}.
+    """
+    usage, seen = {}, set()
+
+    def add(tensor):
+        if tensor is None or tensor.data_ptr() in seen:
+            return
+        seen.add(tensor.data_ptr())
+        usage[tensor.device.type] = usage.get(tensor.device.type, 0) + tensor.numel() * tensor.element_size()
+
+    for module in _modules(value):
+        for tensor in module.parameters():
+            add(tensor)
+        for tensor in module.buffers():
+            add(tensor)
+        for submodule in module.modules():
+            weight_bias = getattr(submodule, '_weight_bias', None)
+            if callable(weight_bias):
+                for tensor in weight_bias():
+                    add(tensor)
+    return usage
+
+
+class _Entry:
+    """1 checkpoint đã nạp trong registry."""
+
+    def __init__(self, value, load_seconds: float):
+        self.value = value
+        self.refcount = 0
+        self.load_seconds = load_seconds
+        self.last_used = time.time()
+
+
+class ModelRegistry:
+    """Nạp mỗi checkpoint 1 lần trong process và dùng chung giữa các nơi cần nó.
+
+    Mỗi lần `acquire` tăng số tham chiếu của checkpoint (nạp nếu chưa có), `release` giảm đi 1.
+    Checkpoint không còn ai dùng vẫn được giữ lại để lần sau nạp tức thì, cho tới khi tổng bộ nhớ
+    vượt ngân sách RAM/VRAM: khi đó các checkpoint không còn tham chiếu bị loại theo thứ tự
+    ít dùng gần đây nhất (LRU). Checkpoint đang được dùng không bao giờ bị loại.
+    """
+
+    def __init__(self, ram_budget_gb: float = None, vram_budget_gb: float = None):
+        """
+        Args:
+            ram_budget_gb: Ngân sách RAM (GB) cho weight trên CPU (None -> không giới hạn)
+            vram_budget_gb: Ngân sách VRAM (GB) cho weight trên GPU (None -> không giới hạn)
+        """
+        self.budgets = {'cpu': ram_budget_gb, 'cuda': vram_budget_gb}
+        self.entries = OrderedDict()  # Thứ tự LRU: phần tử đầu là ít dùng gần đây nhất
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._loading = {}  # Khóa riêng của các checkpoint đang được nạp
+
+    @staticmethod
+    def key(name: str, **options):
+        """Khóa của checkpoint: tên model + các tùy chọn nạp (quantize, backend, device, ...)."""
+        return (name,) + tuple(sorted((k, repr(v)) for k, v in options.items()))
+
+    def acquire(self, key, loader, *args, **kwargs):
+        """Lấy checkpoint theo khóa (nạp bằng `loader(*args, **kwargs)` nếu chưa có) và tăng số tham chiếu.
+
+        Việc nạp chỉ giữ khóa riêng của checkpoint đó: nhiều lời gọi cùng khóa chờ nhau và chỉ nạp 1 lần,
+        còn acquire/release các checkpoint khác không bị chặn trong lúc tải.
+        """
+        with self._lock:
+            if key in self.entries:
+                return self._reuse(key)
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self.entries:  # Thread khác vừa nạp xong trong lúc chờ
+                    return self._reuse(key)
+            try:
+                start = time.perf_counter()
+                value = loader(*args, **kwargs)
+                seconds = time.perf_counter() - start
+                with self._lock:
+                    self.entries[key] = _Entry(value, seconds)
+                    logging.info(f'model registry: loaded {key[0]} in {round(seconds, 2)}s')
+                    return self._use(key)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+
+    def _reuse(self, key):
+        logging.info(f'model registry: reuse {key[0]} ({self.entries[key].refcount} other reference(s))')
+        return self._use(key)
+
+    def _use(self, key):
+        """Tăng số tham chiếu của checkpoint đã có (gọi khi đang giữ self._lock)."""
+        entry = self.entries[key]
+        entry.refcount += 1
+        entry.last_used = time.time()
+        self.entries.move_to_end(key)
+        self.evict()
+        return entry.value
+
+    def release(self, key):
+        """Giảm số tham chiếu của checkpoint; checkpoint được giữ lại cho tới khi cần giải phóng bộ nhớ."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            entry.refcount = max(entry.refcount - 1, 0)
+            self.evict()
+
+    def usage(self):
+        """Tổng số byte weight của mọi checkpoint theo loại device."""
+        total = {}
+        for entry in list(self.entries.values()):
+            for device, size in model_memory(entry.value).items():
+                total[device] = total.get(device, 0) + size
+        return total
+
+    def _over_budget(self):
+        usage = self.usage()
+        return [d for d, budget in self.budgets.items() if budget is not None and usage.get(d, 0) > budget * _GB]
+
+    def evict(self):
+        """Loại các checkpoint không còn tham chiếu (LRU trước) cho tới khi bộ nhớ nằm trong ngân sách.
+
+        Returns:
+            List khóa đã bị loại
+        """
+        evicted = []
+        with self._lock:
+            over = self._over_budget()
+            for key in list(self.entries):
+                if len(over) == 0:
+                    break
+                entry = self.entries[key]
+                if entry.refcount > 0 or not any(model_memory(entry.value).get(d, 0) > 0 for d in over):
+                    continue
+                del self.entries[key]
+                evicted.append(key)
+                logging.info(f'model registry: evicted {key[0]} (over budget: {over})')
+                over = self._over_budget()
+            if len(evicted) > 0:
+                self.evictions += len(evicted)
+                gc.collect()
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            elif len(over) > 0:
+                logging.warning(f'model registry: over budget {over} but every loaded model is in use')
+        return evicted
+
+    def clear(self):
+        """Loại mọi checkpoint không còn tham chiếu."""
+        with self._lock:
+            for key in [k for k, e in self.entries.items() if e.refcount == 0]:
+                del self.entries[key]
+            gc.collect()
+
+    def memory_report(self):
+        """Bộ nhớ (GB) của từng checkpoint đang giữ, số tham chiếu và tổng so với ngân sách."""
+        with self._lock:
+            models = []
+            for key, entry in self.entries.items():
+                memory = model_memory(entry.value)
+                models.append({
+                    'name': key[0],
+                    'options': dict(key[1:]),
+                    'refcount': entry.refcount,
+                    'ram_gb': memory.get('cpu', 0) / _GB,
+                    'vram_gb': memory.get('cuda', 0) / _GB,
+                    'load_seconds': entry.load_seconds,
+                    'idle_seconds': time.time() - entry.last_used
+                })
+            usage = self.usage()
+            return {
+                'models': models,
+                'ram_gb': usage.get('cpu', 0) / _GB,
+                'vram_gb': usage.get('cuda', 0) / _GB,
+                'ram_budget_gb': self.budgets['cpu'],
+                'vram_budget_gb': self.budgets['cuda'],
+                'evictions': self.evictions
+            }
+
+
+_DEFAULT_REGISTRY = None
+
+
+def default_registry():
+    """Registry dùng chung của cả process (ngân sách lấy từ MODEL_REGISTRY_RAM_GB / MODEL_REGISTRY_VRAM_GB)."""
+    global _DEFAULT_REGISTRY
+    if _DEFAULT_REGISTRY is None:
+        _DEFAULT_REGISTRY = ModelRegistry(
+            ram_budget_gb=None if MODEL_REGISTRY_RAM_GB is None else float(MODEL_REGISTRY_RAM_GB),
+            vram_budget_gb=None if MODEL_REGISTRY_VRAM_GB is None else float(MODEL_REGISTRY_VRAM_GB))
+    return _DEFAULT_REGISTRY
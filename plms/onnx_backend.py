@@ -0,0 +1,75 @@
+""" ONNX Runtime backend for seq2seq generation. """
+import os
+import shutil
+import logging
+import tempfile
+from os.path import join as pj
+from .feature_store import fingerprint
+from .generation_cache import model_identity
+
+__all__ = ('onnx_cache_path', 'load_onnx_model', 'export_onnx_model', 'VALID_BACKENDS')
+
+# Các backend thực thi model.generate()
+VALID_BACKENDS = ('torch', 'onnx')
+# Thư mục lưu graph ONNX của model trên hub (model local thì lưu ngay trong thư mục model)
+ONNX_CACHE_DIR = pj(os.path.expanduser('~'), '.cache', 'plms', 'onnx')
+
+
+def _ort_model_class():
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError:
+        raise ImportError("backend='onnx' cần optimum và onnxruntime: pip install optimum[onnxruntime]")
+    return ORTModelForSeq2SeqLM
+
+
+def onnx_cache_path(model_name: str, config, vocab_size: int):
+    """Thư mục chứa graph ONNX (encoder, decoder, decoder-with-past) của model.
+
+    Model local -> `<thư mục model>/onnx.<fingerprint>`, model trên hub -> `~/.cache/plms/onnx/<tên>.<fingerprint>`.
+    Fingerprint gồm tên model, revision (commit trên hub, hoặc thời điểm sửa file weight với model local,
+    xem `model_identity`) và số token (sau khi thêm <hl>), nên weight trong thư mục model bị ghi đè
+    (train lại) thì graph cũ không bị dùng nhầm.
+    """
+    key = fingerprint(model_identity(model_name, config), vocab_size)[:16]
+    if os.path.isdir(model_name):
+        return pj(model_name, f'onnx.{key}')
+    return pj(ONNX_CACHE_DIR, f"{model_name.replace('/', '_')}.{key}")
+
+
+def load_onnx_model(path: str, provider: str = 'CPUExecutionProvider'):
+    """Nạp graph ONNX đã export (None nếu chưa có) thành model có `generate()` giống transformers."""
+    if not os.path.exists(pj(path, 'config.json')):
+        return None
+    logging.info(f'loading onnx model from {path}')
+    return _ort_model_class().from_pretrained(path, use_cache=True, provider=provider)
+
+
+def export_onnx_model(model, tokenizer, path: str, provider: str = 'CPUExecutionProvider'):
+    """Export model PyTorch (đã resize embedding cho <hl>) sang ONNX một lần và lưu vào `path`.
+
+    Model được lưu tạm ra đĩa để optimum export encoder, decoder và decoder-with-past (KV cache),
+    sau đó graph được chuyển vào `path` và nạp lại từ đó.
+
+    Args:
+        model: Model PyTorch seq2seq
+        tokenizer: Tokenizer tương ứng (lưu kèm graph)
+        path: Thư mục lưu graph ONNX
+        provider: Execution provider của ONNX Runtime
+
+    Returns:
+        ORTModelForSeq2SeqLM
+    """
+    ort_model_class = _ort_model_class()
+    logging.info(f'exporting onnx model to {path}')
+    with tempfile.TemporaryDirectory() as tmp:
+        model.save_pretrained(pj(tmp, 'torch'))
+        tokenizer.save_pretrained(pj(tmp, 'torch'))
+        ort_model = ort_model_class.from_pretrained(pj(tmp, 'torch'), export=True, use_cache=True, provider=provider)
+        ort_model.save_pretrained(pj(tmp, 'onnx'))
+        tokenizer.save_pretrained(pj(tmp, 'onnx'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        shutil.move(pj(tmp, 'onnx'), path)
+    return load_onnx_model(path, provider)
@@ -0,0 +1,191 @@
+""" Multi-process / multi-device inference executors for TransformersQG. """
+import os
+import copy
+import queue
+import logging
+from itertools import chain
+from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+import torch
+import torch.multiprocessing as mp
+
+__all__ = ('CPUInferencePool', 'DeviceShardedExecutor')
+
+# Model của process worker hiện tại: {tên model: model}, được gán trong _init_worker
+_WORKER_MODELS = {}
+
+
+def _init_worker(models: Dict, num_threads: int):
+    """Khởi tạo 1 worker: giới hạn số thread của torch và giữ tham chiếu tới model (weight dùng chung)."""
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:  # Chỉ gọi được trước khi torch chạy tác vụ song song đầu tiên
+        pass
+    _WORKER_MODELS.update(models)
+    for model in models.values():
+        if isinstance(model, torch.nn.Module):
+            model.eval()
+
+
+def _generate_in_worker(task):
+    """Chạy model.generate() cho 1 batch trong worker, trả về token id (decode ở process chính)."""
+    name, encode, num_beams, max_length_output = task
+    with torch.no_grad():
+        tensor = _WORKER_MODELS[name].generate(**encode, max_length=max_length_output, num_beams=num_beams)
+    return tensor.tolist()
+
+
+class CPUInferencePool:
+    """Chia các batch generate cho N process worker trên CPU.
+
+    Mỗi worker được spawn với `torch.set_num_threads(threads_per_worker)`, nên N worker x số thread
+    không vượt quá số core và không tranh chấp thread với nhau. Weight của model được chuyển vào
+    shared memory (`model.share_memory()`), các worker dùng chung 1 bản weight thay vì mỗi worker
+    nạp 1 bản. Process chính tokenize, chia batch và decode; worker chỉ chạy generate.
+    Kết quả được gộp lại đúng thứ tự batch.
+
+    Lưu ý: worker được tạo bằng `spawn`, nên script gọi cần có `if __name__ == '__main__':`.
+    """
+
+    def __init__(self, models: Dict, n_workers: int = 2, threads_per_worker: int = None):
+        """
+        Args:
+            models: {tên: model} các model PyTorch trên CPU cần dùng trong worker (ví dụ model chính, model AE)
+            n_workers: Số process worker
+            threads_per_worker: Số thread torch của mỗi worker (None -> chia đều số core cho các worker)
+        """
+        self.n_workers = n_workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // n_workers)
+        for model in models.values():
+            if isinstance(model, torch.nn.Module):
+                model.share_memory()
+        logging.info(f'starting cpu inference pool: {n_workers} workers x {self.threads_per_worker} threads')
+        self.pool = mp.get_context('spawn').Pool(
+            n_workers, initializer=_init_worker, initargs=(models, self.threads_per_worker))
+
+    def generate(self, name: str, batches: List[Dict], tokenizer, num_beams: int, max_length_output: int):
+        """Generate cho danh sách batch đã collate, mỗi batch chạy trên 1 worker.
+
+        Args:
+            name: Tên model (key của `models` lúc khởi tạo)
+            batches: List dict tensor (input_ids, attention_mask, có thể kèm labels)
+            tokenizer: Tokenizer để decode output
+            num_beams: Số beam search
+            max_length_output: Độ dài tối đa output
+
+        Returns:
+            List chuỗi đã decode, theo đúng thứ tự batch và thứ tự sample trong batch
+        """
+        tasks = [(name, {k: v for k, v in encode.items() if k != 'labels'}, num_beams, max_length_output)
+                 for encode in batches]
+        outputs = []
+        for token_ids in self.pool.imap(_generate_in_worker, tasks):
+            outputs += tokenizer.batch_decode(token_ids, skip_special_tokens=True)
+        return outputs
+
+    def close(self):
+        """Dừng các worker."""
+        self.pool.close()
+        self.pool.join()
+
+
+class DeviceShardedExecutor:
+    """Chia các batch generate cho nhiều GPU, mỗi GPU giữ 1 bản model riêng.
+
+    Khác với DataParallel (generate qua `model.module` chỉ chạy trên 1 GPU), mỗi GPU có 1 thread
+    lấy batch tiếp theo từ hàng đợi chung và chạy generate trên bản model của mình, nên GPU nào xong
+    trước sẽ nhận thêm việc. Bản model trên GPU khác với GPU gốc được tạo khi generate lần đầu
+    (sau `reset()` thì tạo lại, ví dụ khi weight đã được train tiếp). Kết quả giữ đúng thứ tự batch.
+
+    Máy không có GPU: chuyển sang CPUInferencePool với `cpu_workers` process, cùng interface.
+    """
+
+    def __init__(self,
+                 models: Dict,
+                 devices: List[str] = None,
+                 cpu_workers: int = 2,
+                 threads_per_worker: int = None):
+        """
+        Args:
+            models: {tên: model} các model PyTorch cần dùng (ví dụ model chính, model AE)
+            devices: Danh sách device (None -> mọi GPU đang có)
+            cpu_workers: Số process worker khi không có GPU
+            threads_per_worker: Số thread torch mỗi process worker khi không có GPU
+        """
+        devices = [f'cuda:{i}' for i in range(torch.cuda.device_count())] if devices is None else devices
+        self.models = models
+        self.devices = [torch.device(d) for d in devices]
+        self.cpu_pool = None
+        self._replicas = {}
+        if len(self.devices) == 0 or all(d.type == 'cpu' for d in self.devices):
+            self.cpu_pool = CPUInferencePool(models, cpu_workers, threads_per_worker)
+            self.n_workers = self.cpu_pool.n_workers
+            self.executor = None
+        else:
+            logging.info(f'sharding inference across devices: {[str(d) for d in self.devices]}')
+            self.n_workers = len(self.devices)
+            self.executor = ThreadPoolExecutor(self.n_workers, thread_name_prefix='plms-shard')
+
+    def replicas(self, name: str):
+        """{device: model} của model `name`, dùng chính model gốc trên device của nó và copy sang device còn lại."""
+        if name not in self._replicas:
+            model = self.models[name]
+            source = next(model.parameters()).device
+            replicas = {}
+            for device in self.devices:
+                if device == source:
+                    replicas[device] = model
+                else:
+                    logging.info(f'copying `{name}` to {device}')
+                    replicas[device] = copy.deepcopy(model).to(device).eval()
+            self._replicas[name] = replicas
+        return self._replicas[name]
+
+    def reset(self):
+        """Bỏ các bản copy trên GPU (tạo lại từ weight hiện tại ở lần generate sau)."""
+        self._replicas = {}
+
+    def generate(self, name: str, batches: List[Dict], tokenizer, num_beams: int, max_length_output: int):
+        """Generate cho danh sách batch đã collate, các batch được chia cho các device.
+
+        Args:
+            name: Tên model (key của `models` lúc khởi tạo)
+            batches: List dict tensor (input_ids, attention_mask, có thể kèm labels)
+            tokenizer: Tokenizer để decode output
+            num_beams: Số beam search
+            max_length_output: Độ dài tối đa output
+
+        Returns:
+            List chuỗi đã decode, theo đúng thứ tự batch và thứ tự sample trong batch
+        """
+        if self.cpu_pool is not None:
+            return self.cpu_pool.generate(name, batches, tokenizer, num_beams, max_length_output)
+        tasks = queue.Queue()
+        for index, encode in enumerate(batches):
+            tasks.put((index, encode))
+        outputs = [None] * len(batches)
+
+        def work(model, device):
+            while True:
+                try:
+                    index, encode = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                encode = {k: v.to(device) for k, v in encode.items() if k != 'labels'}
+                with torch.no_grad():
+                    outputs[index] = model.generate(
+                        **encode, max_length=max_length_output, num_beams=num_beams).cpu()
+
+        futures = [self.executor.submit(work, model, device) for device, model in self.replicas(name).items()]
+        for future in futures:
+            future.result()
+        # Decode ở thread gọi (tokenizer không dùng chung giữa các thread)
+        return list(chain(*[tokenizer.batch_decode(tensor, skip_special_tokens=True) for tensor in outputs]))
+
+    def close(self):
+        """Dừng các worker."""
+        if self.cpu_pool is not None:
+            self.cpu_pool.close()
+        else:
+            self.executor.shutdown()
@@ -0,0 +1,123 @@
+""" Overlapped AE -> QG executor for TransformersQG.generate_qa. """
+import time
+import queue
+import logging
+import threading
+from typing import List
+
+__all__ = ('PipelinedQAG',)
+
+# Đánh dấu stage AE đã xử lý hết input
+_END = object()
+
+
+class PipelinedQAG:
+    """Chạy Answer Extraction và Question Generation gối đầu nhau theo từng chunk context.
+
+    Stage AE (thread phụ) chạy generate_a trên từng chunk và đẩy answer vào hàng đợi có giới hạn;
+    stage QG (thread gọi run) lấy answer ra và chạy QG ngay, trong khi AE đã xử lý chunk tiếp theo.
+    Nhờ vậy phần xử lý phía host (tách câu, tokenize, decode, lọc answer) của stage này chạy song song
+    với generate của stage kia, và thông lượng tiến gần tới thông lượng của stage chậm hơn.
+    Kết quả luôn được ghi vào đúng vị trí của context, nên thứ tự output giống hệt generate_qa.
+    """
+    # Số context mỗi chunk khi không truyền batch_size
+    default_chunk_size = 64
+
+    def __init__(self, model, chunk_size: int = default_chunk_size, queue_size: int = 2):
+        """
+        Args:
+            model: TransformersQG (không phải QAG end-to-end)
+            chunk_size: Số context mỗi chunk AE
+            queue_size: Số chunk AE tối đa đã xong nhưng chưa được QG xử lý (giới hạn bộ nhớ)
+        """
+        self.model = model
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.stats = None
+
+    def run(self,
+            list_context: List,
+            batch_size: int = None,
+            num_beams: int = 4,
+            cache_path: str = None,
+            num_questions: int = None,
+            sentence_level: bool = False):
+        """Sinh cặp QA cho toàn bộ context.
+
+        Args:
+            list_context: Danh sách context
+            batch_size: Batch size cho inference
+            num_beams: Số beam search
+            cache_path: Đường dẫn cache feature đã encode
+            num_questions: Giới hạn số câu hỏi (chủ yếu cho spaCy AE)
+            sentence_level: Bật prediction theo câu để giảm độ phức tạp
+
+        Returns:
+            Danh sách cặp (question, answer) cho mỗi context (None nếu context không có answer)
+        """
+        answers = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        busy = {'ae': 0.0, 'qg': 0.0}
+        wait = {'ae': 0.0, 'qg': 0.0}
+
+        def put(item):
+            # Chờ chỗ trống trong hàng đợi, dừng lại nếu stage QG đã lỗi
+            start = time.perf_counter()
+            while not stop.is_set():
+                try:
+                    answers.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            wait['ae'] += time.perf_counter() - start
+
+        def answer_extraction():
+            try:
+                for start in range(0, len(list_context), self.chunk_size):
+                    if stop.is_set():
+                        return
+                    chunk = list_context[start:start + self.chunk_size]
+                    begin = time.perf_counter()
+                    list_answer = self.model.generate_a(
+                        chunk, batch_size=batch_size, num_beams=num_beams, cache_path=cache_path,
+                        sentence_level=sentence_level, num_questions=num_questions)
+                    busy['ae'] += time.perf_counter() - begin
+                    put((start, chunk, list_answer))
+                put(_END)
+            except BaseException as error:
+                put(error)
+
+        output = [None] * len(list_context)
+        wall = time.perf_counter()
+        producer = threading.Thread(target=answer_extraction, name='plms-ae', daemon=True)
+        producer.start()
+        try:
+            while True:
+                begin = time.perf_counter()
+                item = answers.get()
+                wait['qg'] += time.perf_counter() - begin
+                if item is _END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                start, chunk, list_answer = item
+                begin = time.perf_counter()
+                output[start:start + len(chunk)] = self.model.generate_q_from_answers(
+                    chunk, list_answer, batch_size=batch_size, num_beams=num_beams, cache_path=cache_path,
+                    sentence_level=sentence_level)
+                busy['qg'] += time.perf_counter() - begin
+        finally:
+            stop.set()
+            producer.join()
+        wall = time.perf_counter() - wall
+
+        self.stats = {
+            'wall_seconds': wall,
+            'busy_seconds': busy,
+            'wait_seconds': wait,
+            'utilization': {k: v / wall if wall > 0 else 0.0 for k, v in busy.items()},
+            'n_chunks': -(-len(list_context) // self.chunk_size)
+        }
+        logging.info(f'pipelined qag: {round(wall, 2)}s, utilization ae {round(self.stats["utilization"]["ae"], 2)}'
+                     f', qg {round(self.stats["utilization"]["qg"], 2)}')
+        return output
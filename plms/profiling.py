@@ -0,0 +1,229 @@
+""" Stage-level profiling: wall time, sizes and peak memory per stage, exported as JSON or Chrome trace. """
+import os
+import json
+import time
+import threading
+from typing import Callable, Dict, List
+
+__all__ = ('Profiler', 'stage', 'active_profiler')
+
+try:
+    import resource  # Chỉ có trên Unix: peak RSS của process
+except ImportError:
+    resource = None
+
+
+class _NullStage:
+    """Stage khi không bật profiler: mọi thao tác đều không làm gì."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+    def update(self, **info):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _NullProfiler:
+    """Profiler mặc định khi không bật: `stage()` trả về ngay 1 đối tượng dùng chung, không ghi gì."""
+    enabled = False
+
+    def stage(self, name: str, **info):
+        return _NULL_STAGE
+
+
+_ACTIVE = _NullProfiler()
+
+
+def active_profiler():
+    """Profiler đang bật trong process (hoặc profiler rỗng nếu không có)."""
+    return _ACTIVE
+
+
+def stage(name: str, **info):
+    """Đo 1 stage bằng profiler đang bật: `with stage('generate', batch_size=8) as s: ...; s.update(tokens=...)`.
+
+    Không có profiler nào đang bật -> chỉ tốn 1 lần gọi hàm và trả về context rỗng dùng chung.
+    """
+    return _ACTIVE.stage(name, **info)
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    # ru_maxrss: KB trên Linux, byte trên macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+class _Stage:
+    """1 lần đo: thời gian bắt đầu/kết thúc, thông tin kèm theo (số token, batch size, ...) và peak memory."""
+
+    def __init__(self, profiler, name: str, info: Dict):
+        self.profiler = profiler
+        self.name = name
+        self.info = info
+        self.peak_cuda = 0  # Peak VRAM trong stage (kể cả các stage con), xem Profiler._cuda_peak
+
+    def update(self, **info):
+        """Bổ sung thông tin chỉ biết sau khi chạy (ví dụ số token output)."""
+        self.info.update(info)
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        self.depth = len(stack)
+        self.parent = stack[-1].name if stack else None
+        self.profiler._cuda_peak(stack[-1] if stack else None, reset=True)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.profiler._synchronize()
+        end = time.perf_counter()
+        stack = self.profiler._stack()
+        stack.pop()
+        self.profiler._cuda_peak(self)
+        if stack:
+            stack[-1].peak_cuda = max(stack[-1].peak_cuda, self.peak_cuda)
+        self.profiler._record(self, end)
+        return False
+
+
+class Profiler:
+    """Ghi thời gian từng stage của pipeline (tách câu, encode, copy lên device, generate, decode, lọc kết quả).
+
+    Dùng như context manager: trong khối `with`, mọi stage được đo bằng `plms.profiling.stage` (đã gắn sẵn
+    trong TransformersQG, EncodePlus và SpacyPipeline) được ghi lại::
+
+        with Profiler() as profiler:
+            model.generate_qa(contexts)
+        print(profiler.summary())
+        profiler.export_chrome_trace('trace.json')  # mở bằng chrome://tracing hoặc Perfetto
+
+    Mỗi stage ghi thời gian, độ sâu lồng nhau, thread, thông tin kèm theo (số mẫu, token, batch size) và
+    bộ nhớ: peak VRAM đã cấp phát trong chính stage đó (nếu có GPU) và peak RSS của process tính tới cuối stage
+    (hệ điều hành không cho reset peak RSS). Bộ đếm VRAM dùng chung cả process nên khi nhiều thread chạy
+    stage cùng lúc, peak của 1 stage có thể gồm cả phần của thread khác. Callback (nếu có) được gọi với
+    từng record ngay khi stage kết thúc. Ngoài khối `with`, các stage không tốn gì đáng kể.
+    """
+    enabled = True
+
+    def __init__(self, callbacks: List[Callable] = None, track_memory: bool = True, cuda_sync: bool = True):
+        """
+        Args:
+            callbacks: Các hàm nhận record (dict) của từng stage khi stage kết thúc
+            track_memory: Ghi peak memory ở cuối mỗi stage
+            cuda_sync: Đồng bộ CUDA ở cuối mỗi stage để thời gian phản ánh đúng phần việc trên GPU
+        """
+        self.callbacks = list(callbacks or [])
+        self.track_memory = track_memory
+        self.cuda_sync = cuda_sync
+        self.records = []
+        self._origin = None
+        self._previous = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._torch = None
+
+    def __enter__(self):
+        global _ACTIVE
+        self._origin = time.perf_counter()
+        try:
+            import torch
+            self._torch = torch if torch.cuda.is_available() else None
+        except ImportError:
+            self._torch = None
+        self._previous, _ACTIVE = _ACTIVE, self
+        return self
+
+    def __exit__(self, *_):
+        global _ACTIVE
+        _ACTIVE = self._previous
+        return False
+
+    def stage(self, name: str, **info):
+        return _Stage(self, name, info)
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _cuda_peak(self, s: _Stage = None, reset: bool = False):
+        """Cộng peak VRAM từ lần reset trước vào stage `s` (nếu có), sau đó reset bộ đếm nếu cần.
+
+        Bộ đếm max_memory_allocated của torch là của cả process: reset khi bắt đầu mỗi stage để peak ghi được
+        là của riêng stage đó (không phải peak từ đầu process); peak của stage con được cộng dồn lên stage cha.
+        """
+        if not self.track_memory or self._torch is None:
+            return
+        if s is not None:
+            s.peak_cuda = max(s.peak_cuda, self._torch.cuda.max_memory_allocated())
+        if reset:
+            self._torch.cuda.reset_peak_memory_stats()
+
+    def _synchronize(self):
+        if self.cuda_sync and self._torch is not None:
+            self._torch.cuda.synchronize()
+
+    def _record(self, s: _Stage, end: float):
+        record = {
+            'name': s.name,
+            'start': s.start - self._origin,
+            'seconds': end - s.start,
+            'depth': s.depth,
+            'parent': s.parent,
+            'thread': threading.get_ident(),
+            **s.info
+        }
+        if self.track_memory:
+            record['process_peak_rss_bytes'] = _peak_rss_bytes()
+            if self._torch is not None:
+                record['peak_cuda_bytes'] = s.peak_cuda
+        with self._lock:
+            self.records.append(record)
+        for callback in self.callbacks:
+            callback(record)
+
+    def summary(self):
+        """Tổng hợp theo tên stage: số lần, tổng/trung bình thời gian, tổng các thông tin dạng số, peak memory."""
+        output = {}
+        for record in self.records:
+            item = output.setdefault(record['name'], {'count': 0, 'total_seconds': 0.0})
+            item['count'] += 1
+            item['total_seconds'] += record['seconds']
+            for key, value in record.items():
+                if key in ('name', 'start', 'seconds', 'depth', 'parent', 'thread') or type(value) not in (int, float):
+                    continue
+                if 'peak_' in key:
+                    item[key] = max(item.get(key, 0), value)
+                else:
+                    item[key] = item.get(key, 0) + value
+        for item in output.values():
+            item['mean_seconds'] = item['total_seconds'] / item['count']
+        return output
+
+    def export_json(self, path: str):
+        """Lưu tổng hợp và toàn bộ record ra file JSON."""
+        with open(path, 'w') as f:
+            json.dump({'summary': self.summary(), 'stages': self.records}, f, indent=4, default=str)
+
+    def export_chrome_trace(self, path: str):
+        """Lưu record theo định dạng Chrome trace (mở bằng chrome://tracing hoặc ui.perfetto.dev)."""
+        events = [{
+            'name': r['name'],
+            'ph': 'X',
+            'ts': r['start'] * 1e6,
+            'dur': r['seconds'] * 1e6,
+            'pid': os.getpid(),
+            'tid': r['thread'],
+            'args': {k: v for k, v in r.items() if k not in ('name', 'start', 'seconds', 'thread')}
+        } for r in self.records]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
@@ -0,0 +1,69 @@
+""" Dynamic int8 quantization of seq2seq models for CPU inference. """
+import os
+import logging
+from os.path import join as pj
+import torch
+from .feature_store import fingerprint
+from .generation_cache import model_identity
+
+__all__ = ('quantize_model', 'quantized_cache_path', 'load_quantized', 'save_quantized', 'model_size')
+
+# Thư mục lưu model đã quantize (dùng lại cho các lần nạp sau)
+QUANTIZED_CACHE_DIR = pj(os.path.expanduser('~'), '.cache', 'plms', 'quantized')
+
+
+def quantize_model(model):
+    """Quantize động (dynamic) toàn bộ lớp Linear của model sang int8.
+
+    Weight được lưu dạng int8, activation được quantize ngay lúc chạy, nên không cần dữ liệu
+    calibration. Chỉ dùng được trên CPU (backend fbgemm/qnnpack).
+
+    Args:
+        model: Model PyTorch (fp32) đã nạp
+
+    Returns:
+        Model mới với các lớp Linear đã được thay bằng bản int8
+    """
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantized_cache_path(model_name: str, config, vocab_size: int):
+    """Đường dẫn file cache model int8: phụ thuộc tên model, revision, số token và phiên bản torch.
+
+    Revision là commit hash trên hub, hoặc thời điểm sửa file weight với model local (xem `model_identity`),
+    nên train lại vào cùng thư mục thì model int8 cũ không bị dùng nhầm.
+    """
+    key = fingerprint(model_identity(model_name, config), vocab_size, torch.__version__)
+    return pj(QUANTIZED_CACHE_DIR, f"{model_name.replace('/', '_')}.{key[:16]}.pt")
+
+
+def load_quantized(path: str):
+    """Nạp model int8 đã lưu (không cần nạp lại weight fp32). Trả về None nếu chưa có cache."""
+    if not os.path.exists(path):
+        return None
+    logging.info(f'loading quantized model from {path}')
+    try:
+        model = torch.load(path, map_location='cpu', weights_only=False)
+    except TypeError:  # torch < 1.13 không có tham số weights_only
+        model = torch.load(path, map_location='cpu')
+    model.eval()
+    return model
+
+
+def save_quantized(model, path: str):
+    """Lưu toàn bộ model int8 (cấu trúc + weight) để lần sau nạp thẳng bằng load_quantized."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    torch.save(model, f'{path}.tmp')
+    os.replace(f'{path}.tmp', path)
+    logging.info(f'quantized model is saved at {path}')
+
+
+def model_size(model):
+    """Tổng số byte weight + buffer của model (tính cả weight int8 đóng gói trong lớp Linear quantize)."""
+    size = sum(t.numel() * t.element_size() for t in model.state_dict().values() if torch.is_tensor(t))
+    for module in model.modules():
+        if hasattr(module, '_packed_params'):
+            weight, bias = module._packed_params._weight_bias()
+            size += weight.numel() * weight.element_size() + (0 if bias is None else bias.numel() * bias.element_size())
+    return size
@@ -0,0 +1,139 @@
+""" Token-budget batch scheduler with out-of-memory back-off. """
+import gc
+import logging
+from collections import deque
+from typing import List, Dict, Callable
+import torch
+
+__all__ = ('TokenBudgetScheduler', 'is_out_of_memory')
+
+
+def is_out_of_memory(error: BaseException):
+    """Kiểm tra exception có phải lỗi hết bộ nhớ (CUDA hoặc CPU) hay không.
+
+    Args:
+        error: Exception bắt được khi chạy batch
+
+    Returns:
+        True nếu là lỗi out-of-memory
+    """
+    if isinstance(error, MemoryError):
+        return True
+    if hasattr(torch.cuda, 'OutOfMemoryError') and isinstance(error, torch.cuda.OutOfMemoryError):
+        return True
+    # PyTorch cũ và allocator CPU báo OOM bằng RuntimeError thông thường
+    message = str(error)
+    return isinstance(error, RuntimeError) and ('out of memory' in message or "can't allocate memory" in message)
+
+
+def release_memory():
+    """Giải phóng bộ nhớ đệm sau khi gặp OOM để lần thử lại có chỗ trống."""
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class TokenBudgetScheduler:
+    """Chia batch theo ngân sách token thay vì số sample cố định.
+
+    Chi phí của 1 batch = (số token của input dài nhất) x (số sample) x num_beams,
+    tức là đúng số token mà encoder và beam search phải xử lý sau khi pad.
+    Khi batch bị out-of-memory: chia đôi batch và chạy lại, đồng thời hạ ngân sách.
+    Ngân sách an toàn được ghi nhớ cho từng `key` (thường là (model, num_beams))
+    và dùng chung trong toàn bộ process, nên lần gọi sau không OOM lại.
+    """
+    # Ngân sách an toàn lớn nhất đã biết cho từng key, dùng chung cả process
+    safe_budget = {}
+
+    def __init__(self, max_tokens: int = None, key=None, num_beams: int = 1):
+        """
+        Args:
+            max_tokens: Ngân sách token tối đa mỗi batch (None -> không giới hạn, chỉ bị hạ khi OOM)
+            key: Khóa ghi nhớ ngân sách an toàn, ví dụ (model_name, num_beams)
+            num_beams: Hệ số nhân chi phí (số beam search, 1 cho training)
+        """
+        self.key = key
+        self.num_beams = num_beams
+        self.max_tokens = float('inf') if max_tokens is None else max_tokens
+        if key is not None and key in self.safe_budget:
+            self.max_tokens = min(self.max_tokens, self.safe_budget[key])
+
+    def cost(self, lengths: List[int]):
+        """Số token (đã pad) mà 1 batch gồm các sample có độ dài `lengths` phải xử lý."""
+        return max(lengths) * len(lengths) * self.num_beams
+
+    def plan(self, lengths: List[int], order: List[int] = None):
+        """Gom các index liên tiếp (theo `order`) thành batch không vượt ngân sách.
+
+        Mỗi batch luôn có ít nhất 1 sample, kể cả khi 1 sample đã vượt ngân sách.
+
+        Args:
+            lengths: Số token của từng sample
+            order: Thứ tự duyệt sample (None -> 0, 1, 2, ...)
+
+        Returns:
+            List các batch, mỗi batch là list index
+        """
+        order = range(len(lengths)) if order is None else order
+        batches, current, longest = [], [], 0
+        for i in order:
+            new_longest = max(longest, lengths[i])
+            if current and new_longest * (len(current) + 1) * self.num_beams > self.max_tokens:
+                batches.append(current)
+                current, new_longest = [], lengths[i]
+            current.append(i)
+            longest = new_longest
+        if current:
+            batches.append(current)
+        return batches
+
+    def shrink(self, failed_cost: int):
+        """Hạ ngân sách sau khi 1 batch có chi phí `failed_cost` bị OOM và ghi nhớ lại."""
+        self.max_tokens = min(self.max_tokens, max(failed_cost // 2, 1))
+        if self.key is not None:
+            self.safe_budget[self.key] = self.max_tokens
+        logging.warning(f'out of memory at {failed_cost} tokens: token budget of {self.key} is set to '
+                        f'{self.max_tokens}')
+
+    def run(self,
+            dataset,
+            lengths: List[int],
+            fn: Callable[[Dict], object],
+            collate_fn: Callable[[List], Dict],
+            order: List[int] = None,
+            on_out_of_memory: Callable[[], List[int]] = None):
+        """Chạy `fn` trên từng batch, tự chia nhỏ batch khi OOM.
+
+        Args:
+            dataset: Dataset trả về dict tensor cho từng index
+            lengths: Số token của từng sample trong dataset
+            fn: Hàm xử lý 1 batch đã collate (generate hoặc forward + backward)
+            collate_fn: Hàm gộp list sample thành batch
+            order: Thứ tự duyệt sample (None -> giữ nguyên thứ tự)
+            on_out_of_memory: Gọi sau mỗi lần OOM, trước khi chạy lại; trả về list index đã yield trước đó
+                cần chạy lại từ đầu (ví dụ training: gradient của cả cửa sổ accumulation đã bị xóa)
+
+        Yields:
+            (list index của batch, output của fn)
+        """
+        pending = deque(self.plan(lengths, order))
+        while len(pending) > 0:
+            indices = pending.popleft()
+            out_of_memory = False
+            try:
+                output = fn(collate_fn([dataset[i] for i in indices]))
+            except Exception as error:
+                if not is_out_of_memory(error) or len(indices) == 1:
+                    raise
+                out_of_memory = True
+            if out_of_memory:
+                # Giải phóng bộ nhớ sau khi ra khỏi khối except: traceback của lỗi còn giữ các frame
+                # (và tensor) của batch lỗi, empty_cache() trong except không trả được phần bộ nhớ đó
+                release_memory()
+                self.shrink(self.cost([lengths[i] for i in indices]))
+                rerun = [] if on_out_of_memory is None else list(on_out_of_memory())
+                # Chia lại toàn bộ phần còn lại theo ngân sách mới (giữ nguyên thứ tự)
+                remaining = rerun + indices + [i for batch in pending for i in batch]
+                pending = deque(self.plan(lengths, remaining))
+                continue
+            yield indices, output
@@ -0,0 +1,327 @@
+""" Local HTTP inference server for TransformersQG with request micro-batching.
+
+Chạy:
+    python -m plms.serve --model='shnl/vit5-vinewsqa-qg-ae' --port=8000 --max_latency_ms=20
+
+Endpoint:
+    POST /generate_qa   {"context": "..." | [...], "num_beams": 4}
+    POST /generate_a    {"context": "..." | [...]}
+    POST /generate_q    {"context": "..." | [...], "answer": "..." | [...]}
+    POST /answer_q      {"context": "..." | [...], "question": "..." | [...]}
+    GET  /metrics       Queue depth, số request/batch, histogram latency (định dạng Prometheus)
+    GET  /health
+"""
+import json
+import time
+import queue
+import logging
+import threading
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Dict
+import fire
+from .language_model import TransformersQG
+
+__all__ = ('MicroBatcher', 'serve', 'TASK_FIELDS')
+
+# Các field input của từng tác vụ (field đầu tiên luôn là context)
+TASK_FIELDS = {
+    'generate_qa': ('context',),
+    'generate_a': ('context',),
+    'generate_q': ('context', 'answer'),
+    'answer_q': ('context', 'question'),
+}
+# Mốc (giây) của histogram latency
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Mốc (số input) của histogram kích thước batch
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class Histogram:
+    """Histogram tích lũy kiểu Prometheus (count theo từng mốc `le`, tổng và số lần quan sát)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for n, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[n] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str = ''):
+        """Xuất histogram theo định dạng text của Prometheus."""
+        sep = ',' if labels else ''
+        lines = [f'{name}_bucket{{{labels}{sep}le="{b}"}} {c}' for b, c in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.sum}')
+        lines.append(f'{name}_count{suffix} {self.count}')
+        return lines
+
+
+class _Request:
+    """1 request HTTP đang chờ trong hàng đợi của MicroBatcher."""
+
+    def __init__(self, task: str, inputs: List, num_beams: int):
+        self.task = task
+        self.inputs = inputs
+        self.num_beams = num_beams
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.output = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Gộp các request đồng thời thành batch chung trước khi gọi model.
+
+    Một thread worker duy nhất lấy request từ hàng đợi: sau khi nhận request đầu tiên, worker chờ thêm
+    tối đa `max_latency` giây (hoặc tới khi đủ `max_batch_size` input) rồi chạy mọi request cùng tác vụ
+    và cùng num_beams trong 1 lần gọi model. Vì chỉ có 1 thread gọi model nên model không cần thread-safe.
+    """
+
+    def __init__(self, model: TransformersQG, max_batch_size: int = 32, max_latency: float = 0.02,
+                 batch_size: int = None):
+        """
+        Args:
+            model: Model đã nạp (dùng chung cho mọi request)
+            max_batch_size: Số input tối đa gộp vào 1 lần gọi model
+            max_latency: Thời gian tối đa (giây) chờ gom thêm request sau request đầu tiên
+            batch_size: Batch size khi generate (None -> chia batch theo ngân sách token của model)
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending_inputs = 0
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.batches = defaultdict(int)
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.worker = threading.Thread(target=self._loop, name='plms-batcher', daemon=True)
+        self.worker.start()
+
+    def submit(self, task: str, inputs: List, num_beams: int = 4):
+        """Đưa request vào hàng đợi và chờ kết quả.
+
+        Args:
+            task: Tên tác vụ (key của TASK_FIELDS)
+            inputs: List tuple input, mỗi tuple theo thứ tự TASK_FIELDS[task]
+            num_beams: Số beam search
+
+        Returns:
+            List output cùng thứ tự với `inputs`
+        """
+        request = _Request(task, inputs, num_beams)
+        with self.lock:
+            self.pending_inputs += len(inputs)
+        self.queue.put(request)
+        request.done.wait()
+        with self.lock:
+            self.requests[task] += 1
+            self.latency[task].observe(time.perf_counter() - request.enqueued)
+            if request.error is not None:
+                self.errors[task] += 1
+        if request.error is not None:
+            raise request.error
+        return request.output
+
+    def _loop(self):
+        while True:
+            batch = [self.queue.get()]
+            n_inputs = len(batch[0].inputs)
+            deadline = batch[0].enqueued + self.max_latency
+            while n_inputs < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                n_inputs += len(request.inputs)
+
+            # Chỉ gộp các request cùng tác vụ và cùng num_beams (giữ thứ tự đến)
+            groups = defaultdict(list)
+            for request in batch:
+                groups[(request.task, request.num_beams)].append(request)
+            for (task, num_beams), requests in groups.items():
+                self._run(task, num_beams, requests)
+
+    def _run(self, task: str, num_beams: int, requests: List[_Request]):
+        inputs = [i for request in requests for i in request.inputs]
+        columns = list(zip(*inputs))
+        with self.lock:
+            self.pending_inputs -= len(inputs)
+            self.batches[task] += 1
+            self.batch_size_histogram.observe(len(inputs))
+        try:
+            if task == 'generate_qa':
+                output = self.model.generate_qa(list(columns[0]), batch_size=self.batch_size, num_beams=num_beams)
+            elif task == 'generate_a':
+                output = self.model.generate_a(list(columns[0]), batch_size=self.batch_size, num_beams=num_beams)
+            elif task == 'generate_q':
+                output = self.model.generate_q(list(columns[0]), list_answer=list(columns[1]),
+                                               batch_size=self.batch_size, num_beams=num_beams)
+            elif task == 'answer_q':
+                output = self.model.answer_q(list(columns[0]), list(columns[1]),
+                                             batch_size=self.batch_size, num_beams=num_beams)
+            else:
+                raise ValueError(f'unknown task: {task}')
+        except Exception as error:
+            if len(requests) > 1:
+                # Chạy lại từng request riêng để lỗi của 1 request không làm hỏng các request khác
+                logging.warning(f'batch of {len(requests)} `{task}` requests failed ({error}), retrying one by one')
+                for request in requests:
+                    with self.lock:
+                        self.pending_inputs += len(request.inputs)
+                    self._run(task, num_beams, [request])
+                return
+            logging.exception(f'`{task}` request failed')
+            requests[0].error = error
+            requests[0].done.set()
+            return
+
+        start = 0
+        for request in requests:
+            request.output = output[start:start + len(request.inputs)]
+            start += len(request.inputs)
+            request.done.set()
+
+    def metrics(self):
+        """Số liệu của server theo định dạng text của Prometheus."""
+        with self.lock:
+            lines = [
+                '# TYPE plms_queue_depth_requests gauge',
+                f'plms_queue_depth_requests {self.queue.qsize()}',
+                '# TYPE plms_queue_depth_inputs gauge',
+                f'plms_queue_depth_inputs {self.pending_inputs}',
+                '# TYPE plms_requests_total counter'
+            ]
+            lines += [f'plms_requests_total{{task="{k}"}} {v}' for k, v in self.requests.items()]
+            lines.append('# TYPE plms_errors_total counter')
+            lines += [f'plms_errors_total{{task="{k}"}} {v}' for k, v in self.errors.items()]
+            lines.append('# TYPE plms_batches_total counter')
+            lines += [f'plms_batches_total{{task="{k}"}} {v}' for k, v in self.batches.items()]
+            lines.append('# TYPE plms_batch_size histogram')
+            lines += self.batch_size_histogram.render('plms_batch_size')
+            lines.append('# TYPE plms_request_latency_seconds histogram')
+            for task, histogram in self.latency.items():
+                lines += histogram.render('plms_request_latency_seconds', f'task="{task}"')
+        return '\n'.join(lines) + '\n'
+
+
+def parse_request(task: str, body: Dict):
+    """Chuyển JSON body thành list tuple input.
+
+    Returns:
+        (list tuple input, True nếu input là 1 mẫu đơn lẻ thay vì list)
+    """
+    fields = TASK_FIELDS[task]
+    for f in fields:
+        if f not in body:
+            raise ValueError(f'missing field `{f}` for `{task}`')
+    single_input = type(body[fields[0]]) is str
+    values = [[body[f]] if single_input else body[f] for f in fields]
+    if any(type(v) is not list for v in values) or len(set(len(v) for v in values)) != 1:
+        raise ValueError(f'fields {fields} must be all strings or lists of the same length')
+    return list(zip(*values)), single_input
+
+
+class _Handler(BaseHTTPRequestHandler):
+    batcher: MicroBatcher = None
+
+    def _reply(self, status: int, body, content_type: str = 'application/json'):
+        data = body.encode('utf-8') if type(body) is str else \
+            json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._reply(200, self.batcher.metrics(), 'text/plain; version=0.0.4')
+        elif self.path == '/health':
+            self._reply(200, {'status': 'ok', 'model': self.batcher.model.model_name})
+        else:
+            self._reply(404, {'error': f'unknown path: {self.path}'})
+
+    def do_POST(self):
+        task = self.path.strip('/')
+        if task not in TASK_FIELDS:
+            self._reply(404, {'error': f'unknown task: {task}'})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            inputs, single_input = parse_request(task, body)
+            num_beams = int(body.get('num_beams', 4))
+        except (ValueError, TypeError) as error:
+            self._reply(400, {'error': str(error)})
+            return
+        try:
+            output = self.batcher.submit(task, inputs, num_beams)
+        except Exception as error:
+            self._reply(500, {'error': f'{type(error).__name__}: {error}'})
+            return
+        self._reply(200, {'output': output[0] if single_input else output})
+
+    def log_message(self, format, *args):
+        logging.debug(f'{self.address_string()} {format % args}')
+
+
+def serve(model: str = 'shnl/vit5-vinewsqa-qg-ae',
+          model_ae: str = None,
+          host: str = '0.0.0.0',
+          port: int = 8000,
+          max_batch_size: int = 32,
+          max_latency_ms: float = 20,
+          batch_size: int = None,
+          max_length: int = 512,
+          max_length_output: int = 256,
+          max_tokens: int = None,
+          generation_cache: str = None,
+          use_auth_token: bool = False):
+    """Nạp model 1 lần và phục vụ các tác vụ QAG/QG/AE/QA qua HTTP.
+
+    Args:
+        model: Model QG/QAG trên Hugging Face hub hoặc đường dẫn local
+        model_ae: Model AE riêng (None -> dùng model chính nếu hỗ trợ AE)
+        host: Địa chỉ lắng nghe
+        port: Cổng lắng nghe
+        max_batch_size: Số input tối đa gộp vào 1 lần gọi model
+        max_latency_ms: Thời gian tối đa (ms) chờ gom thêm request trước khi chạy batch
+        batch_size: Batch size khi generate (None -> chia batch theo ngân sách token)
+        max_length: Độ dài tối đa input
+        max_length_output: Độ dài tối đa output
+        max_tokens: Ngân sách token mỗi batch
+        generation_cache: Cache kết quả generate (True -> file mặc định, str -> đường dẫn SQLite)
+        use_auth_token: Token Hugging Face cho private model
+    """
+    qg = TransformersQG(model, model_ae=model_ae, max_length=max_length, max_length_output=max_length_output,
+                        skip_overflow_error=True, drop_answer_error_text=True,
+                        max_tokens=max_tokens, generation_cache=generation_cache, use_auth_token=use_auth_token)
+    _Handler.batcher = MicroBatcher(qg, max_batch_size=max_batch_size, max_latency=max_latency_ms / 1000,
+                                    batch_size=batch_size)
+    server = ThreadingHTTPServer((host, port), _Handler)
+    logging.info(f'serving `{model}` at http://{host}:{port}')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO,
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    fire.Fire(serve)
@@ -1,4 +1,8 @@
-import spacy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+from .profiling import stage
 
 __all__ = 'SpacyPipeline'
 
@@ -15,15 +19,36 @@ MODELS = {
     "vi": "vi_core_news_lg"
 }
 VALID_METHODS = ['positionrank', 'textrank', 'biasedtextrank', 'positionrank', 'ner']
+# Component không ảnh hưởng tới ranh giới câu (parser + sentencizer), tắt khi chỉ cần tách câu
+SENTENCE_UNUSED_PIPES = ('tagger', 'morphologizer', 'attribute_ruler', 'lemmatizer', 'ner')
+
+
+def text_hash(string: str):
+    return hashlib.sha1(string.encode('utf-8')).hexdigest()
 
 
 class SpacyPipeline:
 
-    def __init__(self, language, algorithm: str = None):
+    def __init__(self, language, algorithm: str = None, n_process: int = 1, batch_size: int = 64,
+                 cache_size: int = 4096):
+        """
+        Args:
+            language: Ngôn ngữ (chọn model spaCy trong MODELS, mặc định vi_core_news_lg)
+            algorithm: Thuật toán trích keyword (VALID_METHODS) hoặc None nếu chỉ tách câu
+            n_process: Số process của `nlp.pipe` khi tách câu theo batch
+            batch_size: Số văn bản mỗi batch của `nlp.pipe`
+            cache_size: Số văn bản tối đa giữ kết quả tách câu (LRU, khóa là hash của văn bản; 0 -> tắt cache)
+        """
+        import spacy  # Import khi dùng tới: `import plms` không cần nạp spaCy
         model = "vi_core_news_lg" if language not in MODELS else MODELS[language]
 
         self.nlp = spacy.load(model)
         self.nlp.add_pipe("sentencizer")
+        self.n_process = n_process
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._sentence_cache = OrderedDict()
+        self._lock = threading.Lock()
         self.algorithm = algorithm
         self.library = None
         if self.algorithm is not None and self.algorithm != 'ner':
@@ -55,7 +80,45 @@ class SpacyPipeline:
         return sentence, keyword
 
     def sentence(self, string: str):
-        return [str(i) for i in self.nlp(string).sents if len(i) > 0]
+        return self.sentences([string])[0]
+
+    def sentences(self, strings: List[str], n_process: int = None):
+        """Tách câu cho nhiều văn bản bằng `nlp.pipe` (chỉ chạy các component cần cho ranh giới câu).
+
+        Văn bản trùng nhau và văn bản đã tách trước đó (còn trong cache LRU) không bị parse lại.
+
+        Args:
+            strings: Danh sách văn bản
+            n_process: Số process của `nlp.pipe` (None -> giá trị lúc khởi tạo)
+
+        Returns:
+            List câu của từng văn bản, cùng thứ tự với input
+        """
+        keys = [text_hash(i) for i in strings]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._sentence_cache:
+                    self._sentence_cache.move_to_end(key)
+                    found[key] = self._sentence_cache[key]
+        missing = {}
+        for key, string in zip(keys, strings):
+            if key not in found:
+                missing.setdefault(key, string)
+        if len(missing) > 0:
+            disable = [i for i in self.nlp.pipe_names if i in SENTENCE_UNUSED_PIPES or i == self.algorithm]
+            with stage('sentence_segmentation', texts=len(missing), cached=len(strings) - len(missing)):
+                docs = self.nlp.pipe(list(missing.values()), disable=disable, batch_size=self.batch_size,
+                                     n_process=n_process or self.n_process)
+                for key, doc in zip(missing.keys(), docs):
+                    found[key] = [str(i) for i in doc.sents if len(i) > 0]
+            with self._lock:
+                for key in missing.keys():
+                    self._sentence_cache[key] = found[key]
+                    self._sentence_cache.move_to_end(key)
+                while len(self._sentence_cache) > self.cache_size:
+                    self._sentence_cache.popitem(last=False)
+        return [list(found[key]) for key in keys]
 
     def token(self, string: str):
         return [str(i) for i in self.nlp.tokenizer(string)]
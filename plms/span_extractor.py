@@ -0,0 +1,293 @@
+""" Extractive answer-span model (ViT5 encoder + start/end heads) for answer extraction. """
+import os
+import copy
+import logging
+from typing import List, Dict
+import torch
+import transformers
+from transformers.models.t5.modeling_t5 import T5PreTrainedModel, T5Stack
+from .feature_store import FeatureStore, FeatureStoreWriter, fingerprint, tokenizer_fingerprint
+
+__all__ = ('SpanAnswerExtractor', 'ExtractiveAE', 'is_span_extractor', 'load_span_extractor', 'extract_spans')
+
+# Nhãn của từng token: bit 0 -> token bắt đầu answer, bit 1 -> token kết thúc answer
+START_TAG, END_TAG = 1, 2
+# Độ dài answer tối đa (token) khi config không có max_answer_length
+DEFAULT_MAX_ANSWER_LENGTH = 30
+# Ngưỡng xác suất của token bắt đầu/kết thúc để nhận 1 span
+DEFAULT_SPAN_THRESHOLD = 0.5
+# Số token gối đầu giữa 2 cửa sổ khi paragraph dài hơn max_length
+DEFAULT_STRIDE = 128
+
+
+class SpanAnswerExtractor(T5PreTrainedModel):
+    """Encoder T5 + 2 đầu ra (start/end) trên từng token: chấm điểm mọi span answer của paragraph trong 1 forward.
+
+    Cấu trúc `shared` + `encoder` giống T5EncoderModel nên nạp thẳng được weight encoder từ checkpoint
+    seq2seq (ViT5), phần decoder bị bỏ qua. Mỗi token có 2 logit độc lập (sigmoid) cho việc là token
+    bắt đầu / kết thúc answer, nên 1 paragraph có thể có nhiều answer.
+    """
+    _tied_weights_keys = ['encoder.embed_tokens.weight']
+    _keys_to_ignore_on_load_unexpected = [r'decoder', r'lm_head']
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.shared = torch.nn.Embedding(config.vocab_size, config.d_model)
+        encoder_config = copy.deepcopy(config)
+        encoder_config.use_cache = False
+        encoder_config.is_encoder_decoder = False
+        self.encoder = T5Stack(encoder_config, self.shared)
+        self.span_head = torch.nn.Linear(config.d_model, 2)
+        self.post_init()
+
+    def get_input_embeddings(self):
+        return self.shared
+
+    def set_input_embeddings(self, new_embeddings):
+        self.shared = new_embeddings
+        self.encoder.set_input_embeddings(new_embeddings)
+
+    def get_encoder(self):
+        return self.encoder
+
+    def forward(self, input_ids, attention_mask=None, labels=None, **kwargs):
+        """
+        Args:
+            input_ids: Token id (batch x độ dài)
+            attention_mask: Mask padding
+            labels: Nhãn START_TAG/END_TAG của từng token (giá trị âm -> bỏ qua khi tính loss)
+
+        Returns:
+            Dict start_logits, end_logits (batch x độ dài) và loss nếu có labels
+        """
+        hidden = self.encoder(input_ids=input_ids, attention_mask=attention_mask)[0]
+        start_logits, end_logits = self.span_head(hidden).unbind(-1)
+        output = {'start_logits': start_logits, 'end_logits': end_logits}
+        if labels is not None:
+            mask = labels >= 0
+            if attention_mask is not None:
+                mask = mask & attention_mask.bool()
+            loss = torch.nn.functional.binary_cross_entropy_with_logits
+            output['loss'] = (loss(start_logits[mask], ((labels[mask] & START_TAG) > 0).float())
+                              + loss(end_logits[mask], ((labels[mask] & END_TAG) > 0).float()))
+        return output
+
+
+def is_span_extractor(config):
+    """Config có phải của SpanAnswerExtractor (được lưu bởi Trainer ở chế độ extractive) không."""
+    return getattr(config, 'span_extractor', False)
+
+
+def load_span_extractor(model_name: str, cache_dir: str = None, use_auth_token: bool = False,
+                        local_files_only: bool = False):
+    """Nạp tokenizer (bản fast, cần offset_mapping) và SpanAnswerExtractor.
+
+    Returns:
+        tuple: (tokenizer, model)
+    """
+    tokenizer = transformers.AutoTokenizer.from_pretrained(
+        model_name, cache_dir=cache_dir, local_files_only=local_files_only, use_auth_token=use_auth_token,
+        use_fast=True)
+    assert tokenizer.is_fast, f'the span extractor ({model_name}) requires a fast tokenizer (offset mapping)'
+    model = SpanAnswerExtractor.from_pretrained(
+        model_name, cache_dir=cache_dir, local_files_only=local_files_only, use_auth_token=use_auth_token)
+    return tokenizer, model
+
+
+def _windows(tokenizer, contexts: List[str], max_length: int, stride: int):
+    """Tokenize paragraph thành các cửa sổ max_length token (gối đầu `stride` token) kèm offset ký tự."""
+    encode = tokenizer(contexts, truncation=True, max_length=max_length, stride=stride,
+                       return_overflowing_tokens=True, return_offsets_mapping=True)
+    return [(sample, ids, offsets) for sample, ids, offsets in zip(
+        encode['overflow_to_sample_mapping'], encode['input_ids'], encode['offset_mapping'])]
+
+
+def extract_spans(model,
+                  tokenizer,
+                  contexts: List[str],
+                  device: str = 'cpu',
+                  max_length: int = 512,
+                  batch_size: int = None,
+                  top_k: int = None,
+                  threshold: float = DEFAULT_SPAN_THRESHOLD,
+                  stride: int = DEFAULT_STRIDE):
+    """Trích xuất answer từ paragraph bằng SpanAnswerExtractor (1 forward cho mỗi cửa sổ paragraph).
+
+    Với mỗi cửa sổ, span (i, j) với i <= j < i + max_answer_length được chấm điểm bằng
+    start_logit[i] + end_logit[j]; chỉ giữ span có xác suất start và end >= threshold (không có span nào
+    -> giữ span điểm cao nhất). Các span được chọn theo điểm giảm dần, không chồng lấn nhau,
+    sau đó trả về theo thứ tự xuất hiện trong paragraph.
+
+    Args:
+        model: SpanAnswerExtractor
+        tokenizer: Tokenizer fast tương ứng
+        contexts: Danh sách paragraph
+        device: Device của model
+        max_length: Số token tối đa mỗi cửa sổ
+        batch_size: Số cửa sổ mỗi batch (None -> tất cả)
+        top_k: Số answer tối đa mỗi paragraph (None -> không giới hạn)
+        threshold: Ngưỡng xác suất start/end
+        stride: Số token gối đầu giữa 2 cửa sổ
+
+    Returns:
+        List answer (chuỗi con của paragraph) cho mỗi paragraph
+    """
+    max_answer_length = getattr(model.config, 'max_answer_length', DEFAULT_MAX_ANSWER_LENGTH)
+    windows = _windows(tokenizer, contexts, max_length, stride)
+    batch_size = batch_size or max(len(windows), 1)
+    candidates = [[] for _ in contexts]
+    model.eval()
+    for start in range(0, len(windows), batch_size):
+        batch = windows[start:start + batch_size]
+        input_ids = torch.nn.utils.rnn.pad_sequence(
+            [torch.tensor(ids) for _, ids, _ in batch], batch_first=True, padding_value=tokenizer.pad_token_id)
+        attention_mask = torch.nn.utils.rnn.pad_sequence(
+            [torch.ones(len(ids), dtype=torch.long) for _, ids, _ in batch], batch_first=True)
+        with torch.no_grad():
+            output = model(input_ids=input_ids.to(device), attention_mask=attention_mask.to(device))
+        start_logits, end_logits = output['start_logits'].float().cpu(), output['end_logits'].float().cpu()
+        for row, (sample, ids, offsets) in enumerate(batch):
+            # Token đặc biệt (</s>, pad) có offset (0, 0) -> không được làm biên của span
+            valid = torch.tensor([e > s for s, e in offsets] + [False] * (input_ids.shape[1] - len(offsets)))
+            s_logit = start_logits[row].masked_fill(~valid, float('-inf'))
+            e_logit = end_logits[row].masked_fill(~valid, float('-inf'))
+            # Ma trận điểm span (i, j), chỉ giữ j trong [i, i + max_answer_length)
+            score = s_logit[:, None] + e_logit[None, :]
+            band = torch.ones_like(score, dtype=torch.bool).triu().tril(max_answer_length - 1)
+            score = score.masked_fill(~band, float('-inf'))
+            passed = (torch.sigmoid(s_logit)[:, None] >= threshold) & (torch.sigmoid(e_logit)[None, :] >= threshold)
+            picked = (passed & band).nonzero().tolist()
+            if len(picked) == 0 and torch.isfinite(score).any():
+                picked = [divmod(int(score.argmax()), score.shape[1])]
+            for i, j in picked:
+                candidates[sample].append((float(score[i, j]), offsets[i][0], offsets[j][1]))
+
+    list_answer = []
+    for context, spans in zip(contexts, candidates):
+        chosen, seen = [], set()
+        for _, char_start, char_end in sorted(spans, reverse=True):
+            text = context[char_start:char_end].strip()
+            if len(text) == 0 or text in seen or any(char_start < e and s < char_end for s, e, _ in chosen):
+                continue
+            chosen.append((char_start, char_end, text))
+            seen.add(text)
+            if top_k is not None and len(chosen) >= top_k:
+                break
+        list_answer.append([text for _, _, text in sorted(chosen)])
+    return list_answer
+
+
+class ExtractiveAE:
+    """SpanAnswerExtractor kèm tokenizer, dùng cho Trainer ở chế độ `model_type='extractive'`.
+
+    Có cùng interface với TransformersQG mà Trainer cần: `model`, `tokenizer`, `device`, `train()`,
+    `text_to_encode()`, `encode_to_loss()`, `save()`.
+    """
+
+    def __init__(self,
+                 model: str,
+                 max_length: int = 512,
+                 max_answer_length: int = DEFAULT_MAX_ANSWER_LENGTH,
+                 cache_dir: str = None,
+                 use_auth_token: bool = False,
+                 local_files_only: bool = False):
+        """
+        Args:
+            model: Checkpoint SpanAnswerExtractor hoặc checkpoint seq2seq T5 (chỉ dùng encoder, head khởi tạo mới)
+            max_length: Số token tối đa mỗi cửa sổ paragraph
+            max_answer_length: Độ dài answer tối đa (token), được lưu vào config
+            cache_dir: Thư mục cache model/tokenizer
+            use_auth_token: Token Hugging Face cho private model
+            local_files_only: Chỉ dùng file local
+        """
+        self.model_name = model
+        self.max_length = max_length
+        self.tokenizer, self.model = load_span_extractor(
+            model, cache_dir=cache_dir, use_auth_token=use_auth_token, local_files_only=local_files_only)
+        self.model.config.max_answer_length = max_answer_length
+        self.device = 'cuda' if torch.cuda.device_count() > 0 else 'cpu'
+        self.model.to(self.device)
+        logging.info(f'Extractive AE model `{model}`')
+        logging.info(f'\t * Num of GPU in use: {torch.cuda.device_count()}')
+
+    def train(self):
+        self.model.train()
+
+    def eval(self):
+        self.model.eval()
+
+    def text_to_encode(self, inputs, outputs: List = None, prefix_type: str = None, cache_path: str = None):
+        """Gom các cặp (paragraph, answer) theo paragraph và gán nhãn START_TAG/END_TAG cho token.
+
+        Answer được lấy ở lần xuất hiện đầu tiên trong paragraph; paragraph dài được chia cửa sổ
+        giống lúc inference. Cửa sổ không chứa answer nào bị bỏ.
+
+        Args:
+            inputs: Danh sách paragraph
+            outputs: Danh sách answer tương ứng
+            prefix_type: Không dùng (model extractive không có task prefix)
+            cache_path: Tiền tố đường dẫn cache feature
+
+        Returns:
+            List feature (input_ids, attention_mask, labels); có cache_path -> FeatureStore
+        """
+        assert outputs is not None and len(inputs) == len(outputs), 'extractive AE needs (paragraph, answer) pairs'
+        answers = {}
+        for paragraph, answer in zip(inputs, outputs):
+            answers.setdefault(paragraph, [])
+            if answer not in answers[paragraph]:
+                answers[paragraph].append(answer)
+        paragraphs = list(answers.keys())
+
+        store_path = store_key = None
+        if cache_path is not None:
+            store_key = fingerprint(tokenizer_fingerprint(self.tokenizer), 'extractive', self.max_length,
+                                    DEFAULT_STRIDE, answers)
+            store_path = f'{cache_path}.{store_key[:16]}'
+            if FeatureStore.exists(store_path, store_key):
+                logging.info(f'loading preprocessed feature from {store_path}')
+                return FeatureStore(store_path)
+            os.makedirs(os.path.dirname(store_path), exist_ok=True)
+
+        logging.info(f'encode all the data       : {len(paragraphs)} paragraphs')
+        features = []
+        for sample, ids, offsets in _windows(self.tokenizer, paragraphs, self.max_length, DEFAULT_STRIDE):
+            paragraph = paragraphs[sample]
+            labels = [0] * len(ids)
+            for answer in answers[paragraph]:
+                char_start = paragraph.find(answer)
+                if char_start == -1:
+                    continue
+                char_end = char_start + len(answer)
+                tokens = [n for n, (s, e) in enumerate(offsets) if e > s and s < char_end and char_start < e]
+                # Answer bị cắt ngang ranh giới cửa sổ -> bỏ
+                if len(tokens) == 0 or offsets[tokens[0]][0] > char_start or offsets[tokens[-1]][1] < char_end:
+                    continue
+                labels[tokens[0]] |= START_TAG
+                labels[tokens[-1]] |= END_TAG
+            if any(labels):
+                features.append({'input_ids': ids, 'attention_mask': [1] * len(ids), 'labels': labels})
+        logging.info(f'after remove the overflow : {len(features)} windows')
+        if store_path is None:
+            return features
+
+        # Pad về max_length khi đọc (nhãn pad = 0, token pad bị attention_mask loại khỏi loss)
+        writer = FeatureStoreWriter(store_path, key=store_key,
+                                    padding={'input_ids': self.max_length, 'labels': self.max_length},
+                                    pad_token_id=self.tokenizer.pad_token_id)
+        writer.extend(features)
+        writer.close()
+        logging.info(f'preprocessed feature is saved at {store_path}')
+        return FeatureStore(store_path)
+
+    def encode_to_loss(self, encode: Dict):
+        """Forward 1 batch và trả về loss (BCE của start + end)."""
+        return self.model(**{k: v.to(self.device) for k, v in encode.items()})['loss']
+
+    def save(self, save_dir):
+        """Lưu model (kèm cờ span_extractor trong config) và tokenizer."""
+        logging.info('saving model')
+        self.model.config.update({'span_extractor': True})
+        self.model.save_pretrained(save_dir)
+        logging.info('saving tokenizer')
+        self.tokenizer.save_pretrained(save_dir)
@@ -0,0 +1,90 @@
+""" Persistent multiprocessing pool for tokenizing features. """
+import os
+import logging
+from multiprocessing import Pool
+from typing import Dict, List
+from tqdm import tqdm
+
+__all__ = ('TokenizationPool',)
+
+# Tokenizer của process worker hiện tại: {tên: tokenizer}, được gán trong _init_worker
+_WORKER_TOKENIZERS = {}
+# EncodePlus đã tạo trong worker, theo (tên tokenizer, cấu hình)
+_WORKER_ENCODERS = {}
+
+
+def _init_worker(tokenizers: Dict):
+    """Khởi tạo 1 worker: nhận tokenizer đúng 1 lần, dùng lại cho mọi lần encode sau đó."""
+    _WORKER_TOKENIZERS.update(tokenizers)
+
+
+def _encode_in_worker(task):
+    """Encode 1 chunk dữ liệu trong worker, trả về (số mẫu của chunk, list feature/None)."""
+    name, config, chunk = task
+    key = (name, tuple(sorted(config.items())))
+    if key not in _WORKER_ENCODERS:
+        from .language_model import EncodePlus  # Import trong worker, tránh vòng import với language_model
+        _WORKER_ENCODERS[key] = EncodePlus(tokenizer=_WORKER_TOKENIZERS[name], **config)
+    return len(chunk), _WORKER_ENCODERS[key].encode_batch(chunk)
+
+
+class TokenizationPool:
+    """Pool process tokenize dùng lâu dài (khác với tạo `Pool()` mới cho mỗi lần encode).
+
+    Tokenizer chỉ được gửi cho worker 1 lần lúc khởi tạo (initializer), mỗi task chỉ mang theo dữ liệu
+    và cấu hình EncodePlus (vài số nguyên). Kết quả được trả về dần theo thứ tự (`imap`) để ghi thẳng
+    ra FeatureStore thay vì gom thành 1 list lớn, kèm thanh tiến trình theo số mẫu. Nhiều lần encode liên tiếp
+    (ví dụ nhiều split/tác vụ khi train) dùng chung các worker đã sẵn sàng.
+    """
+
+    def __init__(self, tokenizers: Dict, n_workers: int = None):
+        """
+        Args:
+            tokenizers: {tên: tokenizer} các tokenizer cần dùng trong worker
+            n_workers: Số process worker (None -> số core)
+        """
+        self.tokenizers = dict(tokenizers)
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.pool = None
+        self._start()
+
+    def _start(self):
+        logging.info(f'starting tokenization pool: {self.n_workers} workers, tokenizers {list(self.tokenizers)}')
+        self.pool = Pool(self.n_workers, initializer=_init_worker, initargs=(self.tokenizers,))
+
+    def register(self, name: str, tokenizer):
+        """Thêm tokenizer (ví dụ tokenizer của model AE); tokenizer mới -> khởi động lại worker 1 lần."""
+        if self.tokenizers.get(name) is tokenizer:
+            return
+        self.tokenizers[name] = tokenizer
+        self.close()
+        self._start()
+
+    def encode(self, name: str, config: Dict, data: List, chunk_size: int):
+        """Encode dữ liệu trên các worker, trả về dần từng chunk theo đúng thứ tự.
+
+        Args:
+            name: Tên tokenizer (đã có trong pool)
+            config: Tham số EncodePlus (trừ tokenizer)
+            data: List tuple (input_sequence, output_sequence, input_highlight)
+            chunk_size: Số mẫu mỗi lần gọi tokenizer trong worker
+
+        Yields:
+            List feature của từng chunk (None ở vị trí mẫu bị drop)
+        """
+        if self.pool is None:
+            self._start()
+        tasks = [(name, config, data[i:i + chunk_size]) for i in range(0, len(data), chunk_size)]
+        # Gửi nhiều chunk mỗi lần cho worker nhưng vẫn chia đều (khoảng 4 lượt/worker)
+        chunksize = max(1, len(tasks) // (self.n_workers * 4))
+        with tqdm(total=len(data), unit='sample', desc='encode') as progress:
+            for n, features in self.pool.imap(_encode_in_worker, tasks, chunksize=chunksize):
+                progress.update(n)
+                yield features
+
+    def close(self):
+        """Dừng các worker (lần encode sau sẽ khởi động lại)."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -6,11 +6,14 @@ import shutil
 import random
 from os.path import join as pj
 from glob import glob
+from itertools import chain
 from typing import List
 import torch
 from tqdm import tqdm
 
-from .language_model import TransformersQG  # Model chính
+from .language_model import TransformersQG, PackedDataset, PackedCollator, internet_connection  # Model chính
+from .span_extractor import ExtractiveAE  # Model AE dạng span (model_type='extractive')
+from .scheduler import TokenBudgetScheduler  # Chia batch theo ngân sách token
 from .data import get_dataset, DEFAULT_CACHE_DIR  # Load dataset
 
 __all__ = ('to_list', 'Trainer')
@@ -150,7 +153,9 @@ class Trainer:
                  use_auth_token: bool = False,
                  torch_dtype=None,
                  device_map: str = None,
-                 low_cpu_mem_usage: bool = False):
+                 low_cpu_mem_usage: bool = False,
+                 max_tokens: int = None,
+                 model_type: str = 'seq2seq'):
         """Khởi tạo Trainer.
         
         Args:
@@ -176,20 +181,29 @@ class Trainer:
             torch_dtype: Kiểu dữ liệu tensor
             device_map: Sơ đồ phân bổ model lên GPU
             low_cpu_mem_usage: Giảm bộ nhớ CPU khi load model
+            max_tokens: Chia batch theo ngân sách token thay cho `batch` (None -> dùng batch cố định).
+                        Batch bị OOM sẽ được chia đôi và chạy lại
+            model_type: 'seq2seq' (QG/AE/QAG sinh text) hoặc 'extractive' (SpanAnswerExtractor cho AE: encoder
+                        của `model` + đầu start/end, train trên cặp input_types='paragraph', output_types='answer';
+                        max_length_output là độ dài answer tối đa). Checkpoint dùng làm `model_ae` của TransformersQG
         """
         logging.info('initialize model trainer')
         self.use_auth_token = use_auth_token
         self.torch_dtype = torch_dtype
         self.device_map = device_map
         self.low_cpu_mem_usage = low_cpu_mem_usage
-        
+        self.max_tokens = max_tokens
+
         # Bước 1: Khởi tạo Config object (quản lý checkpoint và hyperparameters)
         self.config = Config(
             config_file=config_file, checkpoint_dir=checkpoint_dir, dataset_path=dataset_path, dataset_name=dataset_name,
             input_types=input_types, output_types=output_types, prefix_types=prefix_types, model=model,
             max_length=max_length, max_length_output=max_length_output, epoch=epoch, batch=batch, lr=lr, fp16=fp16,
             random_seed=random_seed, gradient_accumulation_steps=gradient_accumulation_steps,
-            label_smoothing=label_smoothing)
+            label_smoothing=label_smoothing, model_type=model_type)
+        # Checkpoint cũ (trước khi có model_type) luôn là seq2seq
+        self.model_type = self.config.config.get('model_type', 'seq2seq')
+        assert self.model_type in ('seq2seq', 'extractive'), f'unknown model_type: {self.model_type}'
 
         random.seed(self.config.random_seed)
         torch.manual_seed(self.config.random_seed)
@@ -219,11 +233,7 @@ class Trainer:
                     logging.info(f'load checkpoint from {path}')
                     
                     # Load model từ checkpoint
-                    self.model = TransformersQG(
-                        model=path, max_length=self.config.max_length, max_length_output=self.config.max_length_output,
-                        label_smoothing=self.config.label_smoothing, add_prefix=add_prefix,
-                        drop_overflow_error_text=True, use_auth_token=self.use_auth_token, device_map=self.device_map,
-                        low_cpu_mem_usage=self.low_cpu_mem_usage, torch_dtype=self.torch_dtype)
+                    self.model = self.load_model(path, add_prefix)
                     
                     # Load optimizer state
                     self.optimizer = self.setup_optimizer(epoch)
@@ -243,11 +253,7 @@ class Trainer:
         # Nếu không load được checkpoint nào -> khởi tạo model mới
         if not flag:
             logging.info(f'initialize checkpoint with {self.config.model}')
-            self.model = TransformersQG(
-                model=self.config.model, max_length=self.config.max_length,
-                max_length_output=self.config.max_length_output, add_prefix=add_prefix,
-                drop_overflow_error_text=True, use_auth_token=self.use_auth_token,
-                device_map=self.device_map, low_cpu_mem_usage=self.low_cpu_mem_usage, torch_dtype=self.torch_dtype)
+            self.model = self.load_model(self.config.model, add_prefix, label_smoothing=False)
             self.optimizer = self.setup_optimizer()
             self.current_epoch = 0  # Bắt đầu từ epoch 0
         
@@ -270,9 +276,30 @@ class Trainer:
             f"{self.config.model}.{self.config.max_length}.{self.config.max_length_output}"
         )
 
-        self.data_cache_paths = [[(i, o, p), f'{prefix}.{i}.{o}.train.{p}.pkl']
+        self.data_cache_paths = [[(i, o, p), f'{prefix}.{i}.{o}.train.{p}']
                                  for i, o, p in zip(input_types, output_types, prefix_types)]
 
+    def load_model(self, model: str, add_prefix: bool, label_smoothing: bool = True):
+        """Khởi tạo model theo model_type từ checkpoint hoặc model gốc.
+
+        Args:
+            model: Đường dẫn checkpoint hoặc tên model trên Hugging Face hub
+            add_prefix: Có thêm task prefix vào input hay không (chỉ cho seq2seq)
+            label_smoothing: Truyền label_smoothing của config (chỉ cho seq2seq)
+
+        Returns:
+            TransformersQG (seq2seq) hoặc ExtractiveAE (extractive)
+        """
+        if self.model_type == 'extractive':
+            return ExtractiveAE(
+                model, max_length=self.config.max_length, max_answer_length=self.config.max_length_output,
+                use_auth_token=self.use_auth_token, local_files_only=not internet_connection())
+        return TransformersQG(
+            model=model, max_length=self.config.max_length, max_length_output=self.config.max_length_output,
+            label_smoothing=self.config.label_smoothing if label_smoothing else None, add_prefix=add_prefix,
+            drop_overflow_error_text=True, use_auth_token=self.use_auth_token, device_map=self.device_map,
+            low_cpu_mem_usage=self.low_cpu_mem_usage, torch_dtype=self.torch_dtype)
+
     def setup_optimizer(self, epoch: int = None):
         """Khởi tạo hoặc load optimizer.
         
@@ -364,7 +391,7 @@ class Trainer:
 
         # Bước 1: Load và preprocess dataset
         logging.info('dataset preprocessing')
-        encode_list = []
+        datasets = []
         
         # Lặp qua từng task (có thể train multitask)
         for (i, o, p), cache_path in self.data_cache_paths:
@@ -377,12 +404,25 @@ class Trainer:
                 output_type=o,
                 use_auth_token=self.use_auth_token)
             
-            # Tokenize và encode (có cache để tăng tốc)
-            encode_list += self.model.text_to_encode(text_input, text_output, prefix_type=p, cache_path=cache_path)
+            # Tokenize và encode (có cache để tăng tốc, feature được memory-map từ đĩa thay vì nạp vào RAM)
+            # Token id chưa pad được dùng trực tiếp (PackedDataset), mỗi batch chỉ pad tới mẫu dài nhất
+            datasets.append(PackedDataset.pack(
+                self.model.text_to_encode(text_input, text_output, prefix_type=p, cache_path=cache_path)))
+        # Mọi task dùng chung 1 pool tokenize (PARALLEL_PROCESSING=1); dừng worker trước khi train để giải phóng RAM
+        # (chỉ TransformersQG có pool, ExtractiveAE tokenize trong process hiện tại)
+        if isinstance(self.model, TransformersQG) and self.model.is_loaded('tokenization_pool'):
+            self.model.tokenization_pool.close()
+        encode_list = torch.utils.data.ConcatDataset(datasets)
         
         # Tạo DataLoader với shuffle và drop_last
         # drop_last=True: bỏ batch cuối cùng nếu không đủ batch_size (tránh ảnh hưởng gradient)
-        loader = self.model.get_data_loader(encode_list, batch_size=self.config.batch, shuffle=True, drop_last=True)
+        # Khi dùng max_tokens: batch được chia theo ngân sách token trong iter_loss
+        if self.max_tokens is None:
+            loader = TransformersQG.get_data_loader(
+                encode_list, batch_size=self.config.batch, shuffle=True, drop_last=True,
+                collate_fn=PackedCollator(self.model.tokenizer.pad_token_id))
+        else:
+            loader = encode_list
 
         # Bước 2: Training loop
         logging.info('start model training')
@@ -435,25 +475,27 @@ class Trainer:
             tuple: (average_loss, updated_global_step)
         """
         total_loss = []  # Lưu loss của tất cả batch
+        window = 0  # Số batch đã backward trong cửa sổ accumulation hiện tại
         self.optimizer.zero_grad()  # Reset gradient về 0
         
-        # Loop qua từng batch
-        for n, encode in tqdm(enumerate(data_loader)):
-            # Forward pass: tính loss
-            loss = self.model.encode_to_loss(encode)
-            
-            # Backward pass: tính gradient (có scale cho FP16)
-            # scaler.scale() phóng to loss trước khi backward để tránh underflow trong FP16
-            self.scaler.scale(loss).backward()
-            
-            # Lưu loss value (chuyển sang CPU trước khi lưu)
-            total_loss.append(loss.cpu().item())
+        # Loop qua từng batch (forward + backward nằm trong iter_loss)
+        for loss in tqdm(self.iter_loss(data_loader)):
+            if loss is None:
+                # OOM giữa chừng: gradient của cửa sổ đã bị xóa, các batch của cửa sổ sẽ được chạy lại
+                total_loss = total_loss[:len(total_loss) - window]
+                window = 0
+                continue
+
+            # Lưu loss value
+            total_loss.append(loss)
+            window += 1
             
             # Gradient accumulation: chỉ update optimizer sau mỗi N batch
-            if (n + 1) % self.config.gradient_accumulation_steps != 0:
+            if window < self.config.gradient_accumulation_steps:
                 continue  # Chưa đủ N batch -> skip optimizer update
 
             # Đã accumulate đủ gradient -> update optimizer
+            window = 0
             global_step += 1
             
             # Tính trung bình loss của N batch vừa accumulate
@@ -481,4 +523,68 @@ class Trainer:
         self.optimizer.zero_grad()
         
         # Trả về loss trung bình của epoch và global_step đã update
-        return sum(total_loss)/len(total_loss), global_step
\ No newline at end of file
+        return sum(total_loss)/len(total_loss), global_step
+
+    def backward(self, encode):
+        """Forward + backward cho 1 batch.
+
+        Args:
+            encode: Dict tensor của batch
+
+        Returns:
+            Giá trị loss (float, đã chuyển về CPU)
+        """
+        # Forward pass: tính loss
+        loss = self.model.encode_to_loss(encode)
+
+        # Backward pass: tính gradient (có scale cho FP16)
+        # scaler.scale() phóng to loss trước khi backward để tránh underflow trong FP16
+        self.scaler.scale(loss).backward()
+        return loss.cpu().item()
+
+    def iter_loss(self, data_loader):
+        """Duyệt từng batch, chạy forward + backward và trả về loss.
+
+        Args:
+            data_loader: DataLoader (batch cố định) hoặc ConcatDataset (khi chia batch theo max_tokens)
+
+        Yields:
+            Loss của từng batch. None khi gặp OOM: gradient của cửa sổ accumulation hiện tại đã bị xóa
+            và các batch của cửa sổ sẽ được chạy lại (train_single_epoch bỏ loss của cửa sổ đó)
+        """
+        if self.max_tokens is None:
+            for encode in data_loader:
+                yield self.backward(encode)
+            return
+
+        # Chia batch theo ngân sách token, thứ tự sample được trộn lại mỗi epoch
+        # Batch bị OOM sẽ được chia đôi và chạy lại (ngân sách an toàn được ghi nhớ cho model này)
+        lengths = list(chain(*[d.lengths().tolist() for d in data_loader.datasets]))
+        scheduler = TokenBudgetScheduler(self.max_tokens, key=(self.config.model, 'train'))
+        window = []  # Các batch đã backward kể từ lần optimizer.step gần nhất
+        restarted = False
+
+        def restart_window():
+            # OOM có thể xảy ra khi backward đã ghi 1 phần vào .grad: chạy lại riêng batch lỗi sẽ cộng
+            # gradient 2 lần -> xóa gradient và chạy lại cả cửa sổ accumulation từ đầu
+            nonlocal restarted
+            self.optimizer.zero_grad()
+            rerun = [i for batch in window for i in batch]
+            window.clear()
+            restarted = True
+            return rerun
+
+        for indices, loss in scheduler.run(
+                data_loader,
+                lengths,
+                self.backward,
+                collate_fn=PackedCollator(self.model.tokenizer.pad_token_id),
+                order=random.sample(range(len(lengths)), len(lengths)),
+                on_out_of_memory=restart_window):
+            if restarted:
+                restarted = False
+                yield None
+            window.append(indices)
+            yield loss
+            if len(window) == self.config.gradient_accumulation_steps:
+                window.clear()  # train_single_epoch vừa gọi optimizer.step
\ No newline at end of file
@@ -3,8 +3,6 @@ import pandas as pd
 import json
 import re
 from nltk.translate.bleu_score import sentence_bleu
-import spacy
-import evaluate
 import numpy as np
 #from datasets import load_metric
 
@@ -54,6 +52,9 @@ def post_process(refs_or_preds: list[str]):
 
 class MetricsCalculator:
     def __init__(self):
+        # Import khi dùng tới: save_result/post_process không cần spaCy và evaluate
+        import spacy
+        import evaluate
         self.nlp = spacy.load('vi_core_news_lg')
         self.rouge_metrics = evaluate.load('rouge')
         self.meteor_metrics = evaluate.load('meteor')
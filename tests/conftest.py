@@ -0,0 +1,46 @@
+""" Fixtures dùng chung: model T5 nhỏ khởi tạo ngẫu nhiên và tokenizer word-level (không cần mạng). """
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)  # import plms
+sys.path.insert(0, os.path.join(ROOT, 'demo_mcq'))  # import generator (demo chạy từ thư mục demo_mcq)
+
+WORDS = ['hà', 'nội', 'là', 'thủ', 'đô', 'của', 'việt', 'nam', 'sông', 'hồng', 'chảy', 'qua', 'thành', 'phố',
+         'năm', '1010', 'lý', 'thái', 'tổ', 'dời', 'về', 'thăng', 'long', '<hl>', 'generate', 'question:']
+CONTEXTS = ['hà nội là thủ đô của việt nam',
+            'năm 1010 lý thái tổ dời đô về thăng long',
+            'sông hồng chảy qua thành phố hà nội']
+
+
+@pytest.fixture(scope='session')
+def tokenizer():
+    """Tokenizer fast word-level (tách theo khoảng trắng) với pad/eos/unk giống T5."""
+    transformers = pytest.importorskip('transformers')
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors
+
+    vocab = {token: n for n, token in enumerate(['<pad>', '</s>', '<unk>'] + WORDS)}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token='<unk>'))
+    backend.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    backend.post_processor = processors.TemplateProcessing(single='$A </s>', special_tokens=[('</s>', 1)])
+    return transformers.PreTrainedTokenizerFast(
+        tokenizer_object=backend, pad_token='<pad>', eos_token='</s>', unk_token='<unk>',
+        model_input_names=['input_ids', 'attention_mask'])
+
+
+@pytest.fixture(scope='session')
+def tiny_t5(tokenizer):
+    """Hàm tạo T5 nhỏ khởi tạo ngẫu nhiên theo seed (cùng vocab với `tokenizer`), ở eval mode."""
+    torch = pytest.importorskip('torch')
+    transformers = pytest.importorskip('transformers')
+
+    def build(seed: int = 0, num_layers: int = 2):
+        torch.manual_seed(seed)
+        config = transformers.T5Config(
+            vocab_size=len(tokenizer), d_model=32, d_kv=8, d_ff=64, num_layers=num_layers, num_heads=4,
+            decoder_start_token_id=tokenizer.pad_token_id, pad_token_id=tokenizer.pad_token_id,
+            eos_token_id=tokenizer.eos_token_id)
+        return transformers.T5ForConditionalGeneration(config).eval()
+
+    return build
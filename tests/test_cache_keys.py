@@ -0,0 +1,45 @@
+""" Cache model int8 / graph ONNX của model local phải đổi khóa khi weight trong thư mục bị ghi đè. """
+import os
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('transformers')
+
+
+@pytest.fixture
+def checkpoint(tokenizer, tiny_t5, tmp_path):
+    """Thư mục model local (ví dụ ./cp/epoch_10) và hàm ghi đè weight của nó."""
+    path = str(tmp_path / 'epoch_10')
+    model = tiny_t5(seed=0)
+    model.save_pretrained(path)
+    tokenizer.save_pretrained(path)
+
+    def retrain():
+        tiny_t5(seed=1).save_pretrained(path)
+        # Hệ thống file có thể làm tròn mtime: đẩy thời điểm sửa weight về sau cho chắc chắn
+        for f in os.listdir(path):
+            if f.endswith(('.bin', '.safetensors')):
+                stat = os.stat(os.path.join(path, f))
+                os.utime(os.path.join(path, f), (stat.st_atime, stat.st_mtime + 10))
+
+    return path, model.config, retrain
+
+
+def test_quantized_cache_path_changes_with_local_weights(checkpoint):
+    from plms.quantization import quantized_cache_path
+
+    path, config, retrain = checkpoint
+    before = quantized_cache_path(path, config, 32)
+    assert quantized_cache_path(path, config, 32) == before
+    retrain()
+    assert quantized_cache_path(path, config, 32) != before
+
+
+def test_onnx_cache_path_changes_with_local_weights(checkpoint):
+    from plms.onnx_backend import onnx_cache_path
+
+    path, config, retrain = checkpoint
+    before = onnx_cache_path(path, config, 32)
+    assert os.path.dirname(before) == path  # Model local: graph nằm trong thư mục model
+    retrain()
+    assert onnx_cache_path(path, config, 32) != before
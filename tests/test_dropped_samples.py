@@ -0,0 +1,70 @@
+""" Mẫu bị drop khi encode cho None ở đúng vị trí, giống nhau khi có và không có generation cache. """
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('transformers')
+
+import plms.language_model as language_model
+from plms.generation_cache import GenerationCache
+
+# Context thứ 2 quá dài (max_length=12), answer của mẫu thứ 3 không nằm trong context
+CONTEXTS = ['hà nội là thủ đô', 'hà nội là thủ đô của việt nam sông hồng chảy qua thành phố', 'sông hồng']
+ANSWERS = ['thủ đô', 'thủ đô', 'thăng long']
+
+
+class OneSentence:
+    """Thay spaCy khi tách câu: mỗi context là 1 câu."""
+
+    @staticmethod
+    def sentences(contexts):
+        return [[c] for c in contexts]
+
+
+@pytest.fixture
+def build_qg(tokenizer, tiny_t5, tmp_path, monkeypatch):
+    monkeypatch.setattr(language_model, 'internet_connection', lambda *_: False)
+    path = str(tmp_path / 'model')
+    tiny_t5(seed=0).save_pretrained(path)
+    tokenizer.save_pretrained(path)
+
+    def build(generation_cache):
+        qg = language_model.TransformersQG(
+            path, is_qg=True, is_ae=True, add_prefix=False, max_length=12, max_length_output=8,
+            max_length_output_ae=8, constrained_ae=True, drop_overflow_error_text=True,
+            drop_highlight_error_text=True, drop_answer_error_text=True, generation_cache=generation_cache)
+        qg.spacy_module = OneSentence()
+        return qg
+
+    return build
+
+
+def test_dropped_samples_match_with_generation_cache(build_qg, tmp_path):
+    results = []
+    for cache in [None, GenerationCache(None)]:
+        qg = build_qg(cache)
+        for _ in range(2):  # Lần 2 lấy từ generation cache / feature cache (FeatureStore)
+            questions = qg.generate_q(CONTEXTS, list_answer=ANSWERS, num_beams=1,
+                                      cache_path=str(tmp_path / 'feature' / 'qg'))
+            assert len(questions) == len(CONTEXTS)
+            assert questions[0] is not None and questions[1] is None and questions[2] is None
+
+            answers = qg.generate_a(CONTEXTS, num_beams=1)
+            assert len(answers) == len(CONTEXTS) and answers[1] is None
+            results.append((questions, answers))
+    assert all(r == results[0] for r in results)
+
+
+def test_iter_prediction_encodes_each_input_once(build_qg, monkeypatch):
+    qg = build_qg(None)
+    encoded = []
+    encode_batch = language_model.EncodePlus.encode_batch
+    monkeypatch.setattr(language_model.EncodePlus, 'encode_batch',
+                        lambda self, data: encoded.extend(data) or encode_batch(self, data))
+    expected = qg.generate_prediction(CONTEXTS, highlights=ANSWERS, num_beams=1)
+    assert len(encoded) == len(CONTEXTS)
+
+    encoded.clear()
+    chunks = list(qg.iter_prediction(CONTEXTS, highlights=ANSWERS, num_beams=1, chunk_size=2))
+    assert [i for indices, _ in chunks for i in indices] == list(range(len(CONTEXTS)))
+    assert [o for _, outputs in chunks for o in outputs] == expected
+    assert len(encoded) == len(CONTEXTS)
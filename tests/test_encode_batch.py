@@ -0,0 +1,68 @@
+""" EncodePlus.encode_batch (tokenize 1 lần, cắt ở max_length + 1) phải cho kết quả giống hệt encode_plus. """
+import pytest
+
+pytest.importorskip('transformers')
+
+from plms.exceptions import ExceedMaxLengthError, HighlightNotFoundError
+from plms.language_model import EncodePlus
+
+MAX_LENGTH = 6  # Tính cả </s>
+MAX_LENGTH_OUTPUT = 4
+
+DATA = [
+    ('hà nội là thủ đô', None, None),  # Đúng max_length token
+    ('hà nội là thủ đô của', None, None),  # max_length + 1 token
+    ('sông hồng chảy qua thành phố hà nội', None, None),  # Dài hơn nhiều
+    ('sông hồng', 'hà nội là', None),  # Output đúng max_length_output token
+    ('sông hồng', 'hà nội là thủ đô', None),  # Output quá dài
+    ('hà nội là thủ đô', 'thủ đô', 'thủ đô'),  # Highlight hợp lệ
+    ('hà nội là thủ đô', None, 'thăng long'),  # Không tìm thấy highlight
+    ('thủ đô', None, 'thủ đô'),
+]
+
+MODES = {
+    'drop': {'drop_overflow_error_text': True, 'drop_highlight_error_text': True},
+    'skip': {'skip_overflow_error': True, 'drop_highlight_error_text': True},
+    'raise': {},
+}
+
+
+def as_lists(feature):
+    return None if feature is None else {k: list(v) for k, v in feature.items()}
+
+
+def outcome(fn):
+    """Kết quả hoặc loại lỗi (ExceedMaxLengthError/HighlightNotFoundError) của 1 lần encode."""
+    try:
+        return as_lists(fn())
+    except (ExceedMaxLengthError, HighlightNotFoundError) as error:
+        return type(error)
+
+
+@pytest.mark.parametrize('padding', [False, True], ids=['no-padding', 'padding'])
+@pytest.mark.parametrize('prefix_type', [None, 'qg'])
+@pytest.mark.parametrize('mode', list(MODES))
+def test_encode_batch_matches_encode_plus(tokenizer, mode, prefix_type, padding):
+    encoder = EncodePlus(tokenizer, max_length=MAX_LENGTH, max_length_output=MAX_LENGTH_OUTPUT,
+                         prefix_type=prefix_type, padding=padding, **MODES[mode])
+    expected = [outcome(lambda: encoder.encode_plus(*d)) for d in DATA]
+    assert [outcome(lambda: encoder.encode_batch([d])[0]) for d in DATA] == expected
+    if mode == 'raise':
+        assert ExceedMaxLengthError in expected and HighlightNotFoundError in expected
+    else:
+        # Cả chunk trong 1 lần gọi: cùng độ dài và thứ tự, None ở vị trí mẫu bị drop
+        assert [as_lists(f) for f in encoder.encode_batch(DATA)] == expected
+
+
+def test_encode_batch_overflow_boundary(tokenizer):
+    encoder = EncodePlus(tokenizer, max_length=MAX_LENGTH, max_length_output=MAX_LENGTH_OUTPUT,
+                         drop_overflow_error_text=True, padding=False)
+    output = encoder.encode_batch(DATA[:5])
+    assert len(output[0]['input_ids']) == MAX_LENGTH
+    assert output[1] is None and output[2] is None and output[4] is None
+    assert len(output[3]['labels']) == MAX_LENGTH_OUTPUT
+
+    # skip_overflow_error: mẫu quá dài bị cắt về max_length như encode_plus, không bị drop
+    encoder = EncodePlus(tokenizer, max_length=MAX_LENGTH, max_length_output=MAX_LENGTH_OUTPUT,
+                         skip_overflow_error=True, padding=False)
+    assert [len(f['input_ids']) for f in encoder.encode_batch(DATA[:3])] == [MAX_LENGTH] * 3
@@ -0,0 +1,25 @@
+""" Backend ONNX Runtime phải cho output giống hệt PyTorch (từng token) khi decode greedy. """
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('transformers')
+pytest.importorskip('optimum.onnxruntime')
+
+from plms.onnx_backend import export_onnx_model, load_onnx_model
+from conftest import CONTEXTS
+
+MAX_LENGTH = 12
+
+
+def test_onnx_greedy_matches_torch(tokenizer, tiny_t5, tmp_path):
+    model = tiny_t5(seed=0)
+    path = str(tmp_path / 'onnx')
+    ort_model = export_onnx_model(model, tokenizer, path)
+    # Lần khởi động sau nạp thẳng graph đã export
+    assert load_onnx_model(path) is not None
+
+    encode = tokenizer(CONTEXTS, padding=True, return_tensors='pt')
+    with torch.no_grad():
+        expected = model.generate(**encode, max_length=MAX_LENGTH, num_beams=1, do_sample=False)
+    output = ort_model.generate(**encode, max_length=MAX_LENGTH, num_beams=1, do_sample=False)
+    assert output.tolist() == expected.tolist()
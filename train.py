@@ -17,6 +17,15 @@ Cách chạy:
 
 Ví dụ đơn giản:
     python train.py fine_tuning --model='VietAI/vit5-base'
+
+Model AE dạng span (encoder + đầu start/end, dùng làm --model_ae khi sinh QA):
+    python train.py fine_tuning \
+        --model='VietAI/vit5-base' \
+        --model_type='extractive' \
+        --input_types='paragraph' \
+        --output_types='answer' \
+        --prefix_types=None \
+        --max_length_output=30
 """
 
 import fire # type: ignore
@@ -60,7 +69,9 @@ class FineTuning:
             use_auth_token: bool = False,
             torch_dtype=None,
             device_map: str = None,
-            low_cpu_mem_usage: bool = False
+            low_cpu_mem_usage: bool = False,
+            max_tokens: int = None,
+            model_type: str = 'seq2seq'
     ):
         """Fine-tune ViT5 model cho Question Generation và Answer Extraction.
         
@@ -94,6 +105,8 @@ class FineTuning:
             torch_dtype: Torch dtype cho model
             device_map: Device mapping strategy
             low_cpu_mem_usage: Low CPU mem mode
+            max_tokens: Chia batch theo ngân sách token (thay cho --batch), tự chia nhỏ batch khi OOM
+            model_type: 'seq2seq' hoặc 'extractive' (model AE dạng span, max_length_output = độ dài answer tối đa)
         
         Raises:
             AssertionError: Nếu không cung cấp --model parameter
@@ -132,6 +145,8 @@ class FineTuning:
                 f"torch_dtype = {torch_dtype}\n"
                 f"device_map = {device_map}\n"
                 f"low_cpu_mem_usage = {low_cpu_mem_usage}\n"
+                f"max_tokens = {max_tokens}\n"
+                f"model_type = {model_type}\n"
             )
         
         # Kiểm tra bắt buộc: phải có model name
@@ -162,7 +177,9 @@ class FineTuning:
             use_auth_token = use_auth_token,
             torch_dtype = torch_dtype,
             device_map = device_map,
-            low_cpu_mem_usage = low_cpu_mem_usage
+            low_cpu_mem_usage = low_cpu_mem_usage,
+            max_tokens = max_tokens,
+            model_type = model_type
         )
         
         # Bắt đầu training loop